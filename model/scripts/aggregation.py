@@ -0,0 +1,646 @@
+r"""
+Time series aggregation with representative periods.
+
+The sequences of a datapackage are clustered into a number of
+representative periods, e.g. typical days. The datapackage is then solved
+on the representative periods only, with every timestep weighted by the
+number of hours it represents.
+
+Storage levels are linked between the periods of the full year following
+Kotzur et al. (2018): Time series aggregation for energy system design:
+Modeling seasonal storage. The level at the start of each original period
+is a variable and changes from one period to the next by the net charge
+over its representative period. This keeps the storage state continuous
+through the whole year.
+
+After solving, the results are expanded back to the full year, so that
+they can be postprocessed like the results of a full resolution solve.
+"""
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from pyomo.environ import Block, Constraint, NonNegativeReals, NonPositiveReals, Var, value
+
+from tools.sequences import write_sequences
+
+
+AGGREGATION_FILE = 'aggregation.csv'
+
+# Assumptions that do not change the energy system but only its resolution.
+AGGREGATION_COLUMNS = ['typical_periods', 'period_length']
+
+
+def get_aggregation_settings(scenario_assumptions):
+    r"""
+    Returns the number of typical periods and the period length in hours of
+    a scenario or None if it is to be solved at full resolution.
+    """
+    typical_periods = scenario_assumptions.get('typical_periods')
+
+    if typical_periods is None or pd.isna(typical_periods):
+        return None
+
+    period_length = scenario_assumptions.get('period_length')
+
+    if period_length is None or pd.isna(period_length):
+        period_length = 24
+
+    return int(typical_periods), int(period_length)
+
+
+def set_aggregation(scenario_assumptions, typical_periods, period_length=24, reference_scenarios=()):
+    r"""
+    Sets the aggregation of all scenarios that do not define their own and
+    adds copies of the reference scenarios that are solved at full
+    resolution. Their names get the suffix '-full'.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    typical_periods : int
+        Number of representative periods.
+
+    period_length : int
+        Length of a period in hours.
+
+    reference_scenarios : list
+        Scenarios to solve at full resolution as well.
+
+    Returns
+    -------
+    scenario_assumptions : pd.DataFrame
+        Scenario table with the columns 'typical_periods' and
+        'period_length'.
+    """
+    scenario_assumptions = scenario_assumptions.copy()
+
+    for column, default in zip(AGGREGATION_COLUMNS, [typical_periods, period_length]):
+        if column not in scenario_assumptions:
+            scenario_assumptions[column] = np.nan
+
+        scenario_assumptions[column] = scenario_assumptions[column].fillna(default)
+
+    reference = scenario_assumptions.loc[
+        scenario_assumptions['scenario'].isin(reference_scenarios)
+    ].copy()
+
+    reference['scenario'] += '-full'
+    reference[AGGREGATION_COLUMNS] = np.nan
+
+    return pd.concat([scenario_assumptions, reference], ignore_index=True)
+
+
+def kmeans(features, n_clusters, n_init=10, max_iter=300, seed=0):
+    r"""
+    Clusters the rows of a feature matrix with k-means and k-means++
+    initialisation. The best of `n_init` runs is returned.
+
+    Returns
+    -------
+    labels : np.array
+        Cluster of each row.
+    """
+    rng = np.random.default_rng(seed)
+
+    def squared_distances(centers):
+        return ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+
+    best_inertia = np.inf
+    best_labels = None
+    for _ in range(n_init):
+        centers = features[[rng.integers(len(features))]]
+        for _ in range(1, n_clusters):
+            distance = squared_distances(centers).min(axis=1)
+            if distance.sum() > 0:
+                choice = rng.choice(len(features), p=distance / distance.sum())
+            else:
+                choice = rng.integers(len(features))
+            centers = np.vstack([centers, features[choice]])
+
+        for _ in range(max_iter):
+            labels = squared_distances(centers).argmin(axis=1)
+
+            new_centers = np.array([
+                features[labels == c].mean(axis=0) if (labels == c).any() else centers[c]
+                for c in range(n_clusters)
+            ])
+
+            if np.allclose(new_centers, centers):
+                break
+
+            centers = new_centers
+
+        inertia = squared_distances(centers)[np.arange(len(features)), labels].sum()
+
+        if inertia < best_inertia:
+            best_inertia = inertia
+            best_labels = labels
+
+    return best_labels
+
+
+def cluster_periods(profiles, typical_periods, period_length, peak_columns=()):
+    r"""
+    Clusters the periods of the profiles into representative periods. The
+    representative period of a cluster is its mean, so that the sum of a
+    profile over the year is kept. The periods with the maximum of the
+    columns in `peak_columns` are kept as representative periods of their
+    own. An incomplete last period is assigned to the closest cluster.
+
+    Parameters
+    ----------
+    profiles : pd.DataFrame
+        Profiles with one column per sequence.
+
+    typical_periods : int
+        Number of representative periods including the peak periods.
+
+    period_length : int
+        Number of timesteps of a period.
+
+    peak_columns : list
+        Columns whose peak period is kept.
+
+    Returns
+    -------
+    representatives : np.array
+        Representative periods with shape (n_representatives,
+        period_length, n_columns), ordered by their first occurrence.
+
+    assignment : np.array
+        Representative period of each original period.
+    """
+    values = profiles.values.astype(float)
+
+    n_full = len(values) // period_length
+    rest = len(values) - n_full * period_length
+
+    # Normalise the columns so that they have the same influence on the
+    # clusters.
+    value_range = values.max(axis=0) - values.min(axis=0)
+    value_range[value_range == 0] = 1
+    normalised = (values - values.min(axis=0)) / value_range
+
+    features = normalised[:n_full * period_length].reshape(n_full, -1)
+
+    peaks = sorted({
+        profiles[column].values[:n_full * period_length].argmax() // period_length
+        for column in peak_columns
+    })
+
+    others = [p for p in range(n_full) if p not in peaks]
+
+    labels = np.empty(n_full, dtype=int)
+    labels[peaks] = np.arange(len(peaks))
+    labels[others] = len(peaks) + kmeans(
+        features[others], max(typical_periods - len(peaks), 1)
+    )
+
+    periods = values[:n_full * period_length].reshape(n_full, period_length, -1)
+
+    clusters = np.unique(labels)
+    centers = np.array([periods[labels == c].mean(axis=0) for c in clusters])
+
+    if rest:
+        partial = normalised[n_full * period_length:].ravel()
+        normalised_centers = np.array([features[labels == c].mean(axis=0) for c in clusters])
+        distance = ((normalised_centers[:, :len(partial)] - partial) ** 2).sum(axis=1)
+        labels = np.append(labels, clusters[distance.argmin()])
+
+    # Order the representative periods by their first occurrence.
+    _, first = np.unique(labels, return_index=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+
+    assignment = rank[np.searchsorted(clusters, labels)]
+
+    return centers[order], assignment
+
+
+def get_mapping(timeindex, assignment, period_length):
+    r"""
+    Maps each timestep of the full year to its period, its representative
+    period and the timestep of the reduced timeindex that represents it.
+    """
+    position = np.arange(len(timeindex))
+    period = position // period_length
+    representative = assignment[period]
+
+    mapping = pd.DataFrame(
+        {
+            'period': period,
+            'representative': representative,
+            'timestep': representative * period_length + position % period_length,
+        },
+        index=timeindex,
+    )
+    mapping.index.name = 'timeindex'
+
+    return mapping
+
+
+def aggregate_datapackage(path, typical_periods, period_length=24, peak_columns=()):
+    r"""
+    Replaces the sequences of a datapackage by their representative periods
+    and saves the mapping of the full year to the reduced timeindex.
+
+    Parameters
+    ----------
+    path : str
+        Root directory of the datapackage.
+
+    typical_periods : int
+        Number of representative periods.
+
+    period_length : int
+        Length of a period in timesteps.
+
+    peak_columns : list
+        Columns of the sequences whose peak period is kept.
+
+    Returns
+    -------
+    mapping : pd.DataFrame
+        Mapping of the full year to the reduced timeindex or None if the
+        sequences are too short to be aggregated.
+    """
+    sequences_dir = os.path.join(path, 'data', 'sequences')
+
+    sequences = {
+        file: pd.read_csv(os.path.join(sequences_dir, file), index_col=0, parse_dates=True)
+        for file in sorted(os.listdir(sequences_dir))
+    }
+
+    profiles = pd.concat(sequences.values(), axis=1)
+
+    if len(profiles) // period_length <= typical_periods:
+        logging.info("The sequences are too short to be aggregated. Using full resolution.")
+        return None
+
+    logging.info(
+        f"Aggregating the sequences to {typical_periods} periods of {period_length} timesteps"
+    )
+    representatives, assignment = cluster_periods(
+        profiles, typical_periods, period_length, peak_columns
+    )
+
+    reduced_timeindex = pd.date_range(
+        profiles.index[0],
+        periods=len(representatives) * period_length,
+        freq=profiles.index.freq or pd.infer_freq(profiles.index),
+        name=profiles.index.name,
+    )
+
+    reduced = pd.DataFrame(
+        representatives.reshape(-1, profiles.shape[1]),
+        index=reduced_timeindex,
+        columns=profiles.columns,
+    )
+
+    for file, df in sequences.items():
+        write_sequences(reduced[df.columns], os.path.join(sequences_dir, file))
+
+    mapping = get_mapping(profiles.index, assignment, period_length)
+    mapping.to_csv(os.path.join(path, AGGREGATION_FILE))
+
+    return mapping
+
+
+def read_mapping(path):
+    r"""
+    Reads the mapping of the full year to the reduced timeindex of a
+    datapackage. Returns None if the datapackage is not aggregated.
+    """
+    file_path = os.path.join(path, AGGREGATION_FILE)
+
+    if not os.path.exists(file_path):
+        return None
+
+    return pd.read_csv(file_path, index_col='timeindex', parse_dates=True)
+
+
+def same_mapping(mapping, other):
+    if mapping is None or other is None:
+        return mapping is None and other is None
+
+    return mapping.equals(other)
+
+
+def get_weights(mapping):
+    r"""
+    Returns the number of timesteps of the full year that each timestep of
+    the reduced timeindex represents.
+    """
+    n_timesteps = (mapping['representative'].max() + 1) \
+        * mapping.groupby('period').size().max()
+
+    return np.bincount(mapping['timestep'], minlength=n_timesteps)
+
+
+def expand_sequences(df, mapping):
+    r"""
+    Expands sequences on the reduced timeindex to the full year. Sequences
+    with a different length, e.g. sequences that are not indexed by time,
+    are returned unchanged.
+    """
+    if len(df) != len(get_weights(mapping)):
+        return df
+
+    expanded = df.iloc[mapping['timestep'].values]
+
+    if isinstance(df.index, pd.DatetimeIndex):
+        expanded.index = mapping.index
+    else:
+        expanded = expanded.reset_index(drop=True)
+
+    return expanded
+
+
+def get_storages(m):
+    r"""
+    Returns the storages of a model with their block and an expression of
+    their storage capacity.
+    """
+    storages = []
+
+    if hasattr(m, 'GenericStorageBlock'):
+        block = m.GenericStorageBlock
+        for n in block.STORAGES:
+            storages.append((n, block, n.nominal_storage_capacity))
+
+    if hasattr(m, 'GenericInvestmentStorageBlock'):
+        block = m.GenericInvestmentStorageBlock
+        for n in block.INVESTSTORAGES:
+            storages.append((n, block, n.investment.existing + block.invest[n]))
+
+    return storages
+
+
+def add_storage_linking(m, mapping):
+    r"""
+    Links the storage levels of the representative periods across the
+    periods of the full year.
+
+    Each representative period starts from a level of its own instead of
+    the level at the end of the period before it in the reduced timeindex.
+    The level at the start of every original period is a variable that
+    changes by the net charge of its representative period. The sum of
+    this level and the level relative to the start of the representative
+    period has to stay within the storage capacity.
+
+    The level at the start of an original period decays by the losses over
+    the period. The net charge of its representative period is the change
+    of the level against the start level of the representative period
+    decayed in the same way, so that the losses of the start level are not
+    counted twice.
+
+    Parameters
+    ----------
+    m : oemof.solph.Model
+        Model on the reduced timeindex.
+
+    mapping : pd.DataFrame
+        Mapping of the full year to the reduced timeindex.
+    """
+    period_length = len(get_weights(mapping)) // (mapping['representative'].max() + 1)
+
+    periods = mapping.groupby('period')
+    representative = [int(k) for k in periods['representative'].first()]
+    last_timestep = [int(t) for t in periods['timestep'].last()]
+    period_hours = [int(h) for h in periods.size()]
+
+    n_representatives = max(representative) + 1
+    representatives = list(range(n_representatives))
+    original_periods = list(range(len(representative)))
+
+    storages = get_storages(m)
+
+    linking = Block()
+    m.add_component('StorageLinking', linking)
+
+    nodes = [n for n, _, _ in storages]
+    block = {n: b for n, b, _ in storages}
+    size = {n: s for n, _, s in storages}
+
+    # level at the start of the representative periods
+    linking.start = Var(nodes, representatives[1:], within=NonNegativeReals)
+
+    def start(n, k):
+        if k == 0:
+            return block[n].init_cap[n]
+        return linking.start[n, k]
+
+    for n in nodes:
+        for k in range(1, n_representatives):
+            block[n].balance[n, k * period_length].deactivate()
+
+        if n in block[n].balanced_cstr:
+            block[n].balanced_cstr[n].deactivate()
+
+    def _period_start_balance_rule(linking, n, k):
+        t = k * period_length
+        i = list(n.inputs)[0]
+        o = list(n.outputs)[0]
+
+        expr = 0
+        expr += block[n].capacity[n, t]
+        expr += - start(n, k) * (1 - n.loss_rate[t])
+        expr += (- m.flow[i, n, t] * n.inflow_conversion_factor[t]) * m.timeincrement[t]
+        expr += (m.flow[n, o, t] / n.outflow_conversion_factor[t]) * m.timeincrement[t]
+        return expr == 0
+    linking.period_start_balance = Constraint(
+        nodes, representatives[1:], rule=_period_start_balance_rule
+    )
+
+    # maximum and minimum level relative to the start of the representative
+    # periods
+    linking.relative_max = Var(nodes, representatives, within=NonNegativeReals)
+    linking.relative_min = Var(nodes, representatives, within=NonPositiveReals)
+
+    timesteps = [(k, t) for k in representatives
+                 for t in range(k * period_length, (k + 1) * period_length)]
+
+    def _relative_max_rule(linking, n, k, t):
+        return linking.relative_max[n, k] >= block[n].capacity[n, t] - start(n, k)
+    linking.relative_max_cstr = Constraint(nodes, timesteps, rule=_relative_max_rule)
+
+    def _relative_min_rule(linking, n, k, t):
+        return linking.relative_min[n, k] <= block[n].capacity[n, t] - start(n, k)
+    linking.relative_min_cstr = Constraint(nodes, timesteps, rule=_relative_min_rule)
+
+    # level at the start of the original periods
+    linking.level = Var(nodes, original_periods + [len(representative)], within=NonNegativeReals)
+
+    def _level_balance_rule(linking, n, p):
+        k = representative[p]
+        decay = (1 - n.loss_rate[0]) ** period_hours[p]
+        return linking.level[n, p + 1] == linking.level[n, p] * decay \
+            + block[n].capacity[n, last_timestep[p]] - start(n, k) * decay
+    linking.level_balance = Constraint(nodes, original_periods, rule=_level_balance_rule)
+
+    def _level_cyclic_rule(linking, n):
+        return linking.level[n, len(representative)] == linking.level[n, 0]
+    linking.level_cyclic = Constraint(nodes, rule=_level_cyclic_rule)
+
+    def _level_max_rule(linking, n, p):
+        return linking.level[n, p] + linking.relative_max[n, representative[p]] \
+            <= size[n] * n.max_storage_level[0]
+    linking.level_max = Constraint(nodes, original_periods, rule=_level_max_rule)
+
+    def _level_min_rule(linking, n, p):
+        return linking.level[n, p] + linking.relative_min[n, representative[p]] \
+            >= size[n] * n.min_storage_level[0]
+    linking.level_min = Constraint(nodes, original_periods, rule=_level_min_rule)
+
+
+def get_storage_levels(m, mapping):
+    r"""
+    Returns the storage levels of the full year as the level at the start
+    of each original period plus the level relative to the start of its
+    representative period.
+    """
+    linking = m.StorageLinking
+
+    storage_levels = {}
+    for n, block, _ in get_storages(m):
+        start = [value(block.init_cap[n])] + [
+            value(linking.start[n, k]) for k in range(1, mapping['representative'].max() + 1)
+        ]
+        capacity = np.array([value(block.capacity[n, t]) for t in m.TIMESTEPS])
+        level = np.array([value(linking.level[n, p]) for p in range(mapping['period'].max() + 1)])
+
+        storage_levels[n] = pd.Series(
+            level[mapping['period'].values]
+            + capacity[mapping['timestep'].values]
+            - np.array(start)[mapping['representative'].values],
+            index=mapping.index,
+        )
+
+    return storage_levels
+
+
+def get_results(m, mapping):
+    r"""
+    Returns the results of a model on the reduced timeindex expanded to the
+    full year.
+
+    Parameters
+    ----------
+    m : oemof.solph.Model
+        Solved model with storage linking.
+
+    mapping : pd.DataFrame
+        Mapping of the full year to the reduced timeindex.
+
+    Returns
+    -------
+    results : dict
+        Results in the format of `oemof.outputlib.processing.results`.
+    """
+    # The variables of the storage linking are not indexed by timesteps and
+    # would break the processing of the results.
+    linking = m.StorageLinking
+    m.del_component(linking)
+    try:
+        results = m.results()
+    finally:
+        m.add_component('StorageLinking', linking)
+
+    storage_levels = get_storage_levels(m, mapping)
+
+    expanded = {}
+    for k, v in results.items():
+        sequences = expand_sequences(v['sequences'], mapping)
+        scalars = v['scalars'].copy()
+
+        if k[0] in storage_levels and k[1] is None:
+            sequences['capacity'] = storage_levels[k[0]]
+            scalars['init_cap'] = storage_levels[k[0]].iloc[0]
+
+        expanded[k] = {'scalars': scalars, 'sequences': sequences}
+
+    return expanded
+
+
+def expand_params(params, mapping):
+    r"""
+    Expands the sequences of parameters on the reduced timeindex to the full
+    year.
+    """
+    return {
+        k: {'scalars': v['scalars'], 'sequences': expand_sequences(v['sequences'], mapping)}
+        for k, v in params.items()
+    }
+
+
+def get_aggregation_error(scenario_assumptions, scalars, kpis=('share_el_heat', 'spec_cost_of_heat')):
+    r"""
+    Compares the results of aggregated scenarios with the results of
+    scenarios at full resolution with otherwise the same assumptions.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    scalars : dict
+        Scalar results as saved in scalars.csv keyed by scenario name.
+
+    kpis : list
+        Variables to compare.
+
+    Returns
+    -------
+    aggregation_error : pd.DataFrame
+        Aggregated and full resolution value, absolute and relative error
+        of each kpi for each aggregated scenario with a reference.
+    """
+    if 'typical_periods' not in scenario_assumptions:
+        return pd.DataFrame()
+
+    assumptions = [
+        c for c in scenario_assumptions.columns if c not in ['scenario'] + AGGREGATION_COLUMNS
+    ]
+
+    is_aggregated = scenario_assumptions['typical_periods'].notna()
+    aggregated = scenario_assumptions.loc[is_aggregated]
+    full = scenario_assumptions.loc[~is_aggregated]
+
+    def get_kpis(scenario):
+        df = scalars[scenario]
+        return df.loc[df['var_name'].isin(kpis)].set_index('var_name')['var_value']
+
+    aggregation_error = []
+    for _, row in aggregated.iterrows():
+        is_reference = (full[assumptions] == row[assumptions]).all(axis=1)
+
+        if not is_reference.any() or row['scenario'] not in scalars:
+            continue
+
+        reference = full.loc[is_reference, 'scenario'].iloc[0]
+
+        if reference not in scalars:
+            continue
+
+        kpi_value = get_kpis(row['scenario'])
+        reference_value = get_kpis(reference)
+
+        for kpi in kpis:
+            aggregation_error.append({
+                'scenario': row['scenario'],
+                'reference': reference,
+                'typical_periods': row['typical_periods'],
+                'period_length': row['period_length'],
+                'var_name': kpi,
+                'var_value': kpi_value[kpi],
+                'reference_value': reference_value[kpi],
+                'absolute_error': kpi_value[kpi] - reference_value[kpi],
+                'relative_error': (kpi_value[kpi] - reference_value[kpi]) / reference_value[kpi],
+            })
+
+    return pd.DataFrame(aggregation_error)
@@ -55,11 +55,7 @@ def combine_scalars(scenario_dfs):
     return all_scalars
 
 
-def main(scenario_assumptions):
-    print("Combining scenario results")
-
-    dirs = get_experiment_dirs('all_scenarios')
-
+def get_combined_scalars(scenario_assumptions):
     scenario_paths = get_scenario_paths(scenario_assumptions)
 
     scenario_dfs = get_scenario_dfs(scenario_paths, 'scalars.csv')
@@ -72,6 +68,31 @@ def main(scenario_assumptions):
 
     all_scalars.drop('heat_decentral-shortage', level='name', inplace=True)
 
+    return all_scalars
+
+
+def append_scalars(scenario_assumptions):
+    r"""
+    Appends the scalars of finished scenarios to the combined scalars, so
+    that the results of a sweep are collected while it runs.
+    """
+    if scenario_assumptions.empty:
+        return
+
+    file_path = os.path.join(get_experiment_dirs('all_scenarios')['postprocessed'], 'scalars.csv')
+
+    all_scalars = get_combined_scalars(scenario_assumptions)
+
+    all_scalars.to_csv(file_path, mode='a', header=not os.path.exists(file_path))
+
+
+def main(scenario_assumptions):
+    print("Combining scenario results")
+
+    dirs = get_experiment_dirs('all_scenarios')
+
+    all_scalars = get_combined_scalars(scenario_assumptions)
+
     file_path = os.path.join(dirs['postprocessed'], 'scalars.csv')
 
     all_scalars.to_csv(file_path)
@@ -1,29 +1,981 @@
+import functools
+import logging
+import multiprocessing
+import os
+import shutil
+import traceback
+
+import pandas as pd
+
 import tools.helper
+import tools.manifest
+import tools.plot_helpers
+import tools.raw_cache
+import tools.results
+import tools.sequences
+import tools.timing
+import aggregation
 import preprocessing
+import price_ensemble
 import optimization
 import postprocessing
+import rolling_horizon
+import sparse_lp
+import validation
 import plot_single_scenario
 import join_scenarios
+import sweeps
 import plot_combination
 
 
+# Stages of the pipeline with the key of their output directory and the
+# modules whose code they depend on.
+STAGES = [
+    ('preprocessed', preprocessing.main, [
+        preprocessing, aggregation, price_ensemble, tools.helper, tools.raw_cache,
+        tools.sequences,
+    ]),
+    ('optimised', optimization.main, [
+        optimization, rolling_horizon, sparse_lp, aggregation, preprocessing, validation,
+        tools.sequences, tools.results,
+    ]),
+    ('postprocessed', postprocessing.main, [postprocessing, tools.results]),
+    ('plots', plot_single_scenario.main, [plot_single_scenario, aggregation, tools.plot_helpers]),
+]
+
+# Options in run.yml that change the results of a stage.
+STAGE_OPTIONS = {
+    'preprocessed': ['sequence_format'],
+    'optimised': ['rolling_horizon', 'backend', 'solver'],
+}
+
+# Stages whose outputs scenarios with identical datapackages share.
+SHARED_STAGES = ['optimised', 'postprocessed']
+
+
+@functools.lru_cache(maxsize=None)
+def get_raw_input_hash(years):
+    r"""
+    Hashes the raw data of a tuple of years. The raw data does not change
+    during a run, so its files are read once per process and years.
+    """
+    raw_input_paths = preprocessing.get_raw_input_paths(
+        tools.helper.get_experiment_dirs()['raw'], list(years)
+    )
+
+    # The sequences have one file per year.
+    raw_input_files = []
+    for paths in raw_input_paths.values():
+        raw_input_files.extend(paths if isinstance(paths, list) else [paths])
+
+    return tools.manifest.hash_files(raw_input_files)
+
+
+@functools.lru_cache(maxsize=None)
+def get_stage_inputs():
+    r"""
+    Returns the hash of the source code and the options of run.yml of
+    every stage keyed by the key of its output directory. These are the
+    same for all scenarios of a run and read once per process.
+    """
+    config = tools.helper.get_config_file('run.yml')
+
+    # The solver and its options may come from the solver profile.
+    config['solver'] = tools.helper.get_solver_profile()
+
+    return {
+        dir_key: (
+            tools.manifest.hash_sources(modules),
+            {option: config[option] for option in STAGE_OPTIONS.get(dir_key, [])},
+        )
+        for dir_key, _, modules in STAGES
+    }
+
+
+def get_input_hashes(scenario_assumptions):
+    r"""
+    Hashes the inputs of every stage of a scenario. The hash of a stage
+    includes the hash of the stage before, so that a change propagates
+    to all later stages, and the options of run.yml that affect it.
+
+    Only the row of the scenario is hashed per call. The raw data, the
+    source code and the options are hashed once per run.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.Series
+        Row of the scenario table.
+
+    Returns
+    -------
+    input_hashes : dict
+        Input hash for each stage keyed by the key of its output directory.
+    """
+    upstream_hash = tools.manifest.hash_object([
+        scenario_assumptions.to_dict(),
+        get_raw_input_hash(tuple(preprocessing.get_years(scenario_assumptions))),
+    ])
+
+    input_hashes = {}
+    for dir_key, (source_hash, options) in get_stage_inputs().items():
+        upstream_hash = tools.manifest.hash_object([upstream_hash, source_hash, options])
+
+        input_hashes[dir_key] = upstream_hash
+
+    return input_hashes
+
+
+def run_stage(stage, scenario_assumptions, dir_key, incremental=True):
+    r"""
+    Runs one stage of a scenario and writes a manifest with the hash of
+    its inputs to its output directory. In incremental mode, the stage is
+    skipped if its inputs hash to the value in the manifest.
+
+    Parameters
+    ----------
+    stage : callable
+        Stage function taking the scenario assumptions as keyword arguments.
+
+    scenario_assumptions : pd.Series
+        Row of the scenario table.
+
+    dir_key : str
+        Key of the output directory of the stage.
+
+    incremental : bool
+        Skip the stage if its inputs have not changed.
+    """
+    stage_dir = tools.helper.get_experiment_dirs(scenario_assumptions['scenario'])[dir_key]
+
+    input_hash = get_input_hashes(scenario_assumptions)[dir_key]
+
+    if incremental and tools.manifest.is_up_to_date(stage_dir, input_hash):
+        logging.info(f"Skipping stage '{dir_key}'. Its inputs have not changed.")
+        return
+
+    # Remove the manifest first so that a stage that fails
+    # halfway is not regarded as up to date in the next run.
+    tools.manifest.remove_manifest(stage_dir)
+
+    with tools.timing.span(dir_key):
+        stage(**scenario_assumptions)
+
+    tools.manifest.write_manifest(stage_dir, input_hash)
+
+
+def run_batch_preprocessing(scenario_assumptions, incremental=True):
+    r"""
+    Preprocesses all scenarios in one pass with
+    `preprocessing.preprocess_batch` and writes the manifests of their
+    preprocessing stage, so that `run_scenario` skips it.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    incremental : bool
+        Skip scenarios whose inputs have not changed.
+
+    Returns
+    -------
+    failed : dict
+        Tracebacks of the failed scenarios keyed by scenario name.
+    """
+    pending = {}
+    for _, row in scenario_assumptions.iterrows():
+        stage_dir = tools.helper.get_experiment_dirs(row['scenario'])['preprocessed']
+
+        input_hash = get_input_hashes(row)['preprocessed']
+
+        if incremental and tools.manifest.is_up_to_date(stage_dir, input_hash):
+            continue
+
+        tools.manifest.remove_manifest(stage_dir)
+
+        pending[row['scenario']] = stage_dir, input_hash
+
+    if not pending:
+        return {}
+
+    print(f"Preprocessing {len(pending)} scenarios in one batch")
+
+    failed = preprocessing.preprocess_batch(
+        scenario_assumptions.loc[scenario_assumptions['scenario'].isin(pending)],
+        tools.helper.get_experiment_dirs()['raw'],
+        {scenario: stage_dir for scenario, (stage_dir, _) in pending.items()},
+    )
+
+    for scenario, (stage_dir, input_hash) in pending.items():
+        if scenario not in failed:
+            tools.manifest.write_manifest(stage_dir, input_hash)
+
+    return failed
+
+
+def get_logfile(scenario):
+    return os.path.join(tools.helper.get_experiment_dirs(scenario)['logs'], scenario + '.log')
+
+
+def get_spans_file(scenario):
+    return os.path.join(tools.helper.get_experiment_dirs(scenario)['logs'], tools.timing.SPANS_NAME)
+
+
+def run_scenario(scenario_assumptions, stages=None, incremental=True, log_mode='w'):
+    r"""
+    Runs preprocessing, optimization, postprocessing and plotting for one
+    scenario. Everything that is logged or printed goes to the log file
+    of the scenario and the timing spans of the stages to its spans file.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.Series
+        Row of the scenario table.
+
+    stages : list
+        Keys of the output directories of the stages to run. If None,
+        all stages are run.
+
+    incremental : bool
+        Skip stages whose inputs have not changed.
+
+    log_mode : str
+        'w' to start a new log file, 'a' to append to it.
+
+    Returns
+    -------
+    scenario, error : tuple
+        Name of the scenario and the traceback of the exception that
+        stopped it or None if all stages ran through.
+    """
+    scenario = scenario_assumptions['scenario']
+
+    with tools.helper.scenario_logging(get_logfile(scenario), mode=log_mode), \
+            tools.timing.recording(get_spans_file(scenario), mode=log_mode):
+        try:
+            for dir_key, stage, _ in STAGES:
+                if stages is None or dir_key in stages:
+                    run_stage(stage, scenario_assumptions, dir_key, incremental=incremental)
+
+        except Exception:
+            logging.exception(f"Scenario '{scenario}' failed")
+
+            return scenario, traceback.format_exc()
+
+    return scenario, None
+
+
+def order_along_path(scenario_assumptions, axes):
+    r"""
+    Orders the scenarios along a serpentine path through the values of the
+    given columns, so that consecutive scenarios are neighbours in the
+    parameter space. The first axis changes slowest. Each further axis is
+    traversed back and forth in alternating directions. Scenarios without
+    a value on an axis are kept and put after its values.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    axes : list
+        Columns of the scenario table that span the parameter space.
+
+    Returns
+    -------
+    ordered : pd.DataFrame
+        Scenario table in the order of the path.
+    """
+    def get_order(table, axes):
+        if not axes:
+            return list(table.index)
+
+        order = []
+        for n, (_, group) in enumerate(table.groupby(axes[0], sort=True, dropna=False)):
+            group_order = get_order(group, axes[1:])
+
+            if n % 2:
+                group_order.reverse()
+
+            order.extend(group_order)
+
+        return order
+
+    return scenario_assumptions.loc[get_order(scenario_assumptions, list(axes))]
+
+
+def run_persistent_optimization(
+    scenarios, incremental=True, warm_start=False, solver='cbc', backend='oemof',
+    solver_options=None,
+):
+    r"""
+    Optimises scenarios one after another on one persistent model that
+    is only updated between the scenarios.
+
+    With the sparse backend, the linear program is built anew for every
+    scenario, which is cheap. Instead, the solution of the scenario before
+    is kept and taken over if its basis is still optimal for the costs of
+    the next scenario. Otherwise, with warm starts, HiGHS starts from that
+    basis.
+
+    Parameters
+    ----------
+    scenarios : list
+        Rows of the scenario table.
+
+    incremental : bool
+        Skip scenarios whose inputs have not changed.
+
+    warm_start : bool
+        Start each solve from the basis of the scenario before. Only the
+        sparse backend with the solver 'highs' keeps the basis.
+
+    solver : str
+        Solver to use.
+
+    backend : str
+        'oemof' or 'sparse'.
+
+    solver_options : dict
+        Options passed to the solver.
+
+    Returns
+    -------
+    results : list
+        Tuples of scenario name and traceback or None for each scenario.
+    """
+    m = None
+
+    def optimize(**scenario_assumptions):
+        nonlocal m
+
+        dirs = tools.helper.get_experiment_dirs(scenario_assumptions['scenario'])
+
+        with tools.timing.span('validation'):
+            validation.validate_datapackage(dirs['preprocessed'], scenario_assumptions)
+
+        if backend == 'sparse':
+            m = sparse_lp.optimize_parametric(
+                m, dirs['preprocessed'], dirs['optimised'], solver=solver,
+                debug=scenario_assumptions['debug'], warm_start=warm_start,
+                solver_options=solver_options,
+            )
+
+        else:
+            m = optimization.optimize_persistent(
+                m, dirs['preprocessed'], dirs['optimised'], solver=solver,
+                debug=scenario_assumptions['debug'], solver_options=solver_options,
+            )
+
+    results = []
+    for scenario_assumptions in scenarios:
+        scenario = scenario_assumptions['scenario']
+
+        with tools.helper.scenario_logging(get_logfile(scenario), mode='a'), \
+                tools.timing.recording(get_spans_file(scenario), mode='a'):
+            try:
+                run_stage(optimize, scenario_assumptions, 'optimised', incremental=incremental)
+
+                results.append((scenario, None))
+
+            except Exception:
+                logging.exception(f"Scenario '{scenario}' failed")
+
+                results.append((scenario, traceback.format_exc()))
+
+                # Do not reuse a model that may be left in a broken state.
+                m = None
+
+    return results
+
+
+def get_datapackage_hash(path):
+    r"""
+    Hashes the model inputs of a preprocessed datapackage, i.e. its
+    elements, its sequences and the mapping of an aggregation. The metadata
+    and the binary sequences are derived from them and left out.
+    """
+    paths = [os.path.join(path, 'data', 'elements'), os.path.join(path, 'data', 'sequences')]
+
+    mapping_path = os.path.join(path, aggregation.AGGREGATION_FILE)
+    if os.path.exists(mapping_path):
+        paths.append(mapping_path)
+
+    return tools.manifest.hash_files(paths)
+
+
+def get_duplicates(scenarios, originals=None):
+    r"""
+    Finds the scenarios whose preprocessed datapackages are identical to
+    that of a scenario before them.
+
+    Parameters
+    ----------
+    scenarios : list
+        Preprocessed rows of the scenario table.
+
+    originals : dict
+        Scenario that is solved keyed by the hash of its datapackage. It is
+        updated with the new originals, so that the scenarios of later
+        tables, e.g. the chunks of a sweep, are compared with them as well.
+
+    Returns
+    -------
+    duplicates : dict
+        Scenario with the same inputs that is solved instead, keyed by
+        duplicate scenario.
+    """
+    if originals is None:
+        originals = {}
+
+    duplicates = {}
+    for scenario_assumptions in scenarios:
+        scenario = scenario_assumptions['scenario']
+
+        datapackage_hash = get_datapackage_hash(
+            tools.helper.get_experiment_dirs(scenario)['preprocessed']
+        )
+
+        if datapackage_hash in originals:
+            duplicates[scenario] = originals[datapackage_hash]
+
+        else:
+            originals[datapackage_hash] = scenario
+
+    return duplicates
+
+
+def copy_results(scenario_assumptions, original, incremental=True):
+    r"""
+    Copies the optimised and postprocessed outputs of a scenario with the
+    same inputs and writes their manifests, so that the stages of the
+    scenario are up to date. The outputs are copied rather than linked,
+    so that a later run of either scenario cannot write through to the
+    other.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.Series
+        Row of the scenario table of the duplicate scenario.
+
+    original : str
+        Name of the scenario that was solved.
+
+    incremental : bool
+        Skip stages that are already up to date.
+    """
+    scenario = scenario_assumptions['scenario']
+
+    input_hashes = get_input_hashes(scenario_assumptions)
+
+    with tools.helper.scenario_logging(get_logfile(scenario), mode='a'):
+        for dir_key in SHARED_STAGES:
+            destination = tools.helper.get_experiment_dirs(scenario)[dir_key]
+
+            if incremental and tools.manifest.is_up_to_date(destination, input_hashes[dir_key]):
+                logging.info(f"Skipping stage '{dir_key}'. Its inputs have not changed.")
+                continue
+
+            logging.info(f"Taking over stage '{dir_key}' from scenario '{original}'")
+
+            shutil.rmtree(destination)
+            shutil.copytree(
+                tools.helper.get_experiment_dirs(original)[dir_key],
+                destination,
+                ignore=shutil.ignore_patterns(tools.manifest.MANIFEST_NAME),
+            )
+
+            tools.manifest.write_manifest(destination, input_hashes[dir_key])
+
+
+def run_in_pool(worker, tasks, n_processes=None):
+    r"""
+    Runs the worker on all tasks in a pool of processes and collects the
+    tracebacks of failed scenarios.
+    """
+    failed = {}
+
+    # Each task gets a fresh process so that logging handlers and
+    # memory of the solved models do not leak into the next task.
+    with multiprocessing.Pool(n_processes, maxtasksperchild=1) as pool:
+        for results in pool.imap_unordered(worker, tasks):
+            if isinstance(results, tuple):
+                results = [results]
+
+            for scenario, error in results:
+                if error is None:
+                    print(f"Finished scenario '{scenario}'")
+                else:
+                    print(f"Scenario '{scenario}' failed")
+                    failed[scenario] = error
+
+    return failed
+
+
+def run_scenarios(
+    scenario_assumptions, n_processes=None, incremental=True, persistent_model=False,
+    warm_start=False, path_axes=None, solver='cbc', backend='oemof', solver_options=None,
+    deduplicate=False, originals=None,
+):
+    r"""
+    Runs all scenarios in a pool of worker processes. A failing scenario
+    does not stop the others.
+
+    With a persistent model, the scenarios are first all preprocessed.
+    Then each worker optimises its share of the scenarios on one model
+    that is built once and only updated between scenarios. Finally, all
+    scenarios are postprocessed and plotted.
+
+    With warm starts, a persistent model is used as well. The scenarios
+    are ordered along a path through the parameter space and each worker
+    gets a contiguous section of the path, so that every solve starts from
+    the basis of a neighbouring scenario. This needs the sparse backend
+    with the solver 'highs'.
+
+    With deduplication, the scenarios are first all preprocessed as well.
+    Of the scenarios with identical datapackages, only the first is
+    optimised and postprocessed. The others take over its outputs and are
+    only plotted. Passing the same `originals` to several calls extends
+    this to the scenarios solved by the earlier calls.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    n_processes : int
+        Number of worker processes. If None, all available cores are used.
+
+    incremental : bool
+        Skip stages whose inputs have not changed.
+
+    persistent_model : bool
+        Reuse the optimization model across scenarios.
+
+    warm_start : bool
+        Warm-start each solve from the basis of the previous scenario.
+
+    path_axes : list
+        Columns of the scenario table that span the parameter space along
+        which the scenarios are ordered for warm starts.
+
+    solver : str
+        Solver of the persistent model.
+
+    backend : str
+        Backend of the persistent model, 'oemof' or 'sparse'.
+
+    solver_options : dict
+        Options passed to the solver of the persistent model.
+
+    deduplicate : bool
+        Solve scenarios with identical datapackages only once.
+
+    originals : dict
+        Solved scenarios keyed by the hash of their datapackage, see
+        `get_duplicates`. Scenarios that fail are removed from it.
+
+    Returns
+    -------
+    failed : dict
+        Tracebacks of the failed scenarios keyed by scenario name.
+    """
+    if warm_start:
+        if backend != 'sparse' or solver != 'highs':
+            logging.warning(
+                "Only the sparse backend with the solver 'highs' keeps the basis to warm-start"
+                " from. The scenarios are only ordered along the path."
+            )
+
+        scenario_assumptions = order_along_path(scenario_assumptions, path_axes)
+
+    scenarios = [row for _, row in scenario_assumptions.iterrows()]
+
+    if not (persistent_model or warm_start or deduplicate):
+        return run_in_pool(
+            functools.partial(run_scenario, incremental=incremental),
+            scenarios,
+            n_processes,
+        )
+
+    failed = run_in_pool(
+        functools.partial(run_scenario, stages=['preprocessed'], incremental=incremental),
+        scenarios,
+        n_processes,
+    )
+
+    scenarios = [s for s in scenarios if s['scenario'] not in failed]
+
+    if originals is None:
+        originals = {}
+
+    duplicates = get_duplicates(scenarios, originals) if deduplicate else {}
+
+    for scenario, original in duplicates.items():
+        print(f"Scenario '{scenario}' has the same inputs as '{original}'")
+
+    solved = [s for s in scenarios if s['scenario'] not in duplicates]
+
+    if persistent_model or warm_start:
+        n_chunks = n_processes or os.cpu_count()
+        if warm_start:
+            # contiguous sections of the path
+            size = -(-len(solved) // n_chunks)
+            chunks = [solved[i:i + size] for i in range(0, len(solved), size)]
+        else:
+            chunks = [solved[i::n_chunks] for i in range(n_chunks) if solved[i::n_chunks]]
+
+        failed.update(run_in_pool(
+            functools.partial(
+                run_persistent_optimization, incremental=incremental, warm_start=warm_start,
+                solver=solver, backend=backend, solver_options=solver_options,
+            ),
+            chunks,
+            n_processes,
+        ))
+
+        stages = ['postprocessed']
+
+    else:
+        stages = SHARED_STAGES
+
+    solved = [s for s in solved if s['scenario'] not in failed]
+
+    failed.update(run_in_pool(
+        functools.partial(run_scenario, stages=stages, incremental=incremental, log_mode='a'),
+        solved,
+        n_processes,
+    ))
+
+    for row in scenarios:
+        scenario = row['scenario']
+        original = duplicates.get(scenario)
+
+        if original is None:
+            continue
+
+        if original in failed:
+            failed[scenario] = f"Scenario '{original}' with the same inputs failed."
+            continue
+
+        try:
+            copy_results(row, original, incremental=incremental)
+
+        except Exception:
+            failed[scenario] = traceback.format_exc()
+
+    scenarios = [s for s in scenarios if s['scenario'] not in failed]
+
+    failed.update(run_in_pool(
+        functools.partial(run_scenario, stages=['plots'], incremental=incremental, log_mode='a'),
+        scenarios,
+        n_processes,
+    ))
+
+    # Later calls must not take over the outputs of a failed scenario.
+    for datapackage_hash, original in list(originals.items()):
+        if original in failed:
+            del originals[datapackage_hash]
+
+    return failed
+
+
+def collect_solver_statistics(scenario_assumptions):
+    r"""
+    Collects the solver statistics of all scenarios into one table in the
+    order of the scenario table and saves it.
+
+    Returns
+    -------
+    solver_statistics : pd.DataFrame
+    """
+    solver_statistics = {}
+    for scenario in scenario_assumptions['scenario']:
+        path = os.path.join(
+            tools.helper.get_experiment_dirs(scenario)['optimised'], 'solver_statistics.csv'
+        )
+
+        if os.path.exists(path):
+            solver_statistics[scenario] = pd.read_csv(path, index_col=0, header=None)[1]
+
+    solver_statistics = pd.DataFrame(solver_statistics).T
+    solver_statistics.index.name = 'scenario'
+
+    dirs = tools.helper.get_experiment_dirs('all_scenarios')
+    solver_statistics.to_csv(os.path.join(dirs['tables'], 'solver_statistics.csv'))
+
+    return solver_statistics
+
+
+def collect_timings(scenario_assumptions):
+    r"""
+    Summarizes the timing spans of all scenarios per span and saves the
+    summary.
+
+    Returns
+    -------
+    summary : pd.DataFrame
+        Median, 95th percentile and slowest scenarios of every span.
+    """
+    spans = tools.timing.read_spans({
+        scenario: get_spans_file(scenario) for scenario in scenario_assumptions['scenario']
+    })
+
+    if spans.empty:
+        return pd.DataFrame()
+
+    summary = tools.timing.summarize_spans(spans)
+
+    dirs = tools.helper.get_experiment_dirs('all_scenarios')
+    summary.to_csv(os.path.join(dirs['tables'], 'timing_report.csv'))
+
+    return summary
+
+
+def collect_aggregation_error(scenario_assumptions):
+    r"""
+    Compares the results of aggregated scenarios with their references at
+    full resolution and saves the errors.
+
+    Returns
+    -------
+    aggregation_error : pd.DataFrame
+    """
+    scalars = {}
+    for scenario in scenario_assumptions['scenario']:
+        path = os.path.join(
+            tools.helper.get_experiment_dirs(scenario)['postprocessed'], 'scalars.csv'
+        )
+
+        if os.path.exists(path):
+            scalars[scenario] = pd.read_csv(path)
+
+    aggregation_error = aggregation.get_aggregation_error(scenario_assumptions, scalars)
+
+    dirs = tools.helper.get_experiment_dirs('all_scenarios')
+    aggregation_error.to_csv(os.path.join(dirs['tables'], 'aggregation_error.csv'), index=False)
+
+    return aggregation_error
+
+
+def collect_price_ensemble(scenario_assumptions):
+    r"""
+    Describes the distribution of the results over the synthetic price
+    years of the scenarios with a price ensemble and saves it.
+
+    Returns
+    -------
+    price_ensemble_statistics : pd.DataFrame
+    """
+    scalars = {}
+    for scenario in scenario_assumptions['scenario']:
+        path = os.path.join(
+            tools.helper.get_experiment_dirs(scenario)['postprocessed'], 'scalars.csv'
+        )
+
+        if os.path.exists(path):
+            scalars[scenario] = pd.read_csv(path)
+
+    statistics = price_ensemble.get_ensemble_statistics(scenario_assumptions, scalars)
+
+    dirs = tools.helper.get_experiment_dirs('all_scenarios')
+    statistics.to_csv(os.path.join(dirs['tables'], 'price_ensemble.csv'), index=False)
+
+    return statistics
+
+
+def apply_run_settings(scenario_assumptions, config):
+    r"""
+    Sets the resolution, timeindex, aggregation and price ensemble of run.yml
+    for all scenarios that do not define their own.
+    """
+    if config['resolution']:
+        scenario_assumptions = preprocessing.set_resolution(
+            scenario_assumptions, config['resolution']
+        )
+
+    scenario_assumptions = preprocessing.set_timeindex(
+        scenario_assumptions, config.get('years'), config.get('start'), config.get('periods')
+    )
+
+    if config['typical_periods']:
+        scenario_assumptions = aggregation.set_aggregation(
+            scenario_assumptions,
+            config['typical_periods'],
+            config['period_length'],
+            config['aggregation_reference_scenarios'],
+        )
+
+    ensemble = config.get('price_ensemble') or {}
+
+    if ensemble.get('members') or 'price_members' in scenario_assumptions:
+        scenario_assumptions = price_ensemble.set_price_ensemble(
+            scenario_assumptions,
+            ensemble.get('members') or 0,
+            ensemble.get('resampling', 'block_bootstrap'),
+            ensemble.get('block_length', 168),
+            ensemble.get('seed', 0),
+        )
+
+    return scenario_assumptions
+
+
+def run_all(scenario_assumptions, config, originals=None):
+    r"""
+    Runs a scenario table with the options of run.yml. With deduplication,
+    the scenarios are compared with the `originals` solved before, see
+    `run_scenarios`.
+
+    Returns
+    -------
+    failed : dict
+        Tracebacks of the failed scenarios keyed by scenario name.
+    """
+    solver_profile = tools.helper.get_solver_profile()
+
+    # The synthetic price years of an ensemble are drawn in one pass over
+    # the raw price, which only the batch preprocessing does.
+    failed = {}
+    if config.get('batch_preprocessing') or price_ensemble.is_member(scenario_assumptions).any():
+        failed = run_batch_preprocessing(scenario_assumptions, incremental=config['incremental'])
+
+    failed.update(run_scenarios(
+        scenario_assumptions.loc[~scenario_assumptions['scenario'].isin(failed)],
+        n_processes=config['n_processes'],
+        incremental=config['incremental'],
+        persistent_model=config['persistent_model'],
+        warm_start=config['warm_start'],
+        path_axes=config['warm_start_path_axes'],
+        solver=solver_profile['solver'],
+        backend=config['backend'],
+        solver_options=solver_profile['options'],
+        deduplicate=config.get('deduplicate_scenarios'),
+        originals=originals,
+    ))
+
+    return failed
+
+
+def run_sweep(name, sweep, scenario_assumptions, config, originals=None):
+    r"""
+    Expands a sweep of config/sweeps.yml chunk by chunk and runs each chunk
+    like a scenario table. The scalars of every chunk are appended to the
+    combined scalars as soon as it is finished. With deduplication, the
+    scenarios of every chunk are compared with all scenarios solved before.
+
+    Parameters
+    ----------
+    name : str
+        Name of the sweep.
+
+    sweep : dict
+        Declaration of the sweep.
+
+    scenario_assumptions : pd.DataFrame
+        Scenario table with the base scenario of the sweep.
+
+    config : dict
+        Options of run.yml.
+
+    originals : dict
+        Solved scenarios keyed by the hash of their datapackage, see
+        `get_duplicates`.
+
+    Returns
+    -------
+    sweep_scenarios : pd.DataFrame
+        Scenario table of the sweep with the options of run.yml.
+
+    failed : dict
+        Tracebacks of the failed scenarios keyed by scenario name.
+    """
+    if originals is None:
+        originals = {}
+
+    sweep_scenarios = []
+    failed = {}
+    n_scenarios = 0
+
+    rows = sweeps.expand_sweep(name, sweep, scenario_assumptions)
+
+    for chunk in sweeps.iter_chunks(rows, config['sweep_chunk_size']):
+        n_scenarios += len(chunk)
+
+        chunk = apply_run_settings(pd.DataFrame(chunk), config)
+
+        chunk_failed = run_all(chunk, config, originals)
+
+        join_scenarios.append_scalars(chunk.loc[~chunk['scenario'].isin(chunk_failed)])
+
+        sweep_scenarios.append(chunk)
+        failed.update(chunk_failed)
+
+        print(f"Finished {n_scenarios} scenarios of sweep '{name}'")
+
+    if not sweep_scenarios:
+        return pd.DataFrame(), failed
+
+    return pd.concat(sweep_scenarios, ignore_index=True), failed
+
+
 if __name__ == '__main__':
-    scenario_assumptions = tools.helper.get_scenario_assumptions()
+    raw_scenario_assumptions = tools.helper.get_scenario_assumptions()
+
+    config = tools.helper.get_config_file('run.yml')
+
+    scenario_assumptions = apply_run_settings(raw_scenario_assumptions, config)
+
+    # The sweeps take over the outputs of the scenarios solved before.
+    originals = {}
+
+    failed = run_all(scenario_assumptions, config, originals)
+
+    finished = scenario_assumptions.loc[~scenario_assumptions['scenario'].isin(failed)]
+
+    join_scenarios.main(finished)
+
+    all_scenarios = [scenario_assumptions]
+    for name, sweep in (tools.helper.get_config_file('sweeps.yml') or {}).items():
+        sweep_scenarios, sweep_failed = run_sweep(
+            name, sweep, raw_scenario_assumptions, config, originals
+        )
+
+        all_scenarios.append(sweep_scenarios)
+        failed.update(sweep_failed)
+
+    scenario_assumptions = pd.concat(all_scenarios, ignore_index=True)
+
+    finished = scenario_assumptions.loc[~scenario_assumptions['scenario'].isin(failed)]
+
+    solver_statistics = collect_solver_statistics(finished)
 
-    selected_id = scenario_assumptions.index
+    if not solver_statistics.empty:
+        print(
+            solver_statistics[['iterations', 'solver_time', 'wall_time']]
+            .astype(float).groupby(solver_statistics['warm_start']).describe()
+        )
 
-    for i in selected_id:
-        print(f"Running scenario {i} with the name '{scenario_assumptions.loc[i]['scenario']}'")
+    timings = collect_timings(scenario_assumptions)
 
-        preprocessing.main(**scenario_assumptions.loc[i])
+    if not timings.empty:
+        print(timings)
 
-        optimization.main(**scenario_assumptions.loc[i])
+    if 'typical_periods' in finished:
+        aggregation_error = collect_aggregation_error(finished)
 
-        postprocessing.main(**scenario_assumptions.loc[i])
+        if not aggregation_error.empty:
+            print(
+                aggregation_error.groupby('var_name')[['absolute_error', 'relative_error']]
+                .describe()
+            )
 
-        plot_single_scenario.main(**scenario_assumptions.loc[i])
+    if price_ensemble.is_member(finished).any():
+        price_ensemble_statistics = collect_price_ensemble(finished)
 
+        if not price_ensemble_statistics.empty:
+            print(price_ensemble_statistics)
 
-join_scenarios.main(**scenario_assumptions)
+    plot_combination.main()
 
-plot_combination.main()
+    for scenario, error in failed.items():
+        print(f"\nScenario '{scenario}' failed:\n{error}")
@@ -1,54 +1,407 @@
 import logging
 import os
+import time
 import yaml
 
-from oemof.solph import EnergySystem, Model
+import pandas as pd
+from pyomo.environ import Block
+
+from oemof.solph import Model
+from oemof.solph.components import GenericStorage, ExtractionTurbineCHP
+from oemof.solph.network import Transformer
 from oemof import outputlib
 
 # DONT REMOVE THIS LINE!
 from oemof.tabular import datapackage  # noqa
 from oemof.tabular.facades import TYPEMAP
 
-from tools.helper import get_experiment_dirs, get_scenario_assumptions
+import aggregation
+import rolling_horizon
+import sparse_lp
+import validation
+from tools.results import collect_results, dump_results
+from tools.sequences import from_datapackage
+from tools.timing import span
+from tools.helper import get_experiment_dirs, get_scenario_assumptions, get_config_file, \
+    get_solver_profile, get_timestep_hours
+
+
+# Parameters of flows and components that enter the constraints of the
+# model and have to be the same in every scenario that is solved on a
+# persistent model. The variable costs, investment costs and conversion
+# factors of transformers are updated instead. Other attributes, e.g. the
+# costs and efficiencies of the facades, only enter the model through
+# these.
+FIXED_FLOW_PARAMETERS = (
+    'nominal_value', 'fixed', 'max', 'min', 'actual_value', 'summed_max', 'summed_min',
+    'investment_existing', 'investment_maximum', 'investment_minimum',
+)
+
+FIXED_COMPONENT_PARAMETERS = (
+    'balanced', 'nominal_storage_capacity', 'initial_storage_level', 'loss_rate',
+    'inflow_conversion_factor', 'outflow_conversion_factor', 'max_storage_level',
+    'min_storage_level', 'invest_relation', 'investment_existing', 'investment_maximum',
+    'investment_minimum', 'conversion_factor_full_condensation',
+)
 
 
-def optimize(input_data_dir, results_data_dir, solver='cbc', debug=False):
+def optimize(input_data_dir, results_data_dir=None, solver='cbc', debug=False,
+             solver_options=None):
     r"""
     Takes the specified datapackage, creates an energysystem and solves the
     optimization problem.
+
+    Parameters
+    ----------
+    input_data_dir : str
+        Directory of the preprocessed datapackage.
+
+    results_data_dir : str
+        Directory to save the results to. If None, nothing is written.
+
+    solver_options : dict
+        Command line options passed to the solver.
+
+    Returns
+    -------
+    es : oemof.solph.EnergySystem
+        EnergySystem with results and parameters.
+    """
+    m = build_model(input_data_dir)
+
+    return solve(
+        m, results_data_dir, solver=solver, debug=debug, solver_options=solver_options
+    )
+
+
+def build_model(input_data_dir):
+    r"""
+    Creates the EnergySystem from the datapackage and builds the
+    optimization model.
+
+    If the datapackage is aggregated to representative periods, the
+    timesteps are weighted by the number of hours they represent and the
+    storage levels are linked across the periods of the full year. The
+    mapping to the full year is kept as attribute `aggregation` of the
+    EnergySystem.
+
+    The parameters that :func:`update_model` cannot update are kept as
+    attribute `fixed_parameters` of the model. They are taken before the
+    model is built, because building it adds derived attributes to some
+    nodes.
+
+    Parameters
+    ----------
+    input_data_dir : str
+        Directory of the preprocessed datapackage.
+
+    Returns
+    -------
+    m : oemof.solph.Model
+        Model with the EnergySystem as attribute `es`.
     """
-    # create energy system object
     logging.info("Creating EnergySystem from datapackage")
-    es = EnergySystem.from_datapackage(
+    with span('from_datapackage'):
+        es = from_datapackage(
+            os.path.join(input_data_dir, "datapackage.json"),
+            attributemap={}, typemap=TYPEMAP,
+        )
+
+    es.aggregation = aggregation.read_mapping(input_data_dir)
+
+    fixed_parameters = get_fixed_parameters(es)
+
+    logging.info("Creating the optimization model")
+    with span('build_model'):
+        if es.aggregation is None:
+            m = Model(es)
+
+        else:
+            # Without aggregation, the objective is weighted by the timeincrement.
+            hours = get_timestep_hours(es.timeindex)
+            m = Model(
+                es, objective_weighting=list(aggregation.get_weights(es.aggregation) * hours)
+            )
+
+            aggregation.add_storage_linking(m, es.aggregation)
+
+    m.fixed_parameters = fixed_parameters
+
+    return m
+
+
+def get_fixed_parameters(es):
+    r"""
+    Returns the parameters of an EnergySystem that cannot be updated in a
+    persistent model, keyed by the labels of nodes and flows.
+    """
+    params = outputlib.processing.parameter_as_dict(es)
+
+    fixed_parameters = {}
+    for (node, other), v in params.items():
+        if other is not None:
+            names = FIXED_FLOW_PARAMETERS
+
+        # The conversion factors of extraction turbines are not updated.
+        elif isinstance(node, ExtractionTurbineCHP):
+            names = FIXED_COMPONENT_PARAMETERS + ('conversion_factors',)
+
+        else:
+            names = FIXED_COMPONENT_PARAMETERS
+
+        scalars = v['scalars']
+        sequences = v['sequences']
+        fixed_parameters[str(node), str(other)] = {
+            'scalars': scalars.loc[[name.startswith(names) for name in scalars.index]],
+            'sequences': sequences.loc[:, [name.startswith(names) for name in sequences.columns]],
+        }
+
+    return fixed_parameters
+
+
+def update_model(m, input_data_dir):
+    r"""
+    Updates a built model with the cost coefficients and heat pump COP of
+    another datapackage with the same topology.
+
+    The variable costs and investment costs are set on the flows and
+    storages of the model, the objective is rebuilt and the
+    input-output-relations of transformers with changed conversion
+    factors are replaced. The rest of the model is reused as it is.
+
+    Parameters
+    ----------
+    m : oemof.solph.Model
+        Model that has been built with :func:`build_model`.
+
+    input_data_dir : str
+        Directory of the preprocessed datapackage.
+
+    Raises
+    ------
+    ValueError
+        If the datapackage differs from the model in anything else than
+        the updatable parameters.
+    """
+    logging.info("Updating the optimization model")
+    es = from_datapackage(
         os.path.join(input_data_dir, "datapackage.json"),
         attributemap={}, typemap=TYPEMAP,
     )
 
-    # create model from energy system (this is just oemof.solph)
-    logging.info("Creating the optimization model")
-    m = Model(es)
+    def by_label(flows):
+        return {(str(i), str(o)): flow for (i, o), flow in flows.items()}
+
+    flows = by_label(m.flows)
+    new_flows = by_label(es.flows())
+
+    if flows.keys() != new_flows.keys():
+        raise ValueError("The topology of the datapackage differs from the model.")
+
+    if not aggregation.same_mapping(m.es.aggregation, aggregation.read_mapping(input_data_dir)):
+        raise ValueError("The time series aggregation of the datapackage differs from the model.")
+
+    new_fixed_parameters = get_fixed_parameters(es)
+
+    for k, v in m.fixed_parameters.items():
+        new_v = new_fixed_parameters.get(k)
+        if (
+            new_v is None
+            or not v['scalars'].equals(new_v['scalars'])
+            or not v['sequences'].equals(new_v['sequences'])
+        ):
+            raise ValueError(f"Parameters of {k} other than costs and COP differ from the model.")
+
+    for k, flow in flows.items():
+        flow.variable_costs = new_flows[k].variable_costs
+
+        if flow.investment is not None:
+            flow.investment.ep_costs = new_flows[k].investment.ep_costs
+
+    nodes = {str(n): n for n in m.es.nodes}
+
+    changed_transformers = []
+    for new_node in es.nodes:
+        node = nodes[str(new_node)]
+
+        if isinstance(node, GenericStorage) and node.investment is not None:
+            node.investment.ep_costs = new_node.investment.ep_costs
+
+        # The conversion factors of storages and extraction turbines are
+        # part of other constraints and therefore not updated.
+        if isinstance(node, Transformer) and not isinstance(
+                node, (GenericStorage, ExtractionTurbineCHP)):
+            conversion_factors = {
+                bus: new_node.conversion_factors[new_bus]
+                for bus in node.conversion_factors
+                for new_bus in new_node.conversion_factors
+                if str(bus) == str(new_bus)
+            }
+
+            if any(
+                list(conversion_factors[bus][t] for t in m.TIMESTEPS)
+                != list(node.conversion_factors[bus][t] for t in m.TIMESTEPS)
+                for bus in conversion_factors
+            ):
+                node.conversion_factors.update(conversion_factors)
+                changed_transformers.append(node)
+
+    for (n, i, o, t) in m.Transformer.relation:
+        if n in changed_transformers:
+            m.Transformer.relation[n, i, o, t].set_value(
+                m.flow[i, n, t] / n.conversion_factors[i][t]
+                == m.flow[n, o, t] / n.conversion_factors[o][t]
+            )
+
+    # The investment cost expressions are recreated with the objective.
+    for block in m.component_data_objects(Block):
+        if hasattr(block, '_objective_expression') and hasattr(block, 'investment_costs'):
+            block.del_component('investment_costs')
+
+    m._add_objective(update=True)
+
+
+def get_solver_statistics(solver_results):
+    r"""
+    Extracts termination condition, number of iterations and solver time
+    from the results returned by pyomo. Values that the solver does not
+    report are None.
+    """
+    def get(obj, *attributes):
+        try:
+            for attribute in attributes:
+                obj = getattr(obj, attribute)
+            return float(obj)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+    solver = solver_results.solver
+
+    statistics = {
+        'termination_condition': str(solver.termination_condition),
+        'iterations': get(solver, 'statistics', 'black_box', 'number_of_iterations'),
+        'solver_time': get(solver, 'time'),
+    }
+
+    return statistics
+
+
+def solve(m, results_data_dir=None, solver='cbc', debug=False, solver_options=None):
+    r"""
+    Solves the model and attaches results and parameters to its
+    EnergySystem. If a results directory is given, the results are saved
+    to it together with the solver statistics.
+
+    The results and parameters of an aggregated model are expanded to the
+    full year.
+
+    `solver_options` are passed to the solver on the command line, e.g.
+    `{'presolve': 'off'}` for cbc. An empty value passes the key as flag.
+
+    Returns
+    -------
+    es : oemof.solph.EnergySystem
+        EnergySystem with results and parameters. Its attribute
+        `solver_statistics` holds iterations, solver time and wall time.
+    """
+    es = m.es
 
     # if you want dual variables / shadow prices uncomment line below
     # m.receive_duals()
 
     # save lp file together with optimization results
-    if debug:
+    if debug and results_data_dir is not None:
         lp_file_dir = os.path.join(results_data_dir, 'model.lp')
         logging.info(f"Saving the lp-file to {lp_file_dir}")
         m.write(lp_file_dir, io_options={'symbolic_solver_labels': True})
 
     # select solver 'gurobi', 'cplex', 'glpk' etc
     logging.info(f'Solving the problem using {solver}')
-    m.solve(solver=solver)
+    start = time.perf_counter()
+    with span('solve'):
+        solver_results = m.solve(solver=solver, cmdline_options=solver_options or {})
+    wall_time = time.perf_counter() - start
+
+    es.solver_statistics = get_solver_statistics(solver_results)
+    es.solver_statistics.update({
+        'solver': solver,
+        'solver_options': solver_options or {},
+        'warm_start': False,
+        'wall_time': wall_time,
+    })
+    logging.info(f'Solver statistics: {es.solver_statistics}')
 
     # get the results from the the solved model(still oemof.solph)
-    es.results = m.results()
-    es.params = outputlib.processing.parameter_as_dict(es)
+    with span('results'):
+        if es.aggregation is None:
+            es.results = m.results()
+            es.params = outputlib.processing.parameter_as_dict(es)
+
+        else:
+            # results and parameters are expanded to the full year
+            es.results = aggregation.get_results(m, es.aggregation)
+            es.params = aggregation.expand_params(
+                outputlib.processing.parameter_as_dict(es), es.aggregation
+            )
 
     # now we use the write results method to write the results in oemof-tabular
     # format
+    if results_data_dir is not None:
+        save_results(es, results_data_dir)
+
+    return es
+
+
+def save_results(es, results_data_dir):
+    r"""
+    Saves the results and parameters in the compact format of
+    `tools.results` and the solver statistics.
+    """
     logging.info(f'Writing the results to {results_data_dir}')
-    es.dump(results_data_dir)
+    with span('dump'):
+        dump_results(collect_results(es), results_data_dir)
+
+    pd.Series(es.solver_statistics).to_csv(
+        os.path.join(results_data_dir, 'solver_statistics.csv'), header=False
+    )
+
+
+def optimize_persistent(
+    m, input_data_dir, results_data_dir, solver='cbc', debug=False, solver_options=None,
+):
+    r"""
+    Solves the datapackage on a persistent model. If there is no model
+    yet or the datapackage does not fit the model, a new model is built.
+
+    Parameters
+    ----------
+    m : oemof.solph.Model or None
+        Model of a previous scenario.
+
+    input_data_dir : str
+        Directory of the preprocessed datapackage.
+
+    results_data_dir : str
+        Directory to write the results to.
+
+    Returns
+    -------
+    m : oemof.solph.Model
+        Model to be passed on to the next scenario.
+    """
+    if m is not None:
+        try:
+            update_model(m, input_data_dir)
+        except ValueError as e:
+            logging.warning(f"Cannot reuse the model: {e} Building a new one.")
+            m = None
+
+    if m is None:
+        m = build_model(input_data_dir)
+
+    solve(m, results_data_dir, solver=solver, debug=debug, solver_options=solver_options)
+
+    return m
 
 
 def main(**scenario_assumptions):
@@ -56,7 +409,38 @@ def main(**scenario_assumptions):
 
     dirs = get_experiment_dirs(scenario_assumptions['scenario'])
 
-    optimize(dirs['preprocessed'], dirs['optimised'], debug=scenario_assumptions['debug'])
+    config = get_config_file('run.yml')
+
+    profile = get_solver_profile()
+
+    rolling = config['rolling_horizon']
+
+    with span('validation'):
+        validation.validate_datapackage(dirs['preprocessed'], scenario_assumptions)
+
+    if rolling['window']:
+        rolling_horizon.optimize_rolling(
+            dirs['preprocessed'],
+            dirs['optimised'],
+            window=rolling['window'],
+            overlap=rolling['overlap'],
+            sizing_typical_periods=rolling['sizing_typical_periods'],
+            sizing_period_length=rolling['sizing_period_length'],
+            solver=profile['solver'],
+            solver_options=profile['options'],
+        )
+
+    elif config['backend'] == 'sparse':
+        sparse_lp.optimize(
+            dirs['preprocessed'], dirs['optimised'], solver=profile['solver'],
+            debug=scenario_assumptions['debug'], solver_options=profile['options'],
+        )
+
+    else:
+        optimize(
+            dirs['preprocessed'], dirs['optimised'], solver=profile['solver'],
+            debug=scenario_assumptions['debug'], solver_options=profile['options'],
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,128 @@
+r"""
+In-memory pipeline that passes the solved EnergySystem, its results and
+sequences directly from stage to stage.
+
+The datapackage is still written by preprocessing because oemof.tabular
+reads the EnergySystem from disk. Without `write`, it goes to a temporary
+directory. No results or plots are written.
+"""
+import tempfile
+from dataclasses import dataclass
+
+import pandas as pd
+
+import preprocessing
+import optimization
+import postprocessing
+import plot_single_scenario
+from tools.helper import get_experiment_dirs, get_scenario_assumptions
+from tools.results import collect_results
+
+
+@dataclass
+class ScenarioResult:
+    r"""
+    Results of one scenario.
+
+    Attributes
+    ----------
+    scenario : str
+        Name of the scenario.
+
+    es : oemof.solph.EnergySystem
+        EnergySystem with results and parameters.
+
+    scalars : pd.DataFrame
+        Scalar results as written to scalars.csv.
+
+    sequences : dict
+        Sequences of all buses and the storage filling levels.
+
+    input_sequences : dict
+        Heat demand and electricity price profiles of the datapackage.
+    """
+    scenario: str
+    es: object
+    scalars: pd.DataFrame
+    sequences: dict
+    input_sequences: dict
+
+    @property
+    def share_el_heat(self):
+        return self.scalars.loc[('aggregated', 'share_el_heat'), 'var_value']
+
+    @property
+    def spec_cost_of_heat(self):
+        return self.scalars.loc[('all', 'spec_cost_of_heat'), 'var_value']
+
+
+def run_scenario(scenario_assumptions, write=False, solver='cbc'):
+    r"""
+    Runs preprocessing, optimization and postprocessing of a scenario and
+    returns the results.
+
+    Parameters
+    ----------
+    scenario_assumptions : dict-like
+        Assumptions of the scenario.
+
+    write : bool
+        If True, the datapackage, the optimisation results, the postprocessed
+        results and the plots are written to the experiment directories like
+        in `main.py`.
+
+    solver : str
+        Solver to use.
+
+    Returns
+    -------
+    result : ScenarioResult
+    """
+    scenario = scenario_assumptions['scenario']
+
+    if write:
+        dirs = get_experiment_dirs(scenario)
+
+        input_sequences = preprocessing.preprocess(
+            scenario_assumptions, dirs['raw'], dirs['preprocessed']
+        )
+
+        es = optimization.optimize(
+            dirs['preprocessed'], dirs['optimised'], solver=solver,
+            debug=scenario_assumptions['debug']
+        )
+
+        scalars, sequences = postprocessing.postprocess(
+            collect_results(es), dirs['postprocessed']
+        )
+
+        plot_single_scenario.plot(
+            input_sequences['carrier_cost_profile'].to_frame(), sequences, dirs['plots']
+        )
+
+    else:
+        raw_dir = get_experiment_dirs()['raw']
+
+        with tempfile.TemporaryDirectory() as preprocessed_dir:
+            input_sequences = preprocessing.preprocess(
+                scenario_assumptions, raw_dir, preprocessed_dir
+            )
+
+            es = optimization.optimize(preprocessed_dir, solver=solver)
+
+        scalars, sequences = postprocessing.postprocess(collect_results(es))
+
+    return ScenarioResult(
+        scenario=scenario,
+        es=es,
+        scalars=scalars,
+        sequences=sequences,
+        input_sequences=input_sequences,
+    )
+
+
+if __name__ == '__main__':
+    scenario_assumptions = get_scenario_assumptions().loc[0]
+    result = run_scenario(scenario_assumptions)
+    print(f"share_el_heat: {result.share_el_heat}")
+    print(f"spec_cost_of_heat: {result.spec_cost_of_heat}")
@@ -2,21 +2,18 @@ import os
 import sys
 
 import matplotlib.pyplot as plt
-import pandas as pd
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from tools.helper import get_experiment_dirs
 from tools.plot_helpers import plot_load_duration
+from tools.raw_cache import read_raw
 
 
 def plot():
 
     dirs = get_experiment_dirs('all_scenarios')
 
-    price_el = pd.read_csv(
-        os.path.join(dirs['raw'], 'price_electricity_spot_2017.csv'),
-        index_col=0
-    )
+    price_el = read_raw(os.path.join(dirs['raw'], 'price_electricity_spot_2017.csv'))
 
     price_el.columns = ['electricity']
 
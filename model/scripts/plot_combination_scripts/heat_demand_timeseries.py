@@ -2,21 +2,18 @@ import os
 import sys
 
 import matplotlib.pyplot as plt
-import pandas as pd
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from tools.helper import get_experiment_dirs
 from tools.plot_helpers import plot_load_duration
+from tools.raw_cache import read_raw_column
 
 
 def plot():
 
     dirs = get_experiment_dirs('all_scenarios')
 
-    demand_heat = pd.read_csv(
-        os.path.join(dirs['raw'], 'demand_heat_2017.csv'),
-        index_col=0
-    ).sum(1)
+    demand_heat = read_raw_column(os.path.join(dirs['raw'], 'demand_heat_2017.csv'))
 
     demand_heat.name = 'heat-demand'
 
@@ -5,8 +5,10 @@ import pandas as pd
 import matplotlib.dates as mdates
 from matplotlib import rcParams
 
+import aggregation
 from tools.helper import get_experiment_dirs, get_scenario_assumptions, get_config_file
 from tools.plot_helpers import map_handles_labels, map_names_to_labels
+from tools.timing import span
 
 
 idx = pd.IndexSlice
@@ -208,28 +210,32 @@ def plot_yearly_production(yearly_production, destination):
     plt.close(fig)
 
 
-def main(**scenario_assumptions):
-    dirs = get_experiment_dirs(scenario_assumptions['scenario'])
+def plot(price_el, sequences, destination):
+    r"""
+    Plots prices, heat demand, heat supply and dispatch of a scenario.
 
-    price_el = pd.read_csv(
-        os.path.join(dirs['preprocessed'], 'data', 'sequences', 'carrier_cost_profile.csv'),
-        index_col=0
-    )
+    Parameters
+    ----------
+    price_el : pd.DataFrame
+        Electricity price for buying.
 
-    electricity = pd.read_csv(
-        os.path.join(dirs['postprocessed'], 'sequences', 'electricity.csv'),
-        index_col=0,
-    )
+    sequences : dict
+        Sequences of the buses 'electricity', 'heat_central' and
+        'heat_decentral'.
 
-    heat_central = pd.read_csv(
-        os.path.join(dirs['postprocessed'], 'sequences', 'heat_central.csv'),
-        index_col=0
-    )
+    destination : str
+        Directory to save the plots to.
+    """
+    def with_str_columns(df):
+        df = df.copy()
+        df.columns = df.columns.map(str)
+        return df
 
-    heat_decentral = pd.read_csv(
-        os.path.join(dirs['postprocessed'], 'sequences', 'heat_decentral.csv'),
-        index_col=0
-    )
+    electricity = with_str_columns(sequences['electricity'])
+
+    heat_central = with_str_columns(sequences['heat_central'])
+
+    heat_decentral = with_str_columns(sequences['heat_decentral'])
 
     timeseries = pd.concat([heat_central, heat_decentral], 1)
 
@@ -241,56 +247,87 @@ def main(**scenario_assumptions):
 
     demand = timeseries['heat-demand']
 
-    plot_load_duration(
-        price_el,
-        legend=False,
-        plot_original=True,
-        title='Electricity prices (buying)',
-        ylabel='Hourly price [Eur/MWh]',
-    )
-    plt.savefig(os.path.join(dirs['plots'], 'price_el.pdf'))
-    plt.close()
-
-    plot_load_duration(
-        demand,
-        legend=False,
-        plot_original=True,
-        title = 'Heat demand',
-        ylabel = 'Hourly heat demand [MWh]',
-    )
-    plt.savefig(os.path.join(dirs['plots'], 'heat_demand.pdf'))
-    plt.close()
+    with span('plot_price_el'):
+        plot_load_duration(
+            price_el,
+            legend=False,
+            plot_original=True,
+            title='Electricity prices (buying)',
+            ylabel='Hourly price [Eur/MWh]',
+        )
+        plt.savefig(os.path.join(destination, 'price_el.pdf'))
+        plt.close()
+
+    with span('plot_heat_demand'):
+        plot_load_duration(
+            demand,
+            legend=False,
+            plot_original=True,
+            title = 'Heat demand',
+            ylabel = 'Hourly heat demand [MWh]',
+        )
+        plt.savefig(os.path.join(destination, 'heat_demand.pdf'))
+        plt.close()
 
-    plot_load_duration(
-        supply,
-        linewidth=10,
-    )
-    plt.savefig(os.path.join(dirs['plots'], 'heat_supply.pdf'))
-    plt.close()
+    with span('plot_heat_supply'):
+        plot_load_duration(
+            supply,
+            linewidth=10,
+        )
+        plt.savefig(os.path.join(destination, 'heat_supply.pdf'))
+        plt.close()
 
-    start = '2017-02-01'
-    end = '2017-02-14'
+    # The windows lie in the first year of the horizon.
+    year = str(supply.index[0])[:4]
 
-    plot_dispatch(
-        supply[start:end], demand[start:end],
-        os.path.join(dirs['plots'], 'heat_dispatch.pdf')
-    )
+    start = f'{year}-02-01'
+    end = f'{year}-02-14'
+
+    with span('plot_heat_dispatch'):
+        plot_dispatch(
+            supply[start:end], demand[start:end],
+            os.path.join(destination, 'heat_dispatch.pdf')
+        )
 
 
-    winter_a = '2017-01-10'
-    winter_b = '2017-01-24'
-    summer_a = '2017-06-01'
-    summer_b = '2017-06-14'
+    winter_a = f'{year}-01-10'
+    winter_b = f'{year}-01-24'
+    summer_a = f'{year}-06-01'
+    summer_b = f'{year}-06-14'
 
     electricity_chp = pd.DataFrame(electricity['gas-chp'])
 
-    multiplot_dispatch(
-        (supply[winter_a:winter_b], supply[summer_a:summer_b]),
-        (electricity_chp[winter_a:winter_b], electricity_chp[summer_a:summer_b]),
-        os.path.join(dirs['plots'], 'heat_el_dispatch.pdf')
-    )
+    with span('plot_heat_el_dispatch'):
+        multiplot_dispatch(
+            (supply[winter_a:winter_b], supply[summer_a:summer_b]),
+            (electricity_chp[winter_a:winter_b], electricity_chp[summer_a:summer_b]),
+            os.path.join(destination, 'heat_el_dispatch.pdf')
+        )
     # yearly_production= yearly_heat_sum.drop('heat-demand')
-    # plot_yearly_production(yearly_production, os.path.join(dirs['plots'], 'heat_yearly_production.svg'))
+    # plot_yearly_production(yearly_production, os.path.join(destination, 'heat_yearly_production.svg'))
+
+
+def main(**scenario_assumptions):
+    dirs = get_experiment_dirs(scenario_assumptions['scenario'])
+
+    price_el = pd.read_csv(
+        os.path.join(dirs['preprocessed'], 'data', 'sequences', 'carrier_cost_profile.csv'),
+        index_col=0
+    )
+
+    mapping = aggregation.read_mapping(dirs['preprocessed'])
+    if mapping is not None:
+        price_el = aggregation.expand_sequences(price_el, mapping)
+
+    sequences = {
+        bus: pd.read_csv(
+            os.path.join(dirs['postprocessed'], 'sequences', bus + '.csv'),
+            index_col=0,
+        )
+        for bus in ['electricity', 'heat_central', 'heat_decentral']
+    }
+
+    plot(price_el, sequences, dirs['plots'])
 
 
 if __name__ == '__main__':
@@ -1,21 +1,40 @@
-import copy
 import os
 
 import numpy as np
 import pandas as pd
 
-from oemof.solph import EnergySystem, Bus, Sink
-from oemof.solph.components import GenericStorage
-from oemof.outputlib import views, processing
+from tools.helper import get_experiment_dirs, get_scenario_assumptions, get_timestep_hours, \
+    get_horizon_years
+from tools.results import load_results
+from tools.timing import span
 
-from oemof.tabular import facades
-from oemof.tabular.tools.postprocessing import component_results, supply_results,\
-    demand_results, bus_results
 
-from tools.helper import get_experiment_dirs, get_scenario_assumptions
+idx = pd.IndexSlice
 
+# Types of the oemof.tabular facades. The results are read without oemof,
+# so the types that derive from others are listed with them.
+BUS_TYPES = ['bus', 'electrical bus']
 
-idx = pd.IndexSlice
+# Types that supply a bus as selected by
+# `oemof.tabular.tools.postprocessing.supply_results`.
+SUPPLY_TYPES = [
+    ['dispatchable', 'generator', 'shortage'],
+    ['volatile'],
+    ['conversion'],
+    ['backpressure'],
+    ['extraction'],
+    ['storage'],
+    ['reservoir'],
+]
+
+# Types whose net flow is counted as supply.
+NET_FLOW_TYPES = ['storage']
+
+# Types that have a storage level.
+STORAGE_TYPES = ['storage', 'reservoir']
+
+# Types whose capacity is not reported.
+NO_CAPACITY_TYPES = BUS_TYPES + ['load', 'excess', 'shortage', 'link']
 
 
 def multi_index_dtype_to_str(df):
@@ -36,79 +55,141 @@ def drop_rows_by_label(df, labels):
     return df
 
 
-def write_results(
-    es, output_path, raw=False, summary=True, scalars=True, **kwargs
-):
+def to_frame(results, sequences):
+    r"""
+    Returns sequences keyed by the labels of their flows as DataFrame with
+    the labels as columns.
+    """
+    df = pd.DataFrame({k: v.values for k, v in sequences.items()}, index=results.timeindex)
+
+    df.columns = pd.MultiIndex.from_tuples(list(sequences), names=['from', 'to'])
+
+    return df
+
+
+def get_flows(results, flows, condition):
+    r"""
+    Returns the flows for whose labels `condition(from, to)` is True,
+    sorted like in oemof's views.
     """
+    return to_frame(results, {k: flows[k] for k in sorted(flows) if condition(*k)})
+
+
+def get_net_flows(results, flows, types):
+    r"""
+    Returns the outflows minus the inflows of the storages of the types,
+    keyed by their label and the bus they feed.
+    """
+    labels = results.components.index
+
+    net_flows = {}
+    for storage in sorted(labels[results.has_type(labels, types)]):
+        outflows = [k for k in flows if k[0] == storage]
+        inflows = [k for k in flows if k[1] == storage]
+
+        for _, bus in outflows:
+            net_flows[(storage, bus)] = \
+                sum(flows[k] for k in outflows) - sum(flows[k] for k in inflows)
+
+    return to_frame(results, net_flows)
+
+
+def write_results(results, output_path=None, raw=False):
+    r"""
+    Writes the supply and demand of every bus and the storage levels.
+
+    Adapted from oemof.tabular.tools.postprocessing.write_results()
+
+    Parameters
+    ----------
+    results : tools.results.Results
+        Results of the optimization.
+
+    output_path : str
+        Directory to write the sequences to. If None, nothing is written.
+
+    raw : bool
+        Write the flows of the links as well.
+
+    Returns
+    -------
+    sequences : dict
+        Sequences of all buses and the storage filling levels.
     """
 
     def save(df, name, path=output_path):
-        """ Helper for writing csv files
+        """ Helper for writing csv files. Nothing is written if no output
+        path is given.
         """
-        df.to_csv(os.path.join(path, name + ".csv"))
+        if path is not None:
+            df.to_csv(os.path.join(path, name + ".csv"))
+
+    def is_type(label, types):
+        return results.get_type(label) in types
 
     sequences = {}
 
-    buses = [b.label for b in es.nodes if isinstance(b, Bus)]
+    flows = results.select('flow')
+
+    buses = [label for label in results.components.index if is_type(label, BUS_TYPES)]
 
-    link_results = component_results(es, es.results).get("link")
-    if link_results is not None and raw:
+    link_results = get_flows(
+        results, flows, lambda fr, to: is_type(fr, ['link']) or is_type(to, ['link'])
+    )
+    if not link_results.empty and raw:
         save(link_results, "links")
         sequences.update({'links': link_results})
 
     imports = pd.DataFrame()
     for b in buses:
-        supply = supply_results(results=es.results, es=es, bus=[b], **kwargs)
-        supply.columns = supply.columns.droplevel([1, 2])
+        supply = pd.concat([
+            get_net_flows(results, flows, types) if types == NET_FLOW_TYPES
+            else get_flows(results, flows, lambda fr, to: is_type(fr, types))
+            for types in SUPPLY_TYPES
+        ], axis=1)
+        supply = supply.loc[:, supply.columns.get_level_values(1) == b]
+        supply.columns = supply.columns.get_level_values(0)
 
-        demand = demand_results(results=es.results, es=es, bus=[b])
+        demand = get_flows(results, flows, lambda fr, to: fr == b and is_type(to, ['load']))
 
-        excess = component_results(es, es.results, select="sequences").get(
-            "excess"
-        )
+        excess = get_flows(results, flows, lambda fr, to: fr == b and is_type(to, ['excess']))
 
-        if link_results is not None and es.groups[b] in list(
-            link_results.columns.levels[0]
-        ):
-            ex = link_results.loc[
-                :, (es.groups[b], slice(None), "flow")
-            ].sum(axis=1)
-            im = link_results.loc[
-                :, (slice(None), es.groups[b], "flow")
-            ].sum(axis=1)
+        if b in link_results.columns.get_level_values(0):
+            ex = link_results.loc[:, link_results.columns.get_level_values(0) == b].sum(axis=1)
+            im = link_results.loc[:, link_results.columns.get_level_values(1) == b].sum(axis=1)
 
             net_import = im - ex
-            net_import.name = es.groups[b]
+            net_import.name = b
             imports = pd.concat([imports, net_import], axis=1)
 
             supply["import"] = net_import
 
-        if es.groups[b] in demand.columns:
-            _demand = demand.loc[:, (es.groups[b], slice(None), "flow")]
-            _demand.columns = _demand.columns.droplevel([0, 2])
-            supply = pd.concat([supply, _demand], axis=1)
-        if excess is not None:
-            if es.groups[b] in excess.columns:
-                _excess = excess.loc[:, (es.groups[b], slice(None), "flow")]
-                _excess.columns = _excess.columns.droplevel([0, 2])
-                supply = pd.concat([supply, _excess], axis=1)
+        if not demand.empty:
+            demand.columns = demand.columns.get_level_values(1)
+            supply = pd.concat([supply, demand], axis=1)
+        if not excess.empty:
+            excess.columns = excess.columns.get_level_values(1)
+            supply = pd.concat([supply, excess], axis=1)
         save(supply, os.path.join('sequences', b))
         sequences.update({str(b): supply})
         # save(excess, "excess")
         # save(imports, "import")
 
-    bresults = bus_results(es, es.results, concat=True)
     # check if storages exist in energy system nodes
-    if [n for n in es.nodes if isinstance(n, GenericStorage)]:
-        filling_levels = views.node_weight_by_type(es.results, GenericStorage)
-        filling_levels.columns = filling_levels.columns.droplevel(1)
+    storages = [label for label in results.components.index if is_type(label, STORAGE_TYPES)]
+    if storages:
+        levels = results.select('capacity')
+        filling_levels = pd.DataFrame(
+            {k[0]: v for k, v in sorted(levels.items()) if k[0] in storages and k[1] is None},
+            index=results.timeindex,
+        )
         save(filling_levels, os.path.join('sequences', 'filling_levels'))
         sequences.update({'filling_levels': filling_levels})
 
     return sequences
 
 
-def get_capacities(es):
+def get_capacities(results):
     r"""
     Calculates the capacities of all components.
 
@@ -116,96 +197,79 @@ def get_capacities(es):
 
     Parameters
     ----------
-    es : oemof.solph.EnergySystem
-        EnergySystem containing the results.
+    results : tools.results.Results
+        Results of the optimization.
 
     Returns
     -------
     capacities : pd.DataFrame
         DataFrame containing the capacities.
     """
-    try:
-        all = bus_results(es, es.results, select="scalars", concat=True)
-
-        all.name = "var_value"
-
-        endogenous = all.reset_index()
-
-        endogenous.drop(['from', 'to'], axis=1, inplace=True)
-
-        endogenous["name"] = [
-            getattr(t, "label", np.nan) for t in all.index.get_level_values(0)
-        ]
-        endogenous["type"] = [
-            getattr(t, "type", np.nan) for t in all.index.get_level_values(0)
-        ]
-        endogenous["carrier"] = [
-            getattr(t, "carrier", np.nan)
-            for t in all.index.get_level_values(0)
-        ]
-        endogenous["tech"] = [
-            getattr(t, "tech", np.nan) for t in all.index.get_level_values(0)
-        ]
-        endogenous["var_name"] = "invest"
-        endogenous.set_index(
-            ["name", "type", "carrier", "tech", "var_name"], inplace=True
+    variables = results.variables
+
+    # Scalar results of the flows from and to the buses.
+    endogenous = variables.loc[
+        (variables['source'] == 'results')
+        & variables['length'].isna()
+        & (
+            results.has_type(variables['from'], BUS_TYPES)
+            | results.has_type(variables['to'], BUS_TYPES)
         )
+    ]
 
-    except ValueError:
-        endogenous = pd.DataFrame()
-
-    d = dict()
-    for node in es.nodes:
-        if not isinstance(node, (Bus, Sink, facades.Shortage)):
-            if getattr(node, "capacity", None) is not None:
-                if isinstance(node, facades.TYPEMAP["link"]):
-                    pass
-                else:
-                    key = (
-                        node.label,
-                        # [n for n in node.outputs.keys()][0],
-                        node.type,
-                        node.carrier,
-                        node.tech,  # tech & carrier are oemof-tabular specific
-                        'capacity'
-                    )  # for oemof logic
-                    d[key] = {'var_value': node.capacity}
-    exogenous = pd.DataFrame.from_dict(d).T  # .dropna()
-
-    if not exogenous.empty:
-        exogenous.index = exogenous.index.set_names(
-            ['name', 'type', 'carrier', 'tech', 'var_name']
-        )
+    endogenous = pd.DataFrame({
+        'name': endogenous['from'],
+        'type': results.get_attribute(endogenous['from'], 'type'),
+        'carrier': results.get_attribute(endogenous['from'], 'carrier'),
+        'tech': results.get_attribute(endogenous['from'], 'tech'),
+        'var_name': 'invest',
+        'var_value': endogenous['value'],
+    })
+    endogenous.set_index(
+        ["name", "type", "carrier", "tech", "var_name"], inplace=True
+    )
 
-    try:
-        all = component_results(es, es.results, select='scalars')['storage']
-        all.name = 'var_value'
-
-        storage = all.reset_index()
-        storage.columns = ['name', 'to', 'var_name', 'var_value']
-        storage['type'] = [
-            getattr(t, "type", np.nan) for t in all.index.get_level_values(0)
-        ]
-        storage['carrier'] = [
-            getattr(t, "carrier", np.nan) for t in all.index.get_level_values(0)
-        ]
-        storage['tech'] = [
-            getattr(t, "tech", np.nan) for t in all.index.get_level_values(0)
-        ]
-        storage = storage.loc[storage['to'].isna()]
-        storage.drop('to', 1, inplace=True)
-        storage = storage[['name', 'type', 'carrier', 'tech', 'var_name', 'var_value']]
-        storage.replace(
-            ['init_cap', 'invest'],
-            ['storage_capacity', 'storage_capacity_invest'],
-            inplace=True
-        )
-        storage.set_index(
-            ["name", "type", "carrier", "tech", "var_name"], inplace=True
-        )
+    components = results.components.loc[
+        ~results.has_type(results.components.index, NO_CAPACITY_TYPES)
+        & results.components['capacity'].notna()
+    ]
 
-    except ValueError:
-        storage = pd.DataFrame()
+    exogenous = pd.DataFrame({
+        'name': components.index,
+        'type': components['type'].values,
+        'carrier': components['carrier'].values,
+        'tech': components['tech'].values,
+        'var_name': 'capacity',
+        'var_value': components['capacity'].values,
+    })
+    exogenous.set_index(
+        ['name', 'type', 'carrier', 'tech', 'var_name'], inplace=True
+    )
+
+    # Scalar results of the storages themselves.
+    storage = variables.loc[
+        (variables['source'] == 'results')
+        & variables['length'].isna()
+        & variables['to'].isna()
+        & results.has_type(variables['from'], ['storage'])
+    ]
+
+    storage = pd.DataFrame({
+        'name': storage['from'],
+        'type': results.get_attribute(storage['from'], 'type'),
+        'carrier': results.get_attribute(storage['from'], 'carrier'),
+        'tech': results.get_attribute(storage['from'], 'tech'),
+        'var_name': storage['var_name'],
+        'var_value': storage['value'],
+    })
+    storage.replace(
+        ['init_cap', 'invest'],
+        ['storage_capacity', 'storage_capacity_invest'],
+        inplace=True
+    )
+    storage.set_index(
+        ["name", "type", "carrier", "tech", "var_name"], inplace=True
+    )
 
     capacities = pd.concat([endogenous, exogenous, storage])
 
@@ -225,58 +289,18 @@ def cap_el_to_cap_th(df):
     return df_adapted
 
 
-def get_flow_by_oemof_tuple(oemof_tuple):
-    if isinstance(oemof_tuple[0], Bus):
-        component = oemof_tuple[1]
-        bus = oemof_tuple[0]
+def multiply_param_with_variable(results, param_name, var_name):
+    parameter = results.select(param_name, source='params')
 
-    elif isinstance(oemof_tuple[1], Bus):
-        component = oemof_tuple[0]
-        bus = oemof_tuple[1]
-
-    else:
-        return None
-
-    flow = component.outputs[bus]
-
-    return flow
-
-
-def select_from_dict(dict, name):
-    def has_var_name(v, name):
-        return (name in v['scalars'].index) or (name in v['sequences'].columns)
-
-    def get_var_value(v, name):
-        if name in v['scalars'].index:
-            return v['scalars'][name]
-        elif name in v['sequences'].columns:
-            return v['sequences'][name]
-
-    selected_param_dict = copy.deepcopy({k: get_var_value(v, name) for k, v in dict.items() if has_var_name(v, name)})
-
-    return selected_param_dict
-
-
-def multiply_param_with_variable(params, results, param_name, var_name):
-    def get_label(k):
-        if isinstance(k, tuple):
-            return tuple(map(str, k))
-        return str(k)
-
-    parameter = select_from_dict(params, param_name)
-
-    variable = select_from_dict(results, var_name)
-
-    intersection = processing.convert_keys_to_strings(parameter).keys()\
-                   & processing.convert_keys_to_strings(variable).keys()
+    variable = results.select(var_name)
 
     product = {}
     for k, var in variable.items():
-        if get_label(k) in intersection:
-            par = processing.convert_keys_to_strings(parameter)[get_label(k)]
+        if k in parameter:
+            par = parameter[k]
 
             if isinstance(par, pd.Series):
-                par.index = var.index
+                par = pd.Series(par.values, index=var.index)
 
             prod = var * par
             product.update({k: prod})
@@ -284,7 +308,7 @@ def multiply_param_with_variable(params, results, param_name, var_name):
     return product
 
 
-def index_tuple_to_pp_format(input_df, var_name):
+def index_tuple_to_pp_format(results, input_df, var_name):
 
     df = input_df.copy()
 
@@ -293,7 +317,7 @@ def index_tuple_to_pp_format(input_df, var_name):
     df = df.reset_index()
 
     def is_bus(index):
-        return index.map(lambda x: isinstance(x, Bus))
+        return results.has_type(index, BUS_TYPES)
 
     df['name'] = np.nan
 
@@ -303,15 +327,9 @@ def index_tuple_to_pp_format(input_df, var_name):
 
     df.loc[df['level_1'].isna(), 'name'] = df['level_0']
 
-    df['type'] = [
-        getattr(t, "type", np.nan) for t in df['name']
-    ]
-    df['carrier'] = [
-        getattr(t, "carrier", np.nan) for t in df['name']
-    ]
-    df['tech'] = [
-        getattr(t, "tech", np.nan) for t in df['name']
-    ]
+    df['type'] = results.get_attribute(df['name'], 'type')
+    df['carrier'] = results.get_attribute(df['name'], 'carrier')
+    df['tech'] = results.get_attribute(df['name'], 'tech')
     df['var_name'] = var_name
 
     df = df[['name', 'type', 'carrier', 'tech', 'var_name', 'var_value']]
@@ -321,9 +339,9 @@ def index_tuple_to_pp_format(input_df, var_name):
     return df
 
 
-def get_yearly_sum(heat_sequences, var_name):
+def get_yearly_sum(results, heat_sequences, var_name, timestep_hours=1, horizon_years=1):
 
-    yearly_sum = heat_sequences.sum()
+    yearly_sum = heat_sequences.sum() * timestep_hours / horizon_years
 
     yearly_sum.name = 'var_value'
 
@@ -331,15 +349,9 @@ def get_yearly_sum(heat_sequences, var_name):
 
     yearly_sum = yearly_sum.reset_index()
 
-    yearly_sum['type'] = [
-        getattr(t, "type", np.nan) for t in yearly_sum['name']
-    ]
-    yearly_sum['carrier'] = [
-        getattr(t, "carrier", np.nan) for t in yearly_sum['name']
-    ]
-    yearly_sum['tech'] = [
-        getattr(t, "tech", np.nan) for t in yearly_sum['name']
-    ]
+    yearly_sum['type'] = results.get_attribute(yearly_sum['name'], 'type')
+    yearly_sum['carrier'] = results.get_attribute(yearly_sum['name'], 'carrier')
+    yearly_sum['tech'] = results.get_attribute(yearly_sum['name'], 'tech')
     yearly_sum['var_name'] = var_name
 
     yearly_sum = yearly_sum[['name', 'type', 'carrier', 'tech', 'var_name', 'var_value']]
@@ -349,11 +361,22 @@ def get_yearly_sum(heat_sequences, var_name):
     return yearly_sum
 
 
-def get_capacity_cost(es):
-    capacity_cost = multiply_param_with_variable(es.params, es.results, 'investment_ep_costs', 'invest')
-    capacity_cost = pd.Series(capacity_cost)
+def annualise(cost, horizon_years):
+    r"""
+    Converts costs over the horizon to yearly costs.
+    """
+    cost = cost.copy()
+
+    cost['var_value'] /= horizon_years
+
+    return cost
+
+
+def get_capacity_cost(results):
+    capacity_cost = multiply_param_with_variable(results, 'investment_ep_costs', 'invest')
+    capacity_cost = pd.Series(capacity_cost, dtype=float)
 
-    capacity_cost = index_tuple_to_pp_format(capacity_cost, 'capacity_cost')
+    capacity_cost = index_tuple_to_pp_format(results, capacity_cost, 'capacity_cost')
 
     capacity_cost = capacity_cost.groupby(['name', 'type', 'carrier', 'tech', 'var_name']).sum()
 
@@ -364,22 +387,30 @@ def get_capacity_cost(es):
     return capacity_cost
 
 
-def get_carrier_cost(es):
-    variable_costs = multiply_param_with_variable(es.params, es.results, 'variable_costs', 'flow')
-    carrier_cost = {k: v.sum() for k, v in variable_costs.items() if isinstance(k[0], Bus)}
-    carrier_cost = pd.Series(carrier_cost)
+def get_carrier_cost(results):
+    variable_costs = multiply_param_with_variable(results, 'variable_costs', 'flow')
+    timestep_hours = get_timestep_hours(results.timeindex)
+    carrier_cost = {
+        k: v.sum() * timestep_hours for k, v in variable_costs.items()
+        if results.get_type(k[0]) in BUS_TYPES
+    }
+    carrier_cost = pd.Series(carrier_cost, dtype=float)
 
-    carrier_cost = index_tuple_to_pp_format(carrier_cost, 'carrier_cost')
+    carrier_cost = index_tuple_to_pp_format(results, carrier_cost, 'carrier_cost')
 
     return carrier_cost
 
 
-def get_marginal_cost(es):
-    variable_costs = multiply_param_with_variable(es.params, es.results, 'variable_costs', 'flow')
-    marginal_cost = {k: v.sum() for k, v in variable_costs.items() if isinstance(k[1], Bus)}
-    marginal_cost = pd.Series(marginal_cost)
+def get_marginal_cost(results):
+    variable_costs = multiply_param_with_variable(results, 'variable_costs', 'flow')
+    timestep_hours = get_timestep_hours(results.timeindex)
+    marginal_cost = {
+        k: v.sum() * timestep_hours for k, v in variable_costs.items()
+        if results.get_type(k[1]) in BUS_TYPES
+    }
+    marginal_cost = pd.Series(marginal_cost, dtype=float)
 
-    marginal_cost = index_tuple_to_pp_format(marginal_cost, 'marginal_cost')
+    marginal_cost = index_tuple_to_pp_format(results, marginal_cost, 'marginal_cost')
 
     # Workaround to get rid of variable costs appearing twice for chp
     duplicated = marginal_cost.index.duplicated()
@@ -389,7 +420,7 @@ def get_marginal_cost(es):
     return marginal_cost
 
 
-def get_full_load_hours(es):
+def get_full_load_hours(results):
 
     def index_to_str(df_in):
         df = df_in.copy()
@@ -403,14 +434,15 @@ def get_full_load_hours(es):
 
         return df
 
-    capacity = pd.Series(select_from_dict(es.params, 'nominal_value')).astype(float)
-    invest = pd.Series(select_from_dict(es.results, 'invest'))
+    capacity = pd.Series(results.select('nominal_value', source='params')).astype(float)
+    invest = pd.Series(results.select('invest'))
     total_capacity = capacity.add(invest, fill_value=0)
-    total_capacity = index_tuple_to_pp_format(total_capacity, 'full_load_hours')
+    total_capacity = index_tuple_to_pp_format(results, total_capacity, 'full_load_hours')
 
-    flow = select_from_dict(es.results, 'flow')
-    summed_flow = pd.Series({k: v.sum() for k, v in flow.items()})
-    summed_flow = index_tuple_to_pp_format(summed_flow, 'full_load_hours')
+    flow = results.select('flow')
+    timestep_hours = get_timestep_hours(results.timeindex)
+    summed_flow = pd.Series({k: v.sum() * timestep_hours for k, v in flow.items()})
+    summed_flow = index_tuple_to_pp_format(results, summed_flow, 'full_load_hours')
 
     total_capacity = index_to_str(total_capacity)
     summed_flow = index_to_str(summed_flow)
@@ -522,34 +554,73 @@ def write_total_cost(output_path):
     total_cost.to_csv(os.path.join(output_path, 'total_cost.csv'))
 
 
-def main(**scenario_assumptions):
-    print('Postprocessing')
-    dirs = get_experiment_dirs(scenario_assumptions['scenario'])
+def postprocess(results, output_path=None):
+    r"""
+    Calculates the sequences and scalar results of an optimization.
+
+    Parameters
+    ----------
+    results : tools.results.Results
+        Results of the optimization, read with `tools.results.load_results`
+        or collected from a solved EnergySystem with
+        `tools.results.collect_results`.
+
+    output_path : str
+        Directory to write the results to. If None, nothing is written.
+
+    Returns
+    -------
+    scalars : pd.DataFrame
+        Scalar results.
+
+    sequences : dict
+        Sequences of all buses and the storage filling levels.
+    """
+    if output_path is not None:
+        subdir = os.path.join(output_path, 'sequences')
+        if not os.path.exists(subdir):
+            os.mkdir(subdir)
+
+    with span('write_results'):
+        sequences = write_results(results, output_path)
 
-    subdir = os.path.join(dirs['postprocessed'], 'sequences')
-    if not os.path.exists(subdir):
-        os.mkdir(subdir)
+    with span('capacities'):
+        capacities = get_capacities(results)
 
-    # restore EnergySystem with results
-    es = EnergySystem()
-    es.restore(dirs['optimised'])
+        capacities = cap_el_to_cap_th(capacities)
 
-    sequences = write_results(es, dirs['postprocessed'])
+    with span('capacity_cost'):
+        capacity_cost = get_capacity_cost(results)
 
-    capacities = get_capacities(es)
+    with span('carrier_cost'):
+        carrier_cost = get_carrier_cost(results)
 
-    capacities = cap_el_to_cap_th(capacities)
+    with span('marginal_cost'):
+        marginal_cost = get_marginal_cost(results)
 
-    capacity_cost = get_capacity_cost(es)
+    # The horizon can span several years or only part of a year. Costs and
+    # sums are given per year. The sequences cover the full horizon even if
+    # the model is aggregated to representative periods.
+    horizon_years = get_horizon_years(sequences['electricity'].index)
 
-    carrier_cost = get_carrier_cost(es)
+    capacity_cost = annualise(capacity_cost, horizon_years)
+    carrier_cost = annualise(carrier_cost, horizon_years)
+    marginal_cost = annualise(marginal_cost, horizon_years)
 
-    marginal_cost = get_marginal_cost(es)
+    # The flows are powers. Their yearly sums are energies if they are
+    # multiplied by the length of the timesteps.
+    timestep_hours = get_timestep_hours(results.timeindex)
 
-    yearly_electricity = get_yearly_sum(sequences['electricity'], var_name='yearly_electricity')
+    yearly_electricity = get_yearly_sum(
+        results, sequences['electricity'], var_name='yearly_electricity',
+        timestep_hours=timestep_hours, horizon_years=horizon_years,
+    )
 
     heat_sequences = pd.concat([sequences['heat_central'], sequences['heat_decentral']], 1)
-    yearly_heat = get_yearly_sum(heat_sequences, var_name='yearly_heat')
+    yearly_heat = get_yearly_sum(
+        results, heat_sequences, var_name='yearly_heat', timestep_hours=timestep_hours,
+        horizon_years=horizon_years,
+    )
 
     # full_load_hours = get_flh(capacities, yearly_sum)
 
@@ -566,7 +637,20 @@ def main(**scenario_assumptions):
 
     scalars.sort_values(by=['name', 'var_name', 'type', 'carrier', 'tech'], inplace=True)
 
-    scalars.to_csv(os.path.join(dirs['postprocessed'], 'scalars.csv'))
+    if output_path is not None:
+        scalars.to_csv(os.path.join(output_path, 'scalars.csv'))
+
+    return scalars, sequences
+
+
+def main(**scenario_assumptions):
+    print('Postprocessing')
+    dirs = get_experiment_dirs(scenario_assumptions['scenario'])
+
+    with span('load_results'):
+        results = load_results(dirs['optimised'])
+
+    postprocess(results, dirs['postprocessed'])
 
 
 if __name__ == '__main__':
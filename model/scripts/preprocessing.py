@@ -1,25 +1,375 @@
+import csv
 import logging
 import os
+import re
 import shutil
+import tempfile
+import traceback
 
 import numpy as np
 import pandas as pd
 
+import oemof.tabular
 from oemof.tools.logger import define_logging
 from oemof.tabular.datapackage import building
 from oemof.tools.economics import annuity
 
-from tools.helper import get_experiment_dirs, get_scenario_assumptions
+import aggregation
+import price_ensemble
+from tools.manifest import hash_object
+from tools.raw_cache import read_raw_column, write_atomically
+from tools.sequences import get_binary_path, get_sequence_format, write_sequences
+from tools.helper import get_experiment_dirs, get_scenario_assumptions, get_timestep_hours, \
+    get_horizon_years
 
 
-TIMEINDEX = pd.date_range('1/1/2017', periods=8760, freq='H')
+# Weather and price years of the raw data that are used if a scenario does
+# not set its own.
+DEFAULT_YEARS = [2017]
+
+# Sequences are kept in single precision, which halves their memory on
+# long horizons at fine resolution.
+SEQUENCE_DTYPE = 'float32'
+
+# Foreign keys of the elements to the buses and sequences, keyed by the kind
+# of reference as expected by `oemof.tabular` in `infer_metadata`.
+FOREIGN_KEYS = {
+    'bus': [
+        'heat-demand',
+        'heat-storage',
+        'heat-shortage',
+    ],
+    'profile': [
+        'heat-demand',
+    ],
+    'carrier_cost': [
+        'electricity-hp',
+        'electricity-respth',
+    ],
+    'marginal_cost': [
+        'gas-chp',
+    ],
+    'from_to_bus': [
+        'gas-hob',
+        'electricity-hp',
+        'electricity-respth',
+        'heat-distribution',
+    ],
+    'chp': [
+        'gas-chp',
+    ],
+}
+
+# Directory in the directory of the preprocessed datapackages that holds the
+# cached metadata templates.
+METADATA_CACHE_DIR_NAME = '.metadata'
+
+# Number of scenarios whose price profiles `preprocess_batch` holds in
+# memory at once.
+BATCH_CHUNK_SIZE = 1000
+
+# Settings that determine the timeindex of a scenario. Scenarios that agree
+# in them share their heat demand profile and standardised price profile.
+TIMEINDEX_SETTINGS = ['years', 'start', 'periods', 'resolution', 'debug']
+
+# Sequences whose peak period is kept when aggregating to representative periods.
+AGGREGATION_PEAK_COLUMNS = ['heat-demand-01']
+
+
+def get_raw_input_paths(raw_dir, years=DEFAULT_YEARS):
+    r"""
+    Returns the paths of the raw inputs that are used to build a scenario.
+
+    Parameters
+    ----------
+    raw_dir : str
+        Directory of the raw data.
+
+    years : list
+        Weather and price years.
+
+    Returns
+    -------
+    raw_input_paths : dict
+        Paths to the raw inputs. The heat demand and the electricity price
+        are lists with one file per year.
+    """
+    raw_input_paths = {
+        'base_scenario': os.path.join(raw_dir, 'base_scenario'),
+        'constants': os.path.join(raw_dir, 'constants.csv'),
+        'demand_heat': [
+            os.path.join(raw_dir, f'demand_heat_{year}.csv') for year in years
+        ],
+        'price_electricity_spot': [
+            os.path.join(raw_dir, f'price_electricity_spot_{year}.csv') for year in years
+        ],
+    }
+
+    return raw_input_paths
+
+
+def get_setting(scenario_assumptions, key):
+    r"""
+    Returns an optional setting of a scenario or None if it is missing or
+    empty.
+    """
+    value = scenario_assumptions.get(key)
+
+    if value is None or (np.isscalar(value) and pd.isna(value)) or value == '':
+        return None
+
+    return value
+
+
+def get_resolution(scenario_assumptions):
+    r"""
+    Returns the temporal resolution of a scenario as pandas offset alias,
+    e.g. '4H', or None for the resolution of the raw data.
+    """
+    return get_setting(scenario_assumptions, 'resolution')
+
+
+def get_years(scenario_assumptions):
+    r"""
+    Returns the weather and price years of a scenario. The column 'years'
+    of the scenario table lists them separated by commas, e.g. '2016,2017'.
+
+    Raises
+    ------
+    ValueError
+        If the years do not follow each other.
+    """
+    years = get_setting(scenario_assumptions, 'years')
+
+    if years is None:
+        return DEFAULT_YEARS
+
+    if isinstance(years, str):
+        years = years.split(',')
+
+    elif np.isscalar(years):
+        years = [years]
+
+    years = [int(float(year)) for year in years]
+
+    if years != list(range(years[0], years[0] + len(years))):
+        raise ValueError(f"The years {years} do not follow each other.")
+
+    return years
+
+
+def set_resolution(scenario_assumptions, resolution):
+    r"""
+    Sets the temporal resolution of all scenarios that do not define their
+    own.
+    """
+    scenario_assumptions = scenario_assumptions.copy()
+
+    if 'resolution' not in scenario_assumptions:
+        scenario_assumptions['resolution'] = np.nan
+
+    scenario_assumptions['resolution'] = scenario_assumptions['resolution'].fillna(resolution)
+
+    return scenario_assumptions
+
+
+def set_timeindex(scenario_assumptions, years=None, start=None, periods=None):
+    r"""
+    Sets the weather and price years, the start and the number of
+    timesteps of all scenarios that do not define their own. Settings that
+    are None are left as they are.
+    """
+    scenario_assumptions = scenario_assumptions.copy()
+
+    if years is not None:
+        years = ','.join(str(year) for year in years)
+
+    for key, value in {'years': years, 'start': start, 'periods': periods}.items():
+        if value is None:
+            continue
+
+        if key not in scenario_assumptions:
+            scenario_assumptions[key] = np.nan
+
+        scenario_assumptions[key] = scenario_assumptions[key].fillna(value)
+
+    return scenario_assumptions
+
+
+def read_raw_sequence(paths, years, column=None):
+    r"""
+    Reads a raw sequence of several years through the raw input cache and
+    concatenates the years.
+
+    The length of the timesteps is taken from the first two timestamps of
+    each file. Every year starts at 1 January and has all its timesteps,
+    i.e. 8784 hours in leap years. Rows beyond the end of the year are
+    ignored.
+
+    Parameters
+    ----------
+    paths : list
+        Paths of the raw files, one per year.
+
+    years : list
+        Years of the files.
+
+    column : str
+        Column of the sequence. If None, the sum of all columns is used.
+
+    Returns
+    -------
+    sequence : pd.Series
+        Sequence of all years with a regular timeindex.
+
+    Raises
+    ------
+    ValueError
+        If a file has fewer rows than its year has timesteps or the years
+        have different timesteps.
+    """
+    sequences = []
+    for path, year in zip(paths, years):
+        raw = read_raw_column(path, column)
+
+        step = pd.Series(pd.to_datetime(raw.index[:2])).diff().iloc[1]
+
+        timeindex = pd.date_range(f'{year}-01-01', f'{year + 1}-01-01', freq=step)[:-1]
+
+        if len(raw) < len(timeindex):
+            raise ValueError(
+                f"{path} has {len(raw)} rows, but the year {year} has {len(timeindex)}"
+                f" timesteps of {step}. Leap years need the values of 29 February."
+            )
+
+        sequences.append(pd.Series(
+            raw.values[:len(timeindex)].astype(SEQUENCE_DTYPE), index=timeindex
+        ))
+
+    if len({sequence.index.freq for sequence in sequences}) > 1:
+        raise ValueError(f"The files {paths} have different timesteps.")
+
+    sequence = pd.concat(sequences)
+
+    sequence.index = pd.date_range(
+        sequence.index[0], periods=len(sequence), freq=sequences[0].index.freq, name='timeindex'
+    )
+
+    return sequence
+
+
+def get_timeindex(scenario_assumptions, raw_timeindex):
+    r"""
+    Returns the timeindex of a scenario. It starts at the setting 'start'
+    or at the start of the raw data and has 'periods' timesteps of the
+    resolution. Without 'periods', it covers the raw data. In debug mode,
+    it has 3 timesteps. Like on every horizon, the annuities are scaled to
+    its length, so a debug run of 3 hours bears 3 hours' worth of the
+    yearly capital costs.
+
+    Raises
+    ------
+    ValueError
+        If the raw data does not cover the timeindex.
+    """
+    freq = get_resolution(scenario_assumptions) or raw_timeindex.freq
+
+    start = get_setting(scenario_assumptions, 'start')
+    start = raw_timeindex[0] if start is None else pd.Timestamp(start)
+
+    periods = get_setting(scenario_assumptions, 'periods')
+    if scenario_assumptions['debug']:
+        periods = 3
+
+    raw_end = raw_timeindex[-1] + raw_timeindex.freq
+
+    if periods is None:
+        timeindex = pd.date_range(start, raw_end, freq=freq, name='timeindex')
+
+        # Keep the timesteps that end within the raw data.
+        timeindex = timeindex[:(timeindex + timeindex.freq <= raw_end).sum()]
+
+    else:
+        timeindex = pd.date_range(start, periods=int(periods), freq=freq, name='timeindex')
+
+    if timeindex.empty or start < raw_timeindex[0] or timeindex[-1] + timeindex.freq > raw_end:
+        raise ValueError(
+            f"The raw data from {raw_timeindex[0]} to {raw_end} does not cover the"
+            f" timeindex from {start} with {periods} timesteps of {freq}."
+        )
+
+    return timeindex
+
+
+def cut_to_timeindex(sequence, timeindex):
+    r"""
+    Returns the values of a sequence whose timesteps overlap the timeindex.
+    """
+    end = timeindex[-1] + timeindex.freq
+
+    first = sequence.index.searchsorted(timeindex[0], side='right') - 1
+    last = sequence.index.searchsorted(end, side='left')
+
+    return sequence.iloc[max(first, 0):last]
+
+
+def to_timeindex(sequence, timeindex):
+    r"""
+    Brings a sequence to the timesteps of a timeindex. If these are longer
+    than those of the sequence, the values within each of them are
+    averaged. If they are shorter, the values are repeated.
+    """
+    sequence = cut_to_timeindex(sequence, timeindex)
+
+    if get_timestep_hours(timeindex) > get_timestep_hours(sequence.index):
+        # Position of the timestep that each value falls into.
+        position = timeindex.get_indexer(sequence.index, method='ffill')
+
+        sequence = sequence.loc[position >= 0].groupby(position[position >= 0]).mean()
+
+        sequence.index = timeindex[sequence.index]
+
+    sequence = sequence.reindex(timeindex, method='ffill')
+
+    return sequence.astype(SEQUENCE_DTYPE)
+
+
+def link_or_copy(source, destination):
+    r"""
+    Hardlinks a file or copies it if the file system does not support
+    hardlinks.
+    """
+    try:
+        os.link(source, destination)
+
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def link_sequences(source, destination):
+    r"""
+    Links a sequences resource and its binary file, if it has one, into
+    another datapackage.
+    """
+    link_or_copy(source, destination)
+
+    if os.path.exists(get_binary_path(source)):
+        os.makedirs(os.path.dirname(get_binary_path(destination)), exist_ok=True)
+
+        link_or_copy(get_binary_path(source), get_binary_path(destination))
 
 
 def copy_base_scenario(source, destination):
+    r"""
+    Lays out the datapackage of a scenario over the base scenario. Its
+    files are hardlinked, so that they are stored only once for all
+    scenarios and the datapackage reads like a full copy. A scenario
+    replaces the files that it changes with `save_elements`.
+    """
     if os.path.exists(destination):
         shutil.rmtree(destination)
 
-    shutil.copytree(source, destination)
+    shutil.copytree(source, destination, copy_function=link_or_copy)
 
 
 def get_elements(dir):
@@ -38,9 +388,59 @@ def get_elements(dir):
 def save_elements(elements, dir):
     for key, value in elements.items():
         filename = os.path.join(dir, key + '.csv')
+
+        # The file may be a hardlink to the base scenario, which must not
+        # be written through.
+        if os.path.exists(filename):
+            os.remove(filename)
+
         value.to_csv(filename, sep=';')
 
 
+class ElementSession:
+    r"""
+    Elements of a datapackage that are read once, changed in memory and
+    written once. Only the files of changed elements are written.
+
+    Attributes
+    ----------
+    elements : dict
+        Elements as read by `get_elements`.
+
+    changed : set
+        Keys of the elements that have been changed.
+    """
+    def __init__(self, elements_dir, elements=None):
+        self.elements_dir = elements_dir
+        self.elements = get_elements(elements_dir) if elements is None else dict(elements)
+        self.changed = set()
+
+    def get(self, element):
+        r"""
+        Returns an element to change it and marks it as changed. The element
+        is copied on the first change, so that elements passed in by the
+        caller stay unchanged.
+        """
+        if element not in self.changed:
+            self.elements[element] = self.elements[element].copy()
+            self.changed.add(element)
+
+        return self.elements[element]
+
+    def set_params(self, element, **params):
+        r"""Sets parameters of an element."""
+        df = self.get(element)
+
+        for key, param in params.items():
+            df[key] = param
+
+    def save(self):
+        r"""Writes the changed elements."""
+        save_elements({key: self.elements[key] for key in sorted(self.changed)}, self.elements_dir)
+
+        self.changed = set()
+
+
 def get_constants(raw_dir):
     constants = pd.read_csv(os.path.join(raw_dir, 'constants.csv'), index_col=[0, 1])['var_value']
 
@@ -49,61 +449,213 @@ def get_constants(raw_dir):
     return constants
 
 
-def set_gas_price(gas_price, elements_dir):
-    elements = get_elements(elements_dir)
+def set_gas_price(gas_price, session):
+    session.set_params('gas-chp', carrier_cost=gas_price)
 
-    elements['gas-chp']['carrier_cost'] = gas_price
+    session.set_params('gas-hob', carrier_cost=gas_price)
 
-    elements['gas-hob']['carrier_cost'] = gas_price
 
-    save_elements(elements, elements_dir)
+def calculate_ep_costs(constants, scenario_assumptions):
+    r"""
+    Calculates the equivalent periodical costs, i.e. annuity and fixed
+    operation and maintenance costs, of all technologies for a table of
+    scenarios at once. The overnight cost of the heat pump is that of the
+    scenario. The annuity is linear in the overnight cost, so its factor is
+    calculated once per technology.
 
+    Parameters
+    ----------
+    constants : pd.Series
+        Constants as read by `get_constants`.
 
-def calculate_fix_cost(constants):
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
 
-    def get_ep_cost(df):
-        overnight_cost = df['overnight_cost']
-        lifetime = df['lifetime']
-        wacc = df['wacc']
-        fix_om = df['fix_om']
+    Returns
+    -------
+    ep_costs : pd.DataFrame
+        Equivalent periodical costs with one row per scenario and one column
+        per technology.
+    """
+    wacc = constants['all', 'wacc']
 
-        ep_cost = annuity(overnight_cost, lifetime, wacc) \
-                  + overnight_cost * fix_om
+    fix_cost_data = constants.drop(('all', 'wacc')).unstack(1)
 
-        return ep_cost
+    annuity_factor = pd.Series({
+        tech: annuity(1, lifetime, wacc) for tech, lifetime in fix_cost_data['lifetime'].items()
+    })
 
-    wacc = constants['all', 'wacc']
+    overnight_cost = pd.DataFrame(
+        np.tile(fix_cost_data['overnight_cost'].values, (len(scenario_assumptions), 1)),
+        index=scenario_assumptions.index,
+        columns=fix_cost_data.index,
+    )
 
-    fix_cost_data = constants.drop(('all', 'wacc')).unstack(1)
+    overnight_cost['electricity-hp'] = scenario_assumptions['overnight_cost_heat_pump'].values
+
+    return overnight_cost * (annuity_factor + fix_cost_data['fix_om'])
+
+
+def set_scenario_elements(session, scenario_assumptions, ep_cost, timestep_hours):
+    r"""
+    Sets the gas price, the heat pump and the costs of the expandable
+    technologies of a scenario and adapts the storage losses to the
+    timestep.
+
+    Parameters
+    ----------
+    session : ElementSession
+        Elements of the datapackage.
+
+    scenario_assumptions : dict-like
+        Assumptions of the scenario.
+
+    ep_cost : pd.Series
+        Equivalent periodical costs over the horizon keyed by technology.
+
+    timestep_hours : float
+        Length of the timesteps.
+    """
+    gas_price = scenario_assumptions['market_price_gas']\
+                + scenario_assumptions['charges_tax_levies_gas']
 
-    fix_cost_data['wacc'] = wacc
+    set_gas_price(gas_price, session)
 
-    fix_cost_data['ep_cost'] = fix_cost_data.apply(get_ep_cost, 1)
+    session.set_params(
+        'electricity-hp',
+        capacity_cost=ep_cost['electricity-hp'],
+        efficiency=scenario_assumptions['cop_heat_pump'],
+    )
 
-    return fix_cost_data
+    session.set_params(
+        'electricity-respth',
+        capacity_cost=ep_cost['electricity-respth']
+    )
 
+    session.set_params(
+        'heat-storage',
+        storage_capacity_cost=list(ep_cost[['heat_central-storage', 'heat_decentral-storage']])
+    )
 
-def set_element_params(elements_dir, element, **params):
-    elements = get_elements(elements_dir)
+    if timestep_hours != 1:
+        adapt_loss_rate(session, timestep_hours)
 
-    for key, param in params.items():
-        elements[element][key] = param
 
-    save_elements(elements, elements_dir)
+def adapt_loss_rate(session, timestep_hours):
+    r"""
+    Converts the hourly loss rates of the storages to loss rates per
+    timestep.
+    """
+    storage = session.get('heat-storage')
+
+    storage['loss_rate'] = 1 - (1 - storage['loss_rate']) ** timestep_hours
+
+
+def standardise(timeseries):
+    r"""
+    Shifts and scales a timeseries to mean 0 and standard deviation 1.
+    """
+    standardised = timeseries.copy()
+
+    standardised -= np.mean(standardised)
+
+    standardised *= 1/np.std(standardised)
+
+    return standardised
+
+
+def get_standardised_price(raw_price, timeindex):
+    r"""
+    Standardises the spot price on the horizon of a timeindex at the
+    resolution of the raw data and brings it to the timeindex.
+    """
+    return to_timeindex(standardise(cut_to_timeindex(raw_price, timeindex)), timeindex)
+
+
+def get_price_profiles(
+    standardised_price, market_price_el, standard_dev_el, chp_surcharge, charges_tax_levies_el
+):
+    r"""
+    Returns the marginal cost profile of selling and the carrier cost
+    profile of buying electricity. The standardised price is scaled to the
+    standard deviation and shifted to the mean of the market price.
+
+    The profiles are calculated in double precision and stored as
+    SEQUENCE_DTYPE. The arguments may be arrays with one row per scenario,
+    so that `preprocess` and `preprocess_batch` yield the same values.
+    """
+    standardised_price = np.asarray(standardised_price, dtype=float)
+
+    base_cost_profile = (
+        np.asarray(market_price_el, dtype=float)
+        + np.asarray(standard_dev_el, dtype=float) * standardised_price
+    )
+
+    marginal_cost_profile = -(base_cost_profile + np.asarray(chp_surcharge, dtype=float))
+
+    carrier_cost_profile = base_cost_profile + np.asarray(charges_tax_levies_el, dtype=float)
+
+    return (
+        marginal_cost_profile.astype(SEQUENCE_DTYPE),
+        carrier_cost_profile.astype(SEQUENCE_DTYPE),
+    )
+
 
+def save_sequence(sequence, destination, name, sequence_format=None):
+    write_sequences(sequence, os.path.join(destination, name), sequence_format)
 
-def adapt_mean_and_variance(timeseries, mean, standard_deviation):
-    adapted_ts = timeseries.copy()
 
-    adapted_ts -= np.mean(adapted_ts)
+def get_member_prices(scenario_assumptions, raw_price, timeindex):
+    r"""
+    Resamples the spot price on the horizon of a timeindex for the members
+    of price ensembles in a table of scenarios. The members of the same
+    ensemble are resampled in one pass. Every price is standardised by
+    itself with `standardise`.
 
-    adapted_ts *= 1/np.std(adapted_ts)
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
 
-    adapted_ts *= standard_deviation
+    raw_price : pd.Series
+        Spot price of the raw data.
 
-    adapted_ts += mean
+    timeindex : pd.DatetimeIndex
+        Timeindex of the scenarios.
 
-    return adapted_ts
+    Returns
+    -------
+    member_prices : pd.DataFrame
+        Standardised prices at the resolution of the raw data with one
+        column per member, named by the index of its row.
+    """
+    raw_price = cut_to_timeindex(raw_price, timeindex)
+
+    members = scenario_assumptions.loc[price_ensemble.is_member(scenario_assumptions)]
+
+    # Tables without ensemble have no columns of the ensemble.
+    if members.empty:
+        return pd.DataFrame(index=raw_price.index)
+
+    member_prices = []
+    for (resampling, block_length, seed), rows in members.groupby(
+        ['price_resampling', 'price_block_length', 'price_seed'], sort=False
+    ):
+        numbers = rows['price_member'].astype(int)
+
+        resampled = price_ensemble.resample_sequence(
+            raw_price, numbers.unique().tolist(), resampling, block_length, seed
+        )[numbers]
+
+        member_prices.append(pd.DataFrame(
+            {
+                index: standardise(resampled[number]).values
+                for index, number in zip(rows.index, numbers)
+            },
+            index=raw_price.index,
+        ))
+
+    return pd.concat(member_prices, axis=1)
 
 
 def prepare_electricity_price_profiles(
@@ -111,156 +663,474 @@ def prepare_electricity_price_profiles(
     charges_tax_levies_el,
     standard_dev_el,
     chp_surcharge,
-    raw_price,
+    standardised_price,
     destination,
-    timeindex=TIMEINDEX
 ):
-    def save(df, name):
-        df.to_csv(os.path.join(destination, name), header=True)
-
-    raw_price = pd.read_csv(raw_price, index_col=0)
+    # The mean and variance are set for the prices of the raw data. At a
+    # coarser resolution, the price of a timestep is the mean of its values.
+    marginal_cost_profile, carrier_cost_profile = get_price_profiles(
+        standardised_price, market_price_el, standard_dev_el, chp_surcharge,
+        charges_tax_levies_el,
+    )
 
-    base_cost_profile = raw_price['price_electricity_spot']
-    base_cost_profile = base_cost_profile.iloc[:len(timeindex)]
-    base_cost_profile.index = timeindex
-    base_cost_profile.index.name = 'timeindex'
+    marginal_cost_profile = pd.Series(
+        marginal_cost_profile, index=standardised_price.index, name='electricity-selling'
+    )
+    save_sequence(marginal_cost_profile, destination, 'marginal_cost_profile.csv')
 
-    base_cost_profile = adapt_mean_and_variance(
-        base_cost_profile,
-        market_price_el,
-        standard_dev_el,
+    carrier_cost_profile = pd.Series(
+        carrier_cost_profile, index=standardised_price.index, name='electricity-buying'
     )
+    save_sequence(carrier_cost_profile, destination, 'carrier_cost_profile.csv')
 
-    marginal_cost_profile = base_cost_profile.copy()
-    marginal_cost_profile += chp_surcharge
-    marginal_cost_profile *= -1
-    marginal_cost_profile.name = 'electricity-selling'
-    save(marginal_cost_profile, 'marginal_cost_profile.csv')
+    return marginal_cost_profile, carrier_cost_profile
 
-    carrier_cost_profile = base_cost_profile.copy()
-    carrier_cost_profile += charges_tax_levies_el
-    carrier_cost_profile.name = 'electricity-buying'
-    save(carrier_cost_profile, 'carrier_cost_profile.csv')
 
+def prepare_heat_demand_profile(heat_demand_profile, destination, timeindex):
+    # The demand is a power. Its mean over the values of a timestep keeps the
+    # energy if it is multiplied by the length of the timestep.
+    heat_demand_profile = to_timeindex(heat_demand_profile, timeindex)
+    heat_demand_profile.name = 'heat-demand-01'
 
-def prepare_heat_demand_profile(heat_demand_profile, destination, timeindex=TIMEINDEX):
-    def save(df, name):
-        df.to_csv(os.path.join(destination, name), header=True)
+    save_sequence(heat_demand_profile, destination, 'heat-demand_profile.csv')
 
-    heat_demand_profile = pd.read_csv(heat_demand_profile, index_col='timestamp')
-    heat_demand_profile = heat_demand_profile.sum(axis=1)
-    heat_demand_profile = heat_demand_profile.iloc[:len(timeindex)]
-    heat_demand_profile.index = timeindex
-    heat_demand_profile.index.name = 'timeindex'
-    heat_demand_profile.name = 'heat-demand-01'
+    return heat_demand_profile
+
+
+def get_value_kind(value):
+    r"""
+    Returns 'integer' or 'number' for numeric values and the value itself
+    otherwise.
+    """
+    if re.fullmatch(r'[+-]?\d+', value):
+        return 'integer'
+
+    try:
+        float(value)
+        return 'number'
+
+    except ValueError:
+        return value
+
+
+def get_structure(preprocessed):
+    r"""
+    Describes everything the inferred metadata of a datapackage depends on:
+    its files, their fields and the kind of every value of the elements.
+    Numbers are reduced to their kind, so that scenarios that only differ
+    in their parameters have the same structure. The sequences only hold
+    numbers written by pandas, so only their fields are read.
+    """
+    structure = [oemof.tabular.__version__, FOREIGN_KEYS]
+
+    for resource_type, delimiter in [('elements', ';'), ('sequences', ',')]:
+        dir = os.path.join(preprocessed, 'data', resource_type)
 
-    save(heat_demand_profile, 'heat-demand_profile.csv')
+        for file in sorted(os.listdir(dir)):
+            with open(os.path.join(dir, file), newline='') as f:
+                rows = csv.reader(f, delimiter=delimiter)
+
+                header = next(rows)
+
+                kinds = [[get_value_kind(value) for value in row] for row in rows] \
+                    if resource_type == 'elements' else []
+
+            structure.append([resource_type, file, header, kinds])
+
+    return structure
 
 
 def infer_metadata(name, preprocessed):
-    r"""Infer the metadata of the datapackage"""
+    r"""
+    Infer the metadata of the datapackage.
+
+    Inferring the schemas reads all files of the datapackage, but gives the
+    same metadata for every datapackage of the same structure. The
+    inferred datapackage.json is therefore kept as template keyed by the
+    structure and copied to all later datapackages with that structure.
+    """
+    structure_hash = hash_object([name, get_structure(preprocessed)])
+
+    template = os.path.join(
+        get_experiment_dirs()['preprocessed'], METADATA_CACHE_DIR_NAME, structure_hash + '.json'
+    )
+
+    destination = os.path.join(preprocessed, 'datapackage.json')
+
+    if os.path.exists(destination):
+        os.remove(destination)
+
+    if os.path.exists(template):
+        logging.info("Copying the metadata of the datapackage from its template")
+        shutil.copyfile(template, destination)
+        return
+
     logging.info("Inferring the metadata of the datapackage")
     building.infer_metadata(
         package_name=name,
-        foreign_keys={
-            'bus': [
-                'heat-demand',
-                'heat-storage',
-                'heat-shortage',
-            ],
-            'profile': [
-                'heat-demand',
-            ],
-            'carrier_cost': [
-                'electricity-hp',
-                'electricity-respth',
-            ],
-            'marginal_cost': [
-                'gas-chp',
-            ],
-            'from_to_bus': [
-                'gas-hob',
-                'electricity-hp',
-                'electricity-respth',
-                'heat-distribution',
-            ],
-            'chp': [
-                'gas-chp',
-            ],
-        },
+        foreign_keys=FOREIGN_KEYS,
         path=preprocessed
     )
 
+    os.makedirs(os.path.dirname(template), exist_ok=True)
 
-def main(**scenario_assumptions):
-    print('Preprocessing')
+    with open(destination, 'rb') as f:
+        metadata = f.read()
 
-    timeindex = TIMEINDEX
-    if scenario_assumptions['debug']:
-        timeindex = timeindex[:3]
+    write_atomically(template, lambda f: f.write(metadata))
 
-    dirs = get_experiment_dirs(scenario_assumptions['scenario'])
-    elements_dir = os.path.join(dirs['preprocessed'], 'data', 'elements')
 
-    copy_base_scenario(
-        os.path.join(dirs['raw'], 'base_scenario'),
-        os.path.join(dirs['preprocessed'])
-    )
+def finish_datapackage(scenario_assumptions, destination, timestep_hours):
+    r"""
+    Aggregates the datapackage of a scenario to representative periods if
+    the scenario asks for it and infers its metadata.
+    """
+    aggregation_settings = aggregation.get_aggregation_settings(scenario_assumptions)
+    if aggregation_settings is not None:
+        typical_periods, period_length = aggregation_settings
 
-    sequences_dir = os.path.join(dirs['preprocessed'], 'data', 'sequences')
-    if not os.path.exists(sequences_dir):
-        os.makedirs(sequences_dir)
+        # period length in timesteps of the resolution
+        period_length = int(period_length / timestep_hours)
 
-    gas_price = scenario_assumptions['market_price_gas']\
-                + scenario_assumptions['charges_tax_levies_gas']
+        aggregation.aggregate_datapackage(
+            destination, typical_periods, period_length, peak_columns=AGGREGATION_PEAK_COLUMNS
+        )
 
-    set_gas_price(gas_price, elements_dir)
+    infer_metadata('name', destination)
 
-    constants = get_constants(dirs['raw'])
 
-    params = constants.copy()
+def preprocess(scenario_assumptions, raw_dir, destination):
+    r"""
+    Builds the datapackage of a scenario from the base scenario and the
+    raw data.
 
-    params.loc['electricity-hp', 'overnight_cost'] = scenario_assumptions['overnight_cost_heat_pump']
+    Parameters
+    ----------
+    scenario_assumptions : dict-like
+        Assumptions of the scenario.
 
-    fix_cost_data = calculate_fix_cost(params)
+    raw_dir : str
+        Directory of the raw data.
 
-    set_element_params(
-        elements_dir,
-        'electricity-hp',
-        capacity_cost=fix_cost_data.loc['electricity-hp', 'ep_cost'],
-        efficiency=scenario_assumptions['cop_heat_pump'],
-    )
+    destination : str
+        Directory to write the datapackage to.
 
-    set_element_params(
-        elements_dir,
-        'electricity-respth',
-        capacity_cost=fix_cost_data.loc['electricity-respth', 'ep_cost']
+    Returns
+    -------
+    sequences : dict
+        The sequences of the datapackage keyed by the name of their file.
+        If the scenario is aggregated, these are the sequences of the full
+        horizon before aggregation.
+    """
+    years = get_years(scenario_assumptions)
+
+    raw_input_paths = get_raw_input_paths(raw_dir, years)
+
+    raw_heat_demand = read_raw_sequence(raw_input_paths['demand_heat'], years)
+
+    raw_price = read_raw_sequence(
+        raw_input_paths['price_electricity_spot'], years, column='price_electricity_spot'
     )
 
-    set_element_params(
-        elements_dir,
-        'heat-storage',
-        storage_capacity_cost=list(fix_cost_data.loc[
-        ['heat_central-storage', 'heat_decentral-storage'], 'ep_cost'])
+    timeindex = get_timeindex(scenario_assumptions, raw_heat_demand.index)
+
+    # A member of a price ensemble replaces the spot price by its synthetic
+    # price year.
+    if not pd.isna(scenario_assumptions.get('price_member', np.nan)):
+        standardised_price = to_timeindex(get_member_prices(
+            pd.DataFrame([scenario_assumptions]), raw_price, timeindex
+        ), timeindex).iloc[:, 0]
+
+    else:
+        standardised_price = get_standardised_price(raw_price, timeindex)
+
+    timestep_hours = get_timestep_hours(timeindex)
+
+    elements_dir = os.path.join(destination, 'data', 'elements')
+
+    copy_base_scenario(
+        raw_input_paths['base_scenario'],
+        destination
     )
 
-    prepare_heat_demand_profile(
-        os.path.join(dirs['raw'], 'demand_heat_2017.csv'),
-        os.path.join(dirs['preprocessed'], 'data', 'sequences'),
-        timeindex=timeindex
+    sequences_dir = os.path.join(destination, 'data', 'sequences')
+    if not os.path.exists(sequences_dir):
+        os.makedirs(sequences_dir)
+
+    ep_cost = calculate_ep_costs(
+        get_constants(raw_dir), pd.DataFrame([scenario_assumptions])
+    ).iloc[0]
+
+    # The annuities are yearly costs. The horizon can be shorter or longer
+    # than a year, e.g. if several weather years are concatenated.
+    ep_cost *= get_horizon_years(timeindex)
+
+    # All changes of the elements are collected and written at once.
+    session = ElementSession(elements_dir)
+
+    set_scenario_elements(session, scenario_assumptions, ep_cost, timestep_hours)
+
+    session.save()
+
+    heat_demand_profile = prepare_heat_demand_profile(
+        raw_heat_demand,
+        os.path.join(destination, 'data', 'sequences'),
+        timeindex,
     )
 
-    prepare_electricity_price_profiles(
+    marginal_cost_profile, carrier_cost_profile = prepare_electricity_price_profiles(
         scenario_assumptions['market_price_el'],
         scenario_assumptions['charges_tax_levies_el'],
         scenario_assumptions['standard_dev_el'],
         scenario_assumptions['chp_surcharge'],
-        os.path.join(dirs['raw'], 'price_electricity_spot_2017.csv'),
-        os.path.join(dirs['preprocessed'], 'data', 'sequences'),
-        timeindex=timeindex
+        standardised_price,
+        os.path.join(destination, 'data', 'sequences'),
+    )
+
+    finish_datapackage(scenario_assumptions, destination, timestep_hours)
+
+    sequences = {
+        'heat-demand_profile': heat_demand_profile,
+        'marginal_cost_profile': marginal_cost_profile,
+        'carrier_cost_profile': carrier_cost_profile,
+    }
+
+    return sequences
+
+
+def get_timeindex_key(scenario_assumptions):
+    r"""
+    Returns the settings that determine the timeindex of a scenario.
+    """
+    return tuple(
+        str(get_setting(scenario_assumptions, key)) for key in TIMEINDEX_SETTINGS
+    )
+
+
+def preprocess_group(
+    group, raw_dir, destinations, master_dir, base_elements, ep_costs, sequence_format,
+    chunk_size=BATCH_CHUNK_SIZE,
+):
+    r"""
+    Builds the datapackages of a group of scenarios with the same timeindex
+    for `preprocess_batch`.
+
+    Parameters
+    ----------
+    group : pd.DataFrame
+        Scenarios of the group.
+
+    raw_dir : str
+        Directory of the raw data.
+
+    destinations : dict
+        Directories to write the datapackages to keyed by scenario.
+
+    master_dir : str
+        Directory on the file system of the datapackages for the master
+        file of the heat demand profile.
+
+    base_elements : dict
+        Elements of the base scenario.
+
+    ep_costs : pd.DataFrame
+        Yearly investment costs of the scenarios.
+
+    sequence_format : str
+        'csv' or 'npz'.
+
+    chunk_size : int
+        Number of scenarios whose price profiles are held in memory at once.
+
+    Returns
+    -------
+    failed : dict
+        Tracebacks of the scenarios that failed keyed by scenario.
+    """
+    failed = {}
+
+    first = group.iloc[0]
+
+    years = get_years(first)
+
+    raw_input_paths = get_raw_input_paths(raw_dir, years)
+
+    raw_heat_demand = read_raw_sequence(raw_input_paths['demand_heat'], years)
+
+    raw_price = read_raw_sequence(
+        raw_input_paths['price_electricity_spot'], years, column='price_electricity_spot'
+    )
+
+    timeindex = get_timeindex(first, raw_heat_demand.index)
+
+    timestep_hours = get_timestep_hours(timeindex)
+
+    heat_demand_profile = to_timeindex(raw_heat_demand, timeindex)
+    heat_demand_profile.name = 'heat-demand-01'
+
+    heat_demand_file = os.path.join(master_dir, 'heat-demand_profile.csv')
+
+    save_sequence(heat_demand_profile, master_dir, 'heat-demand_profile.csv', sequence_format)
+
+    standardised_price = get_standardised_price(raw_price, timeindex).values
+
+    # The synthetic price years of all members of price ensembles in the
+    # group are drawn from the raw price read above.
+    member_prices = to_timeindex(get_member_prices(group, raw_price, timeindex), timeindex)
+
+    group_ep_costs = ep_costs.loc[group.index] * get_horizon_years(timeindex)
+
+    logging.info(f"Preprocessing {len(group)} scenarios on {len(timeindex)} timesteps")
+
+    for chunk_start in range(0, len(group), chunk_size):
+        chunk = group.iloc[chunk_start:chunk_start + chunk_size]
+
+        def column(name):
+            return chunk[name].values.astype(float)[:, np.newaxis]
+
+        standardised_prices = standardised_price
+
+        chunk_members = chunk.index.intersection(member_prices.columns)
+        if len(chunk_members):
+            standardised_prices = np.tile(standardised_price, (len(chunk), 1))
+            standardised_prices[chunk.index.get_indexer(chunk_members)] = \
+                member_prices[chunk_members].values.T
+
+        marginal_cost_profiles, carrier_cost_profiles = get_price_profiles(
+            standardised_prices,
+            column('market_price_el'),
+            column('standard_dev_el'),
+            column('chp_surcharge'),
+            column('charges_tax_levies_el'),
+        )
+
+        for i, (index, row) in enumerate(chunk.iterrows()):
+            scenario = row['scenario']
+            destination = destinations[scenario]
+
+            try:
+                copy_base_scenario(raw_input_paths['base_scenario'], destination)
+
+                sequences_dir = os.path.join(destination, 'data', 'sequences')
+                os.makedirs(sequences_dir, exist_ok=True)
+
+                session = ElementSession(
+                    os.path.join(destination, 'data', 'elements'), elements=base_elements
+                )
+
+                set_scenario_elements(session, row, group_ep_costs.loc[index], timestep_hours)
+
+                session.save()
+
+                link_sequences(
+                    heat_demand_file, os.path.join(sequences_dir, 'heat-demand_profile.csv')
+                )
+
+                for name, profiles, file in [
+                    ('electricity-selling', marginal_cost_profiles, 'marginal_cost_profile.csv'),
+                    ('electricity-buying', carrier_cost_profiles, 'carrier_cost_profile.csv'),
+                ]:
+                    profile = pd.Series(profiles[i], index=timeindex, name=name)
+                    save_sequence(profile, sequences_dir, file, sequence_format)
+
+                finish_datapackage(row, destination, timestep_hours)
+
+            except Exception:
+                logging.exception(f"Preprocessing scenario '{scenario}' failed")
+
+                failed[scenario] = traceback.format_exc()
+
+    return failed
+
+
+def preprocess_batch(scenario_assumptions, raw_dir, destinations, chunk_size=BATCH_CHUNK_SIZE):
+    r"""
+    Builds the datapackages of a table of scenarios in one pass. The result
+    is the same as of `preprocess` for every scenario.
+
+    The raw data, the constants and the base elements are read once. The
+    scenarios are grouped by their timeindex. Per group, the heat demand
+    profile is written once to a master file next to the datapackages and
+    hardlinked into them, so that aggregating one datapackage to
+    representative periods leaves the others untouched. Likewise per group,
+    the spot price is standardised once. The synthetic price years of the
+    members of price ensembles in a group are resampled from it in one
+    pass. The price profiles of all scenarios of a group are then
+    calculated as one array with one row per scenario in chunks of
+    `chunk_size` scenarios.
+
+    If a group fails as a whole, e.g. because its timeindex is not covered
+    by the raw data, all of its scenarios fail and the other groups are
+    preprocessed nevertheless.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    raw_dir : str
+        Directory of the raw data.
+
+    destinations : dict
+        Directories to write the datapackages to keyed by scenario.
+
+    chunk_size : int
+        Number of scenarios whose price profiles are held in memory at once.
+
+    Returns
+    -------
+    failed : dict
+        Tracebacks of the scenarios that failed keyed by scenario.
+    """
+    raw_input_paths = get_raw_input_paths(raw_dir)
+
+    constants = get_constants(raw_dir)
+
+    base_elements = get_elements(os.path.join(raw_input_paths['base_scenario'], 'data', 'elements'))
+
+    ep_costs = calculate_ep_costs(constants, scenario_assumptions)
+
+    sequence_format = get_sequence_format()
+
+    failed = {}
+
+    timeindex_keys = pd.Series(
+        [get_timeindex_key(row) for _, row in scenario_assumptions.iterrows()],
+        index=scenario_assumptions.index,
     )
 
-    infer_metadata('name', dirs['preprocessed'])
+    groups = scenario_assumptions.groupby(timeindex_keys, sort=False)
+
+    for _, group in groups:
+        try:
+            # The master file is on the file system of the datapackages, so
+            # that it can be hardlinked into them.
+            parent_dir = os.path.dirname(destinations[group['scenario'].iloc[0]])
+            os.makedirs(parent_dir, exist_ok=True)
+
+            with tempfile.TemporaryDirectory(prefix='.heat-demand-', dir=parent_dir) as master_dir:
+                failed.update(preprocess_group(
+                    group, raw_dir, destinations, master_dir, base_elements, ep_costs,
+                    sequence_format, chunk_size,
+                ))
+
+        except Exception:
+            logging.exception(f"Preprocessing the scenarios {list(group['scenario'])} failed")
+
+            error = traceback.format_exc()
+
+            for scenario in group['scenario']:
+                failed.setdefault(scenario, error)
+
+    return failed
+
+
+def main(**scenario_assumptions):
+    print('Preprocessing')
+
+    dirs = get_experiment_dirs(scenario_assumptions['scenario'])
+
+    preprocess(scenario_assumptions, dirs['raw'], dirs['preprocessed'])
 
 
 if __name__ == '__main__':
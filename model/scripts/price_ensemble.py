@@ -0,0 +1,263 @@
+r"""
+Ensembles of synthetic electricity price years.
+
+The price profiles of a scenario are the raw spot price shifted and scaled
+to the mean and standard deviation of the scenario, so every scenario sees
+the same price shape. An ensemble solves a scenario additionally on a
+number of synthetic price years, its members, to show how much the results
+depend on that shape.
+
+The members are resampled from the raw price in blocks of whole days or
+weeks, which keeps the daily and weekly patterns within a block:
+* 'block_bootstrap' draws every block from all blocks of the horizon.
+* 'seasonal' draws every block from the blocks within `SEASON_BLOCKS`
+  blocks of its position, so that the seasonal pattern is kept as well.
+
+Every member has its own random generator seeded with the seed of the
+ensemble and the number of the member. A member is therefore the same
+whether it is resampled alone or together with others.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Assumptions of the ensemble. Members have the column 'price_member' in
+# addition.
+ENSEMBLE_COLUMNS = ['price_members', 'price_resampling', 'price_block_length', 'price_seed']
+
+RESAMPLING_METHODS = ['block_bootstrap', 'seasonal']
+
+# Members are named '<scenario><MEMBER_SUFFIX><member>'.
+MEMBER_SUFFIX = '-price-'
+
+# Number of blocks before and after its position that a block is drawn from
+# with the resampling 'seasonal'.
+SEASON_BLOCKS = 2
+
+
+def set_price_ensemble(
+    scenario_assumptions, members, resampling='block_bootstrap', block_length=168, seed=0
+):
+    r"""
+    Sets the ensemble of all scenarios that do not define their own and adds
+    the members of the scenarios with an ensemble.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    members : int
+        Number of synthetic price years per scenario.
+
+    resampling : str
+        'block_bootstrap' or 'seasonal'.
+
+    block_length : int
+        Length of the resampled blocks in hours.
+
+    seed : int
+        Seed of the ensemble.
+
+    Returns
+    -------
+    scenario_assumptions : pd.DataFrame
+        Scenario table with the columns of the ensemble and the members.
+    """
+    scenario_assumptions = scenario_assumptions.copy()
+
+    for column, default in zip(ENSEMBLE_COLUMNS, [members, resampling, block_length, seed]):
+        if column not in scenario_assumptions:
+            scenario_assumptions[column] = np.nan
+
+        scenario_assumptions[column] = scenario_assumptions[column].fillna(default)
+
+    scenario_assumptions['price_member'] = np.nan
+
+    has_ensemble = scenario_assumptions['price_members'].fillna(0).astype(int) > 0
+
+    members = []
+    for _, row in scenario_assumptions.loc[has_ensemble].iterrows():
+        for member in range(int(row['price_members'])):
+            member_row = row.copy()
+            member_row['scenario'] = f"{row['scenario']}{MEMBER_SUFFIX}{member}"
+            member_row['price_member'] = member
+
+            members.append(member_row)
+
+    return pd.concat([scenario_assumptions, pd.DataFrame(members)], ignore_index=True)
+
+
+def is_member(scenario_assumptions):
+    r"""
+    Returns whether the scenarios of a table are members of an ensemble.
+    """
+    if 'price_member' not in scenario_assumptions:
+        return pd.Series(False, index=scenario_assumptions.index)
+
+    return scenario_assumptions['price_member'].notna()
+
+
+def get_base_scenario(scenario):
+    r"""
+    Returns the name of the scenario that a member belongs to.
+    """
+    return scenario.rsplit(MEMBER_SUFFIX, 1)[0]
+
+
+def get_block_indices(n_timesteps, block_length, members, resampling='block_bootstrap', seed=0):
+    r"""
+    Draws the positions of the timesteps of the members in the resampled
+    sequence.
+
+    Parameters
+    ----------
+    n_timesteps : int
+        Length of the sequence.
+
+    block_length : int
+        Length of the blocks in timesteps.
+
+    members : list
+        Numbers of the members.
+
+    resampling : str
+        'block_bootstrap' or 'seasonal'.
+
+    seed : int
+        Seed of the ensemble.
+
+    Returns
+    -------
+    indices : np.ndarray
+        Positions with one row per member.
+    """
+    if resampling not in RESAMPLING_METHODS:
+        raise ValueError(
+            f"Unknown resampling '{resampling}'. Choose one of {RESAMPLING_METHODS}."
+        )
+
+    n_blocks = n_timesteps // block_length
+
+    if n_blocks < 2:
+        raise ValueError(
+            f"A sequence of {n_timesteps} timesteps has less than two blocks of"
+            f" {block_length} timesteps to resample."
+        )
+
+    # Blocks that cover the sequence. The last one is cut to its end.
+    n_draws = -(-n_timesteps // block_length)
+
+    draws = np.empty((len(members), n_draws), dtype=int)
+    for i, member in enumerate(members):
+        rng = np.random.default_rng([int(seed), int(member)])
+
+        if resampling == 'block_bootstrap':
+            draws[i] = rng.integers(0, n_blocks, n_draws)
+
+        else:
+            # The blocks at the ends of the horizon draw from the other end,
+            # which is the same season for a horizon of whole years.
+            offset = rng.integers(-SEASON_BLOCKS, SEASON_BLOCKS + 1, n_draws)
+            draws[i] = (np.arange(n_draws) + offset) % n_blocks
+
+    indices = draws[:, :, np.newaxis] * block_length + np.arange(block_length)
+
+    return indices.reshape(len(members), -1)[:, :n_timesteps]
+
+
+def resample_sequence(sequence, members, resampling='block_bootstrap', block_length=168, seed=0):
+    r"""
+    Resamples a sequence for several members of an ensemble at once.
+
+    Parameters
+    ----------
+    sequence : pd.Series
+        Sequence with a regular timeindex.
+
+    members : list
+        Numbers of the members.
+
+    resampling : str
+        'block_bootstrap' or 'seasonal'.
+
+    block_length : float
+        Length of the blocks in hours.
+
+    seed : int
+        Seed of the ensemble.
+
+    Returns
+    -------
+    resampled : pd.DataFrame
+        Resampled sequences with the timeindex of the sequence and one
+        column per member.
+    """
+    step = sequence.index[1] - sequence.index[0]
+
+    block_timesteps = int(pd.Timedelta(hours=float(block_length)) / step)
+
+    if block_timesteps < 1:
+        raise ValueError(f"Blocks of {block_length} hours are shorter than a timestep.")
+
+    indices = get_block_indices(len(sequence), block_timesteps, members, resampling, seed)
+
+    return pd.DataFrame(sequence.values[indices].T, index=sequence.index, columns=members)
+
+
+def get_ensemble_statistics(
+    scenario_assumptions, scalars, kpis=('share_el_heat', 'spec_cost_of_heat')
+):
+    r"""
+    Describes the distribution of the results of the members of each
+    scenario with an ensemble.
+
+    Parameters
+    ----------
+    scenario_assumptions : pd.DataFrame
+        Scenario table.
+
+    scalars : dict
+        Scalar results as saved in scalars.csv keyed by scenario name.
+
+    kpis : list
+        Variables to describe.
+
+    Returns
+    -------
+    statistics : pd.DataFrame
+        Value on the raw price and number, mean, standard deviation,
+        minimum, 5th percentile, median, 95th percentile and maximum over
+        the members of each kpi for each scenario.
+    """
+    members = scenario_assumptions.loc[is_member(scenario_assumptions), 'scenario']
+
+    members = [member for member in members if member in scalars]
+
+    if not members:
+        return pd.DataFrame()
+
+    kpi_values = pd.DataFrame([
+        scalars[member].loc[scalars[member]['var_name'].isin(kpis)]
+        .set_index('var_name')['var_value']
+        .rename(member)
+        for member in members
+    ])
+
+    kpi_values.index.name = 'member'
+
+    kpi_values['scenario'] = [get_base_scenario(member) for member in members]
+
+    statistics = kpi_values.groupby('scenario')[list(kpis)].describe(percentiles=[0.05, 0.5, 0.95])
+
+    # Stacking sorts the statistics, which are put back into their order.
+    statistics = statistics.stack(0)[statistics.columns.unique(1)]
+    statistics.index.names = ['scenario', 'var_name']
+
+    statistics.insert(0, 'value', [
+        scalars[scenario].set_index('var_name').loc[var_name, 'var_value']
+        if scenario in scalars else np.nan
+        for scenario, var_name in statistics.index
+    ])
+
+    return statistics.reset_index()
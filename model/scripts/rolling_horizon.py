@@ -0,0 +1,412 @@
+r"""
+Rolling horizon optimisation.
+
+The year is solved in consecutive windows instead of one model over all
+timesteps, so that the size of the model does not grow with the length or
+resolution of the horizon. Each window looks ahead by an overlap whose
+dispatch is discarded. The storage levels at the end of the kept part of a
+window are the initial levels of the next one.
+
+Investments cannot be decided window by window. If the datapackage has
+expandable components, their capacities are first sized on representative
+periods of the whole year (see `aggregation.py`). The windows are then
+solved with these capacities fixed.
+
+The results of the windows are stitched into one EnergySystem built from
+the original datapackage, so that they are saved and postprocessed like the
+results of a single solve.
+"""
+import logging
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+from pyomo.environ import Constraint
+
+from oemof.solph.components import GenericStorage
+from oemof import outputlib
+
+from oemof.tabular.facades import TYPEMAP
+
+import aggregation
+import optimization
+import preprocessing
+from tools.sequences import from_datapackage, write_sequences
+
+
+def get_windows(n_timesteps, window, overlap=0):
+    r"""
+    Returns the start, the end of the kept part and the end of every
+    window.
+    """
+    return [
+        (start, min(start + window, n_timesteps), min(start + window + overlap, n_timesteps))
+        for start in range(0, n_timesteps, window)
+    ]
+
+
+def by_label(results):
+    r"""
+    Keys results by the labels of their nodes instead of the nodes.
+    """
+    return {
+        tuple(None if n is None else str(n) for n in k): v
+        for k, v in results.items()
+    }
+
+
+def get_invested_capacities(es):
+    r"""
+    Returns the invested capacities of an EnergySystem with results keyed
+    by the names of the elements and their capacity columns.
+
+    The capacity of a conversion is the capacity of its output, the
+    capacity of a storage is the capacity of its input.
+    """
+    capacities = {}
+    for (i, o), v in es.results.items():
+        invest = v['scalars'].get('invest')
+
+        if invest is None:
+            continue
+
+        if o is None:
+            capacities.setdefault(str(i), {})['storage_capacity'] = invest
+
+        elif isinstance(o, GenericStorage):
+            capacities.setdefault(str(o), {})['capacity'] = invest
+
+        elif not isinstance(i, GenericStorage):
+            capacities.setdefault(str(i), {})['capacity'] = invest
+
+    return capacities
+
+
+def fix_capacities(elements, capacities):
+    r"""
+    Adds the invested capacities to the existing capacities of the
+    expandable elements and makes them non-expandable.
+
+    Parameters
+    ----------
+    elements : dict
+        Elements of a datapackage as read by `preprocessing.get_elements`.
+
+    capacities : dict
+        Invested capacities as returned by :func:`get_invested_capacities`.
+
+    Returns
+    -------
+    elements : dict
+        Elements with fixed capacities.
+    """
+    fixed = {}
+    for key, df in elements.items():
+        df = df.copy()
+
+        if 'expandable' in df:
+            for name in df.index[df['expandable'].eq(True)]:
+                for column, invest in capacities.get(name, {}).items():
+                    df.loc[name, column] = df[column].fillna(0)[name] + invest
+
+                df.loc[name, 'expandable'] = False
+
+        fixed[key] = df
+
+    return fixed
+
+
+def size_capacities(input_data_dir, destination, typical_periods, period_length, solver='cbc',
+                    solver_options=None):
+    r"""
+    Sizes the capacities on representative periods of the datapackage.
+
+    Returns
+    -------
+    es : oemof.solph.EnergySystem
+        EnergySystem with the results of the sizing.
+    """
+    logging.info(f"Sizing the capacities on {typical_periods} representative periods")
+    shutil.copytree(input_data_dir, destination)
+
+    aggregation.aggregate_datapackage(
+        destination, typical_periods, period_length,
+        peak_columns=preprocessing.AGGREGATION_PEAK_COLUMNS,
+    )
+
+    return optimization.optimize(destination, solver=solver, solver_options=solver_options)
+
+
+def write_window(elements, sequences, destination, start, stop, storage_levels):
+    r"""
+    Writes the datapackage of a window with the given initial storage levels.
+
+    Parameters
+    ----------
+    elements : dict
+        Elements of the datapackage with fixed capacities.
+
+    sequences : dict
+        Sequences of the datapackage keyed by their file name.
+
+    destination : str
+        Directory to write the datapackage of the window to.
+
+    start, stop : int
+        First and last (excluded) timestep of the window.
+
+    storage_levels : dict
+        Initial storage levels keyed by the names of the storages. Storages
+        without a level start empty.
+    """
+    elements_dir = os.path.join(destination, 'data', 'elements')
+    sequences_dir = os.path.join(destination, 'data', 'sequences')
+    os.makedirs(elements_dir)
+    os.makedirs(sequences_dir)
+
+    window_elements = {}
+    for key, df in elements.items():
+        df = df.copy()
+
+        if 'storage_capacity' in df:
+            levels = pd.Series(storage_levels, dtype=float).reindex(df.index).fillna(0)
+            storage_capacity = df['storage_capacity'].fillna(0)
+
+            df['initial_storage_level'] = (levels / storage_capacity)\
+                .where(storage_capacity > 0, 0).clip(0, 1)
+            df['balanced'] = False
+
+        window_elements[key] = df
+
+    preprocessing.save_elements(window_elements, elements_dir)
+
+    for file, df in sequences.items():
+        write_sequences(df.iloc[start:stop], os.path.join(sequences_dir, file))
+
+    preprocessing.infer_metadata('name', destination)
+
+
+def add_final_storage_levels(m, storage_levels):
+    r"""
+    Constrains the storage levels at the end of the horizon to be at least
+    the given levels.
+    """
+    storages = {
+        str(n): (n, block) for n, block, _ in aggregation.get_storages(m)
+        if str(n) in storage_levels
+    }
+
+    def _final_storage_level_rule(m, label):
+        n, block = storages[label]
+        return block.capacity[n, m.TIMESTEPS[-1]] >= storage_levels[label]
+
+    m.final_storage_level = Constraint(list(storages), rule=_final_storage_level_rule)
+
+
+def get_storage_levels(results, timestep):
+    r"""
+    Returns the levels of all storages at a timestep keyed by their names.
+    """
+    return {
+        s: v['sequences']['capacity'].iloc[timestep]
+        for (s, o), v in results.items()
+        if o is None and 'capacity' in v['sequences']
+    }
+
+
+def stitch_results(es, window_results, sizing_results=None):
+    r"""
+    Stitches the results of the windows into results of the whole year
+    keyed by the nodes of the EnergySystem.
+
+    The sequences are concatenated. The scalars are those of the first
+    window, completed by the invested capacities of the sizing.
+
+    Parameters
+    ----------
+    es : oemof.solph.EnergySystem
+        EnergySystem of the original datapackage.
+
+    window_results : list
+        Kept results of the windows keyed by labels.
+
+    sizing_results : dict
+        Results of the sizing keyed by labels.
+
+    Returns
+    -------
+    results : dict
+        Results in the format of `oemof.outputlib.processing.results`.
+    """
+    nodes = {str(n): n for n in es.nodes}
+
+    if sizing_results is None:
+        sizing_results = {}
+
+    results = {}
+    for label, v in window_results[0].items():
+        key = tuple(None if n is None else nodes[n] for n in label)
+
+        sequences = pd.concat([w[label]['sequences'] for w in window_results])
+        sequences.index = es.timeindex
+
+        scalars = v['scalars']
+        if label in sizing_results:
+            scalars = scalars.combine_first(sizing_results[label]['scalars'])
+
+        results[key] = {'scalars': scalars, 'sequences': sequences}
+
+    return results
+
+
+def combine_solver_statistics(solver_statistics):
+    r"""
+    Sums up iterations and times of the solves of the windows.
+    """
+    solver_statistics = pd.DataFrame(solver_statistics)
+
+    combined = {
+        'termination_condition': ', '.join(solver_statistics['termination_condition'].unique()),
+        'iterations': solver_statistics['iterations'].sum(min_count=1),
+        'solver_time': solver_statistics['solver_time'].sum(min_count=1),
+        'solver': solver_statistics['solver'].iloc[0],
+        'warm_start': False,
+        'wall_time': solver_statistics['wall_time'].sum(),
+        'windows': len(solver_statistics),
+    }
+
+    return combined
+
+
+def optimize_rolling(
+    input_data_dir, results_data_dir=None, window=168, overlap=24,
+    sizing_typical_periods=None, sizing_period_length=24, solver='cbc', solver_options=None,
+):
+    r"""
+    Solves the datapackage in a rolling horizon.
+
+    Parameters
+    ----------
+    input_data_dir : str
+        Directory of the preprocessed datapackage.
+
+    results_data_dir : str
+        Directory to save the stitched results to. If None, nothing is
+        written.
+
+    window : int
+        Number of timesteps that are kept from every window.
+
+    overlap : int
+        Number of timesteps a window looks ahead beyond the kept part.
+
+    sizing_typical_periods : int
+        Number of representative periods on which expandable capacities are
+        sized before the rolling dispatch.
+
+    sizing_period_length : int
+        Length of the representative periods in timesteps.
+
+    solver_options : dict
+        Command line options passed to the solver.
+
+    Returns
+    -------
+    es : oemof.solph.EnergySystem
+        EnergySystem of the datapackage with the stitched results and its
+        parameters.
+
+    Raises
+    ------
+    ValueError
+        If the datapackage has expandable components but no sizing is set.
+    """
+    if aggregation.read_mapping(input_data_dir) is not None:
+        logging.warning("The datapackage is aggregated. Solving it without rolling horizon.")
+        return optimization.optimize(
+            input_data_dir, results_data_dir, solver=solver, solver_options=solver_options
+        )
+
+    es = from_datapackage(
+        os.path.join(input_data_dir, "datapackage.json"),
+        attributemap={}, typemap=TYPEMAP,
+    )
+    es.aggregation = None
+
+    elements = preprocessing.get_elements(os.path.join(input_data_dir, 'data', 'elements'))
+
+    sequences_dir = os.path.join(input_data_dir, 'data', 'sequences')
+    sequences = {
+        file: pd.read_csv(os.path.join(sequences_dir, file), index_col=0, parse_dates=True)
+        for file in sorted(os.listdir(sequences_dir))
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sizing_results = None
+        storage_levels = {}
+
+        if any(getattr(n, 'expandable', False) for n in es.nodes):
+            if not sizing_typical_periods:
+                raise ValueError(
+                    "The datapackage has expandable components. Set the number of typical"
+                    " periods to size them on before solving in a rolling horizon."
+                )
+
+            sizing_es = size_capacities(
+                input_data_dir, os.path.join(tmp, 'sizing'),
+                sizing_typical_periods, sizing_period_length, solver=solver,
+                solver_options=solver_options,
+            )
+
+            elements = fix_capacities(elements, get_invested_capacities(sizing_es))
+
+            sizing_results = by_label(sizing_es.results)
+
+            # The storage levels of the sizing are cyclic. Their level at the
+            # end of the year is the start level of the first window and has
+            # to be reached again at the end of the last one.
+            storage_levels = get_storage_levels(sizing_results, -1)
+
+            del sizing_es
+
+        final_storage_levels = dict(storage_levels)
+
+        windows = get_windows(len(es.timeindex), window, overlap)
+
+        window_results = []
+        solver_statistics = []
+        for n, (start, keep, stop) in enumerate(windows):
+            logging.info(f"Solving window {n + 1} of {len(windows)} (timesteps {start} to {keep})")
+            window_dir = os.path.join(tmp, f'window_{n}')
+
+            write_window(elements, sequences, window_dir, start, stop, storage_levels)
+
+            m = optimization.build_model(window_dir)
+
+            if stop == len(es.timeindex) and final_storage_levels:
+                add_final_storage_levels(m, final_storage_levels)
+
+            window_es = optimization.solve(m, solver=solver, solver_options=solver_options)
+
+            results = {
+                k: {'scalars': v['scalars'], 'sequences': v['sequences'].iloc[:keep - start]}
+                for k, v in by_label(window_es.results).items()
+            }
+
+            storage_levels = get_storage_levels(results, -1)
+
+            window_results.append(results)
+            solver_statistics.append(window_es.solver_statistics)
+
+            del m, window_es
+            shutil.rmtree(window_dir)
+
+    es.results = stitch_results(es, window_results, sizing_results)
+    es.params = outputlib.processing.parameter_as_dict(es)
+    es.solver_statistics = combine_solver_statistics(solver_statistics)
+
+    if results_data_dir is not None:
+        optimization.save_results(es, results_data_dir)
+
+    return es
@@ -0,0 +1,388 @@
+r"""
+Scaling benchmark on synthetic datapackages.
+
+The datapackage of the first scenario of the scenario table is scaled to
+`networks` heat networks, `storages` additional storages, `conversions`
+additional gas boilers and `timesteps` timesteps. Every generated
+datapackage is optimised and postprocessed. Each stage runs in a fresh
+process, so that its wall time, its peak memory and the timing spans
+inside it are measured independently of the other stages.
+
+Starting from the base case in run.yml, one of the four numbers is varied
+at a time. The results are saved to a table and plotted as functions of
+each number, so that they can be compared between versions of the code.
+"""
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import optimization
+import postprocessing
+import preprocessing
+import sparse_lp
+import tools.timing
+from tools.helper import get_config_file, get_experiment_dirs, get_scenario_assumptions, \
+    get_solver_profile
+from tools.results import load_results
+from tools.sequences import write_sequences
+
+
+AXES = ['networks', 'storages', 'conversions', 'timesteps']
+
+# Buses that every heat network has. Gas and electricity buses are shared.
+NETWORK_BUSES = ['heat_central', 'heat_decentral']
+
+# Columns of the elements that refer to buses or sequences of a network.
+NETWORK_COLUMNS = ['bus', 'from_bus', 'to_bus', 'heat_bus', 'profile']
+
+STAGES = ['optimise', 'postprocess']
+
+
+def get_case_name(case):
+    return 'N{networks}-M{storages}-K{conversions}-T{timesteps}'.format(**case)
+
+
+def get_cases(settings):
+    r"""
+    Returns the base case and the cases that differ from it in one of
+    the numbers in `AXES`.
+    """
+    base = {axis: settings['base'][axis] for axis in AXES}
+
+    cases = [base]
+    for axis in AXES:
+        for value in settings[axis]:
+            case = dict(base, **{axis: value})
+
+            if case not in cases:
+                cases.append(case)
+
+    return cases
+
+
+def copy_network(elements, i):
+    r"""
+    Copies the elements of a heat network. Names and the network's buses
+    and profiles get the suffix `_i`.
+    """
+    elements = elements.copy()
+
+    elements.index = elements.index + f'_{i}'
+
+    for column in NETWORK_COLUMNS:
+        if column in elements:
+            elements[column] = elements[column].map(
+                lambda x: f'{x}_{i}' if x in NETWORK_BUSES or column == 'profile' else x
+            )
+
+    return elements
+
+
+def scale_elements(elements, networks=1, storages=0, conversions=0):
+    r"""
+    Adds `networks - 1` copies of the heat network of the base scenario,
+    `storages` copies of its storages and `conversions` copies of its gas
+    boiler. The additional storages and boilers are distributed over the
+    networks.
+
+    Parameters
+    ----------
+    elements : dict
+        Elements of the base scenario as read by `preprocessing.get_elements`.
+
+    Returns
+    -------
+    elements : dict
+        Scaled elements.
+    """
+    def network_of(j):
+        return j % networks
+
+    def on_network(df, n):
+        return df if n == 0 else copy_network(df, n)
+
+    scaled = {}
+    for key, df in elements.items():
+        if key == 'bus':
+            network = df.loc[NETWORK_BUSES]
+            copies = [network.rename(index=lambda b: f'{b}_{i}') for i in range(1, networks)]
+
+        else:
+            copies = [copy_network(df, i) for i in range(1, networks)]
+
+        scaled[key] = pd.concat([df] + copies)
+
+    storage = elements['heat-storage']
+    scaled['heat-storage'] = pd.concat([scaled['heat-storage']] + [
+        on_network(storage.iloc[[j % len(storage)]], network_of(j))
+        .rename(index=lambda name: f'{name}-extra-{j}')
+        for j in range(storages)
+    ])
+
+    # The efficiency decreases slightly with every boiler, so that they are
+    # not interchangeable.
+    boiler = elements['gas-hob']
+    extra_boilers = []
+    for j in range(conversions):
+        extra = on_network(boiler, network_of(j)).rename(index=lambda name: f'{name}-extra-{j}')
+        extra['efficiency'] = extra['efficiency'] * (1 - 0.01 * (j + 1))
+        extra_boilers.append(extra)
+
+    scaled['gas-hob'] = pd.concat([scaled['gas-hob']] + extra_boilers)
+
+    return scaled
+
+
+def scale_sequences(sequences_dir, networks=1, timesteps=8760):
+    r"""
+    Adds the heat demand profiles of the copied networks, which are shifted
+    by a day per network, and repeats or cuts all sequences to `timesteps`
+    timesteps of the raw data.
+    """
+    for file in os.listdir(sequences_dir):
+        path = os.path.join(sequences_dir, file)
+
+        sequences = pd.read_csv(path, index_col=0, parse_dates=True)
+
+        step = sequences.index[1] - sequences.index[0]
+
+        if file == 'heat-demand_profile.csv':
+            profiles = list(sequences.columns)
+            for i in range(1, networks):
+                for column in profiles:
+                    sequences[f'{column}_{i}'] = np.roll(
+                        sequences[column].values, i * int(pd.Timedelta('1D') / step)
+                    )
+
+        index = pd.date_range(sequences.index[0], periods=timesteps, freq=step, name='timeindex')
+
+        sequences = pd.DataFrame(
+            np.resize(sequences.values, (timesteps, sequences.shape[1])),
+            index=index, columns=sequences.columns,
+        )
+
+        write_sequences(sequences, path)
+
+
+def generate_datapackage(destination, networks=1, storages=0, conversions=0, timesteps=8760):
+    r"""
+    Preprocesses the first scenario of the scenario table at the full
+    resolution of the raw data and scales its datapackage.
+
+    Parameters
+    ----------
+    destination : str
+        Directory to write the datapackage to.
+
+    networks : int
+        Number of heat networks.
+
+    storages : int
+        Number of additional heat storages.
+
+    conversions : int
+        Number of additional gas boilers.
+
+    timesteps : int
+        Number of timesteps of the raw data.
+    """
+    scenario_assumptions = get_scenario_assumptions().iloc[0].drop(
+        ['resolution', 'typical_periods', 'period_length', 'start', 'periods'], errors='ignore'
+    )
+    scenario_assumptions['debug'] = False
+
+    preprocessing.preprocess(scenario_assumptions, get_experiment_dirs()['raw'], destination)
+
+    elements_dir = os.path.join(destination, 'data', 'elements')
+
+    elements = preprocessing.get_elements(elements_dir)
+
+    preprocessing.save_elements(
+        scale_elements(elements, networks, storages, conversions), elements_dir
+    )
+
+    scale_sequences(os.path.join(destination, 'data', 'sequences'), networks, timesteps)
+
+    preprocessing.infer_metadata('name', destination)
+
+
+def optimise(preprocessed, optimised):
+    r"""
+    Optimises a datapackage with the backend, solver and solver options
+    that the pipeline uses.
+    """
+    config = get_config_file('run.yml')
+
+    profile = get_solver_profile()
+
+    backend = sparse_lp if config['backend'] == 'sparse' else optimization
+
+    backend.optimize(
+        preprocessed, optimised, solver=profile['solver'], solver_options=profile['options']
+    )
+
+
+def postprocess(optimised, postprocessed):
+    r"""
+    Postprocesses an optimised datapackage like `postprocessing.main`.
+    """
+    with tools.timing.span('load_results'):
+        results = load_results(optimised)
+
+    postprocessing.postprocess(results, postprocessed)
+
+
+def get_peak_memory():
+    r"""
+    Returns the peak resident memory in MB of this process or of the
+    largest of its finished child processes, e.g. the solver.
+    """
+    peak_memory = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+    # ru_maxrss is given in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        peak_memory /= 1024
+
+    return peak_memory / 1024
+
+
+def measure(function, args, spans_file):
+    r"""
+    Runs a stage and records its timing spans.
+
+    Returns
+    -------
+    wall_time : float
+        Wall time in seconds.
+
+    peak_memory : float
+        Peak memory in MB.
+    """
+    start = time.perf_counter()
+    with tools.timing.recording(spans_file):
+        function(*args)
+
+    return time.perf_counter() - start, get_peak_memory()
+
+
+def run_stage(function, args, spans_file):
+    r"""
+    Runs a stage in a fresh process, so that the peak memory is that of
+    the stage alone.
+    """
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(measure, (function, args, spans_file))
+
+
+def run_case(case, dirs):
+    r"""
+    Generates the datapackage of a case and optimises and postprocesses it.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        Duration of the stages and their spans and peak memory of the
+        stages.
+    """
+    name = get_case_name(case)
+
+    case_dirs = {key: os.path.join(dirs[key], name) for key in ['preprocessed', 'optimised',
+                                                                  'postprocessed', 'logs']}
+    for key in ['optimised', 'postprocessed']:
+        if os.path.exists(case_dirs[key]):
+            shutil.rmtree(case_dirs[key])
+
+    for path in case_dirs.values():
+        os.makedirs(path, exist_ok=True)
+
+    logging.info(f"Generating datapackage {name}")
+    generate_datapackage(case_dirs['preprocessed'], **case)
+
+    stages = {
+        'optimise': (optimise, (case_dirs['preprocessed'], case_dirs['optimised'])),
+        'postprocess': (postprocess, (case_dirs['optimised'], case_dirs['postprocessed'])),
+    }
+
+    rows = []
+    for stage, (function, args) in stages.items():
+        logging.info(f"Running stage {stage} of {name}")
+        spans_file = os.path.join(case_dirs['logs'], f'{stage}_{tools.timing.SPANS_NAME}')
+
+        wall_time, peak_memory = run_stage(function, args, spans_file)
+
+        rows.append({'stage': stage, 'span': stage, 'duration': wall_time,
+                     'peak_memory': peak_memory})
+
+        spans = tools.timing.read_spans({name: spans_file})
+        for span, duration in spans.groupby('span', sort=False)['duration'].sum().items():
+            rows.append({'stage': stage, 'span': span, 'duration': duration})
+
+    results = pd.DataFrame(rows)
+    for axis in AXES:
+        results.insert(0, axis, case[axis])
+    results.insert(0, 'case', name)
+
+    return results
+
+
+def plot_scaling(results, base, destination):
+    r"""
+    Plots duration and peak memory of the stages and the duration of
+    their spans against each axis, keeping the other axes at the base case.
+    """
+    for axis in AXES:
+        others = [a for a in AXES if a != axis]
+
+        selected = results.loc[(results[others] == pd.Series(base)[others]).all(axis=1)]
+
+        if selected[axis].nunique() < 2:
+            continue
+
+        fig, (ax_time, ax_memory) = plt.subplots(1, 2, figsize=(14, 6))
+
+        duration = selected.pivot_table(index=axis, columns='span', values='duration')
+        duration.plot(ax=ax_time, marker='o')
+        ax_time.set_ylabel('Duration [s]')
+        ax_time.set_yscale('log')
+        ax_time.legend(fontsize='small')
+
+        peak_memory = selected.dropna(subset=['peak_memory']).pivot_table(
+            index=axis, columns='stage', values='peak_memory'
+        )
+        peak_memory.plot(ax=ax_memory, marker='o')
+        ax_memory.set_ylabel('Peak memory [MB]')
+
+        fig.suptitle(f"Scaling with the number of {axis}")
+        plt.tight_layout()
+        plt.savefig(os.path.join(destination, f'scaling_{axis}.pdf'))
+        plt.close(fig)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    settings = get_config_file('run.yml')['scaling_benchmark']
+
+    dirs = get_experiment_dirs('scaling_benchmark')
+
+    results = pd.concat([run_case(case, dirs) for case in get_cases(settings)])
+
+    results.to_csv(os.path.join(dirs['tables'], 'scaling_benchmark.csv'), index=False)
+
+    plot_scaling(results, settings['base'], dirs['plots'])
+
+    print(
+        results.loc[results['span'].isin(STAGES)]
+        .set_index(['case', 'stage'])[['duration', 'peak_memory']]
+    )
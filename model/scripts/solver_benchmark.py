@@ -0,0 +1,328 @@
+r"""
+Benchmarks the locally installed solvers with different option sets on a
+sample of the preprocessed scenarios. The fastest configuration whose
+objectives agree with those of the other configurations is written to the
+solver profile config/solver_profile.yml, which `optimization.main` and
+`main.py` pick up automatically.
+"""
+import importlib.util
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import yaml
+from pyomo.opt import SolverFactory
+
+from oemof.tabular.facades import TYPEMAP
+
+import aggregation
+import optimization
+import sparse_lp
+from tools.helper import get_config_file, get_experiment_dirs, get_scenario_assumptions
+from tools.sequences import from_datapackage
+
+
+# Option sets that are benchmarked for each solver. Options with an empty
+# value are passed as flags.
+OPTION_SETS = {
+    'cbc': {
+        'default': {},
+        'no_presolve': {'presolve': 'off'},
+        'dual_simplex': {'dualSimplex': ''},
+        'primal_simplex': {'primalSimplex': ''},
+        'barrier': {'barrier': ''},
+        'threads_4': {'threads': 4},
+    },
+    'glpk': {
+        'default': {},
+        'presolve': {'presol': ''},
+        'primal_simplex': {'primal': ''},
+        'dual_simplex': {'dual': ''},
+        'interior_point': {'interior': ''},
+    },
+    'highs': {
+        'default': {},
+        'no_presolve': {'presolve': 'off'},
+        'dual_simplex': {'solver': 'simplex', 'simplex_strategy': 1},
+        'primal_simplex': {'solver': 'simplex', 'simplex_strategy': 4},
+        'interior_point': {'solver': 'ipm'},
+        'threads_4': {'threads': 4},
+    },
+}
+
+# Relative tolerance within which the objective of a run has to agree with
+# the median objective of all runs of the scenario.
+OBJECTIVE_TOLERANCE = 1e-6
+
+SOLVER_PROFILE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', 'config', 'solver_profile.yml')
+)
+
+
+def get_available_solvers(backend='oemof'):
+    r"""
+    Returns the solvers of `OPTION_SETS` that are installed locally and
+    supported by the backend.
+
+    The oemof backend calls the solvers through pyomo. The sparse backend
+    supports cbc and HiGHS, which is called in memory through highspy.
+    """
+    if backend == 'sparse':
+        available = {
+            'cbc': shutil.which('cbc') is not None,
+            'highs': importlib.util.find_spec('highspy') is not None,
+        }
+
+    else:
+        available = {
+            solver: SolverFactory(solver).available(exception_flag=False)
+            for solver in ('cbc', 'glpk')
+        }
+
+    return [solver for solver, is_available in available.items() if is_available]
+
+
+def build(input_data_dir, backend='oemof'):
+    r"""
+    Builds the oemof model or the sparse linear program of a datapackage.
+    """
+    if backend == 'sparse':
+        es = from_datapackage(
+            os.path.join(input_data_dir, "datapackage.json"),
+            attributemap={}, typemap=TYPEMAP,
+        )
+
+        return sparse_lp.build_lp(es)
+
+    return optimization.build_model(input_data_dir)
+
+
+def solve(model, solver, options, backend='oemof', time_limit=None):
+    r"""
+    Solves a model built with `build` once with the given solver and
+    options. Runs that fail or exceed the time limit of the executable
+    are recorded with the termination condition 'error'.
+
+    Returns
+    -------
+    statistics : dict
+        Termination condition, objective, iterations and wall time.
+    """
+    start = time.perf_counter()
+    try:
+        if backend == 'sparse':
+            _, statistics, _ = sparse_lp.solve_lp(model, solver, options, time_limit)
+
+        else:
+            solver_results = model.solve(
+                solver=solver, cmdline_options=dict(options),
+                solve_kwargs={'timelimit': time_limit},
+            )
+            statistics = optimization.get_solver_statistics(solver_results)
+            statistics['objective'] = model.objective()
+
+    except Exception as e:
+        logging.warning(f"Solving with {solver} and options {options} failed: {e}")
+        statistics = {'termination_condition': 'error', 'objective': None, 'iterations': None}
+
+    statistics['wall_time'] = time.perf_counter() - start
+
+    return statistics
+
+
+def run_benchmark(input_data_dirs, solvers, backend='oemof', time_limit=None):
+    r"""
+    Solves every datapackage with every option set of every solver. Each
+    datapackage is built only once.
+
+    Parameters
+    ----------
+    input_data_dirs : dict
+        Directories of the preprocessed datapackages keyed by scenario.
+
+    solvers : list
+        Solvers to benchmark.
+
+    backend : str
+        'oemof' or 'sparse'.
+
+    time_limit : float
+        Seconds after which a run is stopped.
+
+    Returns
+    -------
+    benchmark : pd.DataFrame
+        One row per scenario, solver and option set with termination
+        condition, objective, iterations, wall time and whether the
+        objective agrees with the other runs.
+    """
+    rows = []
+    for scenario, input_data_dir in input_data_dirs.items():
+        logging.info(f"Benchmarking the solvers on scenario '{scenario}'")
+        model = build(input_data_dir, backend)
+
+        for solver in solvers:
+            for option_set, options in OPTION_SETS[solver].items():
+                statistics = solve(model, solver, options, backend, time_limit)
+
+                logging.info(
+                    f"{solver} ({option_set}): {statistics['termination_condition']},"
+                    f" {statistics['wall_time']:.2f} s"
+                )
+
+                rows.append({
+                    'scenario': scenario,
+                    'solver': solver,
+                    'option_set': option_set,
+                    'termination_condition': statistics['termination_condition'],
+                    'objective': statistics['objective'],
+                    'iterations': statistics['iterations'],
+                    'wall_time': statistics['wall_time'],
+                })
+
+        del model
+
+    return check_objectives(pd.DataFrame(rows))
+
+
+def check_objectives(benchmark, tolerance=OBJECTIVE_TOLERANCE):
+    r"""
+    Marks the runs whose objective agrees with the median objective of
+    the optimal runs of the same scenario.
+    """
+    benchmark['objective'] = benchmark['objective'].astype(float)
+
+    optimal = benchmark['termination_condition'] == 'optimal'
+
+    reference = (
+        benchmark['objective'].where(optimal)
+        .groupby(benchmark['scenario']).transform('median')
+    )
+
+    difference = (benchmark['objective'] - reference).abs()
+
+    benchmark['agrees'] = optimal & (difference <= tolerance * np.maximum(reference.abs(), 1))
+
+    return benchmark
+
+
+def get_fastest_configuration(benchmark):
+    r"""
+    Returns the solver and option set with the lowest total wall time
+    among those whose objectives agree in all scenarios.
+
+    Raises
+    ------
+    ValueError
+        If no configuration solved all scenarios with agreeing objectives.
+    """
+    configurations = benchmark.groupby(['solver', 'option_set'])
+
+    summary = pd.DataFrame({
+        'wall_time': configurations['wall_time'].sum(),
+        'agrees': configurations['agrees'].all(),
+    })
+
+    summary = summary.loc[summary['agrees']]
+
+    if summary.empty:
+        raise ValueError("No configuration solved all scenarios with agreeing objectives.")
+
+    return summary['wall_time'].idxmin()
+
+
+def write_solver_profile(benchmark, backend, path=SOLVER_PROFILE_PATH):
+    r"""
+    Writes the fastest configuration of the benchmark to the solver profile.
+
+    Returns
+    -------
+    profile : dict
+    """
+    solver, option_set = get_fastest_configuration(benchmark)
+
+    runs = benchmark.loc[
+        (benchmark['solver'] == solver) & (benchmark['option_set'] == option_set)
+    ]
+
+    profile = {
+        'backend': backend,
+        'solver': solver,
+        'options': OPTION_SETS[solver][option_set],
+        'option_set': option_set,
+        'wall_time': float(runs['wall_time'].sum()),
+        'scenarios': list(runs['scenario']),
+    }
+
+    with open(path, 'w') as f:
+        yaml.safe_dump(profile, f, sort_keys=False)
+
+    return profile
+
+
+def sample_scenarios(scenarios, n):
+    r"""
+    Picks `n` scenarios spread evenly over the list of scenarios.
+    """
+    if n is None or n >= len(scenarios):
+        return list(scenarios)
+
+    return [scenarios[i] for i in np.linspace(0, len(scenarios) - 1, n).round().astype(int)]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+
+    config = get_config_file('run.yml')
+
+    backend = config['backend']
+
+    input_data_dirs = {}
+    for scenario in get_scenario_assumptions()['scenario']:
+        preprocessed = get_experiment_dirs(scenario)['preprocessed']
+
+        if not os.path.exists(os.path.join(preprocessed, 'datapackage.json')):
+            continue
+
+        # The sparse backend solves aggregated datapackages with oemof.
+        if backend == 'sparse' and aggregation.read_mapping(preprocessed) is not None:
+            continue
+
+        input_data_dirs[scenario] = preprocessed
+
+    if not input_data_dirs:
+        raise ValueError("There are no preprocessed scenarios. Run the preprocessing first.")
+
+    settings = config['solver_benchmark']
+
+    sample = sample_scenarios(list(input_data_dirs), settings['scenarios'])
+
+    solvers = get_available_solvers(backend)
+
+    print(f"Benchmarking {solvers} with the {backend} backend on the scenarios {sample}")
+
+    benchmark = run_benchmark(
+        {scenario: input_data_dirs[scenario] for scenario in sample}, solvers, backend,
+        time_limit=settings['time_limit'],
+    )
+
+    benchmark.to_csv(
+        os.path.join(get_experiment_dirs('all_scenarios')['tables'], 'solver_benchmark.csv'),
+        index=False,
+    )
+
+    print(
+        benchmark.groupby(['solver', 'option_set'])
+        .agg({'wall_time': 'sum', 'iterations': 'sum', 'agrees': 'all'})
+        .sort_values('wall_time')
+    )
+
+    profile = write_solver_profile(benchmark, backend)
+
+    print(
+        f"Fastest configuration: {profile['solver']} ({profile['option_set']})."
+        f" Written to {SOLVER_PROFILE_PATH}"
+    )
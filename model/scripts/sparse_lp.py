@@ -0,0 +1,1096 @@
+r"""
+Sparse LP backend.
+
+Builds the linear program of a datapackage directly as a sparse matrix
+instead of a Pyomo model and passes it to the solver as MPS file (cbc) or
+in memory (highs). The solution is mapped back to the results format of
+`oemof.outputlib.processing.results`, so that the EnergySystem is saved and
+postprocessed like one solved with `optimization.py`.
+
+The EnergySystem is still read with oemof.tabular, so that the parameters
+of the flows and components are exactly those the oemof model would get.
+The constraints replicate the oemof.solph formulation of the components
+used in this model. Other components raise a ValueError.
+"""
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from oemof.solph import blocks
+from oemof.solph.components import GenericStorageBlock, GenericInvestmentStorageBlock, \
+    ExtractionTurbineCHPBlock
+from oemof import outputlib
+
+from oemof.tabular.facades import TYPEMAP
+
+import aggregation
+import optimization
+from tools.helper import get_experiment_dirs, get_scenario_assumptions, get_timestep_hours
+from tools.sequences import from_datapackage
+from tools.timing import span
+
+
+SOLVERS = ('cbc', 'highs')
+
+# Codes of highspy.HighsBasisStatus
+AT_LOWER, AT_UPPER, AT_ZERO = 0, 2, 3
+
+
+class LinearProgram:
+    r"""
+    Linear program
+
+    .. math::
+        \min c^T x \quad s.t. \quad r_l \le A x \le r_u, \quad l \le x \le u
+
+    that is assembled block by block. Variables and constraints are added
+    as arrays and keyed, so that the solution can be looked up by key.
+
+    Attributes
+    ----------
+    variables : dict
+        Column indices of the variables keyed by tuples like
+        ('flow', source, target).
+
+    constraints : dict
+        Row indices of the constraints keyed like the variables.
+    """
+    def __init__(self):
+        self.variables = {}
+        self.constraints = {}
+
+        self.n_variables = 0
+        self.n_constraints = 0
+
+        self._c = []
+        self._lb = []
+        self._ub = []
+
+        self._rows = []
+        self._cols = []
+        self._coefs = []
+        self._row_lower = []
+        self._row_upper = []
+
+    def add_variables(self, key, size, lb=0, ub=np.inf, cost=0):
+        r"""
+        Adds `size` variables with the given bounds and costs, which can
+        be scalars or arrays of length `size`. NaN bounds, as read from
+        empty fields of the datapackage, are no bounds.
+
+        Returns
+        -------
+        index : np.ndarray
+            Column indices of the variables.
+        """
+        index = np.arange(self.n_variables, self.n_variables + size)
+
+        lb = np.nan_to_num(np.asarray(lb, dtype=float), nan=-np.inf, posinf=np.inf)
+        ub = np.nan_to_num(np.asarray(ub, dtype=float), nan=np.inf, neginf=-np.inf)
+
+        for values, new in ((self._lb, lb), (self._ub, ub), (self._c, cost)):
+            values.append(np.broadcast_to(np.asarray(new, dtype=float), size))
+
+        self.variables[key] = index
+        self.n_variables += size
+
+        return index
+
+    def add_constraints(self, key, terms, lower=-np.inf, upper=np.inf):
+        r"""
+        Adds constraints :math:`lower \le \sum coefficients \cdot x \le upper`.
+
+        Parameters
+        ----------
+        key : tuple
+            Key of the constraints.
+
+        terms : list
+            Tuples of column indices and coefficients. Each tuple holds one
+            variable per constraint. Scalars are broadcast to all
+            constraints.
+
+        lower, upper : float or np.ndarray
+            Bounds of the constraints. Set both to the same value for
+            equality constraints.
+
+        Returns
+        -------
+        rows : np.ndarray
+            Row indices of the constraints.
+        """
+        size = max(np.size(index) for index, _ in terms)
+
+        rows = np.arange(self.n_constraints, self.n_constraints + size)
+
+        for index, coefficients in terms:
+            self._rows.append(rows)
+            self._cols.append(np.broadcast_to(index, size))
+            self._coefs.append(np.broadcast_to(np.asarray(coefficients, dtype=float), size))
+
+        self._row_lower.append(np.broadcast_to(np.asarray(lower, dtype=float), size))
+        self._row_upper.append(np.broadcast_to(np.asarray(upper, dtype=float), size))
+
+        self.constraints[key] = rows
+        self.n_constraints += size
+
+        return rows
+
+    @property
+    def c(self):
+        return np.concatenate(self._c)
+
+    @property
+    def bounds(self):
+        return np.concatenate(self._lb), np.concatenate(self._ub)
+
+    @property
+    def row_bounds(self):
+        return np.concatenate(self._row_lower), np.concatenate(self._row_upper)
+
+    @property
+    def matrix(self):
+        r"""
+        Constraint matrix in CSC format. Coefficients of the same variable
+        in the same constraint are summed up.
+        """
+        return sparse.csc_matrix(
+            (
+                np.concatenate(self._coefs),
+                (np.concatenate(self._rows), np.concatenate(self._cols)),
+            ),
+            shape=(self.n_constraints, self.n_variables),
+        )
+
+
+@dataclass
+class Solution:
+    r"""
+    Solution of a linear program with the HiGHS instance that holds its
+    optimal basis.
+    """
+    lp: LinearProgram
+    x: np.ndarray
+    highs: object
+
+
+def get_values(sequence, n_timesteps):
+    r"""
+    Returns the first `n_timesteps` values of an oemof sequence as array.
+    """
+    return np.array([sequence[t] for t in range(n_timesteps)], dtype=float)
+
+
+def check_flow(i, o, flow):
+    r"""
+    Raises a ValueError if a flow has attributes that the sparse LP builder
+    does not model.
+    """
+    unsupported = {
+        'nonconvex': flow.nonconvex is not None,
+        'integer': bool(flow.integer),
+        'summed_max': flow.summed_max is not None,
+        'summed_min': flow.summed_min is not None,
+        'positive_gradient': flow.positive_gradient['ub'][0] is not None,
+        'negative_gradient': flow.negative_gradient['ub'][0] is not None,
+        'bidirectional': hasattr(flow, 'bidirectional'),
+    }
+
+    for attribute, is_set in unsupported.items():
+        if is_set:
+            raise ValueError(
+                f"The attribute '{attribute}' of the flow {i}-{o} is not supported"
+                " by the sparse LP builder."
+            )
+
+
+def add_flows(lp, es, timeincrement, objective_weighting):
+    r"""
+    Adds the flow variables with their bounds and variable costs and the
+    investment variables and constraints of flows with an investment.
+    """
+    n_timesteps = len(timeincrement)
+
+    for (i, o), flow in es.flows().items():
+        check_flow(i, o, flow)
+
+        lb = 0
+        ub = np.inf
+        if flow.nominal_value is not None:
+            ub = get_values(flow.max, n_timesteps) * flow.nominal_value
+            lb = get_values(flow.min, n_timesteps) * flow.nominal_value
+
+            if flow.fixed and flow.actual_value[0] is not None:
+                lb = ub = get_values(flow.actual_value, n_timesteps) * flow.nominal_value
+
+        cost = 0
+        if flow.variable_costs[0] is not None:
+            cost = get_values(flow.variable_costs, n_timesteps) * objective_weighting
+
+        lp.add_variables(('flow', i, o), n_timesteps, lb, ub, cost)
+
+    for (i, o), flow in es.flows().items():
+        if flow.investment is None:
+            continue
+
+        investment = flow.investment
+        if investment.ep_costs is None:
+            raise ValueError("Missing value for investment costs!")
+
+        invest = lp.add_variables(
+            ('invest', i, o), 1, investment.minimum, investment.maximum, investment.ep_costs
+        )
+        flow_index = lp.variables['flow', i, o]
+
+        if flow.fixed:
+            actual_value = get_values(flow.actual_value, n_timesteps)
+            lp.add_constraints(
+                ('invest_fixed', i, o),
+                [(flow_index, 1), (invest, -actual_value)],
+                actual_value * investment.existing, actual_value * investment.existing,
+            )
+
+        max_value = get_values(flow.max, n_timesteps)
+        lp.add_constraints(
+            ('invest_max', i, o),
+            [(flow_index, 1), (invest, -max_value)],
+            upper=max_value * investment.existing,
+        )
+
+        if flow.min[0] != 0 or len(flow.min) > 1:
+            min_value = get_values(flow.min, n_timesteps)
+            lp.add_constraints(
+                ('invest_min', i, o),
+                [(flow_index, 1), (invest, -min_value)],
+                lower=min_value * investment.existing,
+            )
+
+
+def add_bus(lp, n):
+    r"""
+    Adds the balance of inflows and outflows of a bus.
+    """
+    terms = [(lp.variables['flow', i, n], 1) for i in n.inputs] \
+        + [(lp.variables['flow', n, o], -1) for o in n.outputs]
+
+    if terms:
+        lp.add_constraints(('balance', n), terms, 0, 0)
+
+
+def add_transformer(lp, n, n_timesteps):
+    r"""
+    Adds the relation of every input to every output of a transformer.
+    """
+    for o in n.outputs:
+        for i in n.inputs:
+            lp.add_constraints(
+                ('relation', n, i, o),
+                [
+                    (lp.variables['flow', i, n], 1 / get_values(n.conversion_factors[i], n_timesteps)),
+                    (lp.variables['flow', n, o], -1 / get_values(n.conversion_factors[o], n_timesteps)),
+                ],
+                0, 0,
+            )
+
+
+def add_extraction_turbine(lp, n, n_timesteps):
+    r"""
+    Adds the relation of fuel input, main and tapped output of an
+    extraction turbine CHP.
+    """
+    inflow = list(n.inputs)[0]
+    main_output = list(n.conversion_factor_full_condensation)[0]
+    tapped_output = [o for o in n.outputs if o != main_output][0]
+
+    efficiency_condensation = get_values(
+        n.conversion_factor_full_condensation[main_output], n_timesteps
+    )
+    efficiency_main = get_values(n.conversion_factors[main_output], n_timesteps)
+    efficiency_tapped = get_values(n.conversion_factors[tapped_output], n_timesteps)
+
+    flow_relation_index = efficiency_main / efficiency_tapped
+    main_flow_loss_index = (efficiency_condensation - efficiency_main) / efficiency_tapped
+
+    main_flow = lp.variables['flow', n, main_output]
+    tapped_flow = lp.variables['flow', n, tapped_output]
+
+    lp.add_constraints(
+        ('input_output_relation', n),
+        [
+            (lp.variables['flow', inflow, n], 1),
+            (main_flow, -1 / efficiency_condensation),
+            (tapped_flow, -main_flow_loss_index / efficiency_condensation),
+        ],
+        0, 0,
+    )
+
+    lp.add_constraints(
+        ('out_flow_relation', n),
+        [(main_flow, 1), (tapped_flow, -flow_relation_index)],
+        lower=0,
+    )
+
+
+def add_storage(lp, n, timeincrement):
+    r"""
+    Adds the filling level of a storage with or without investment and
+    its balance.
+    """
+    n_timesteps = len(timeincrement)
+
+    i = list(n.inputs)[0]
+    o = list(n.outputs)[0]
+
+    min_level = get_values(n.min_storage_level, n_timesteps)
+    max_level = get_values(n.max_storage_level, n_timesteps)
+
+    if n.investment is None:
+        capacity = lp.add_variables(
+            ('capacity', n), n_timesteps,
+            n.nominal_storage_capacity * min_level, n.nominal_storage_capacity * max_level,
+        )
+
+        if n.initial_storage_level is not None:
+            init_cap_bounds = [n.initial_storage_level * n.nominal_storage_capacity] * 2
+        else:
+            init_cap_bounds = [0, n.nominal_storage_capacity]
+
+        init_cap = lp.add_variables(('init_cap', n), 1, *init_cap_bounds)
+
+    else:
+        investment = n.investment
+        if investment.ep_costs is None:
+            raise ValueError("Missing value for investment costs!")
+
+        capacity = lp.add_variables(('capacity', n), n_timesteps)
+        invest = lp.add_variables(
+            ('invest', n), 1, investment.minimum, investment.maximum, investment.ep_costs
+        )
+        init_cap = lp.add_variables(('init_cap', n), 1)
+
+        if n.initial_storage_level is None:
+            lp.add_constraints(
+                ('init_cap_limit', n), [(init_cap, 1), (invest, -1)], upper=investment.existing
+            )
+        else:
+            lp.add_constraints(
+                ('init_cap_fix', n),
+                [(init_cap, 1), (invest, -n.initial_storage_level)],
+                n.initial_storage_level * investment.existing,
+                n.initial_storage_level * investment.existing,
+            )
+
+        if n.invest_relation_input_capacity is not None:
+            lp.add_constraints(
+                ('storage_capacity_inflow', n),
+                [(lp.variables['invest', i, n], 1), (invest, -n.invest_relation_input_capacity)],
+                *[investment.existing * n.invest_relation_input_capacity
+                  - n.inputs[i].investment.existing] * 2,
+            )
+
+        if n.invest_relation_output_capacity is not None:
+            lp.add_constraints(
+                ('storage_capacity_outflow', n),
+                [(lp.variables['invest', n, o], 1), (invest, -n.invest_relation_output_capacity)],
+                *[investment.existing * n.invest_relation_output_capacity
+                  - n.outputs[o].investment.existing] * 2,
+            )
+
+        lp.add_constraints(
+            ('max_capacity', n), [(capacity, 1), (invest, -max_level)],
+            upper=investment.existing * max_level,
+        )
+
+        if min_level.sum() > 0:
+            lp.add_constraints(
+                ('min_capacity', n), [(capacity, 1), (invest, -min_level)],
+                lower=investment.existing * min_level,
+            )
+
+    # The level before the first timestep is the initial capacity.
+    previous = np.concatenate([init_cap, capacity[:-1]])
+
+    lp.add_constraints(
+        ('balance', n),
+        [
+            (capacity, 1),
+            (previous, -(1 - get_values(n.loss_rate, n_timesteps))),
+            (
+                lp.variables['flow', i, n],
+                -get_values(n.inflow_conversion_factor, n_timesteps) * timeincrement,
+            ),
+            (
+                lp.variables['flow', n, o],
+                timeincrement / get_values(n.outflow_conversion_factor, n_timesteps),
+            ),
+        ],
+        0, 0,
+    )
+
+    if n.balanced is True:
+        lp.add_constraints(('balanced', n), [(capacity[-1:], 1), (init_cap, -1)], 0, 0)
+
+    if n.invest_relation_input_output is not None:
+        lp.add_constraints(
+            ('power_coupled', n),
+            [
+                (lp.variables['invest', n, o], n.invest_relation_input_output),
+                (lp.variables['invest', i, n], -1),
+            ],
+            *[n.inputs[i].investment.existing
+              - n.outputs[o].investment.existing * n.invest_relation_input_output] * 2,
+        )
+
+
+def build_lp(es, objective_weighting=None):
+    r"""
+    Builds the linear program of an EnergySystem.
+
+    Parameters
+    ----------
+    es : oemof.solph.EnergySystem
+        EnergySystem read from a datapackage.
+
+    objective_weighting : list
+        Weights of the timesteps in the objective. By default, the
+        timesteps are weighted by their length in hours like in
+        `oemof.solph.Model`.
+
+    Returns
+    -------
+    lp : LinearProgram
+
+    Raises
+    ------
+    ValueError
+        If the EnergySystem has components or flow attributes that are
+        not supported.
+    """
+    n_timesteps = len(es.timeindex)
+
+    timeincrement = np.full(n_timesteps, get_timestep_hours(es.timeindex))
+
+    if objective_weighting is None:
+        objective_weighting = timeincrement
+
+    lp = LinearProgram()
+
+    add_flows(lp, es, timeincrement, np.asarray(objective_weighting, dtype=float))
+
+    for n in es.nodes:
+        group = n.constraint_group()
+
+        if group is None:
+            continue
+
+        elif group is blocks.Bus:
+            add_bus(lp, n)
+
+        elif group is blocks.Transformer:
+            add_transformer(lp, n, n_timesteps)
+
+        elif group is ExtractionTurbineCHPBlock:
+            add_extraction_turbine(lp, n, n_timesteps)
+
+        elif group in (GenericStorageBlock, GenericInvestmentStorageBlock):
+            add_storage(lp, n, timeincrement)
+
+        else:
+            raise ValueError(
+                f"The component {n} of type {type(n).__name__} is not supported"
+                " by the sparse LP builder."
+            )
+
+    return lp
+
+
+def write_mps(lp, path):
+    r"""
+    Writes the linear program to a file in free MPS format. Variables are
+    named x<column> and constraints r<row>.
+    """
+    matrix = lp.matrix
+    c = lp.c
+    lb, ub = lp.bounds
+    row_lower, row_upper = lp.row_bounds
+
+    if np.any(np.isfinite(row_lower) & np.isfinite(row_upper) & (row_lower != row_upper)):
+        raise ValueError("Ranged constraints cannot be written to MPS.")
+
+    row_types = np.where(
+        row_lower == row_upper, 'E', np.where(np.isfinite(row_upper), 'L', 'G')
+    )
+    rhs = np.where(np.isfinite(row_upper), row_upper, row_lower)
+
+    # The objective is written as first row of the matrix.
+    matrix = sparse.vstack([sparse.csr_matrix(c), matrix]).tocsc()
+    row_names = ['obj'] + [f'r{r}' for r in range(len(row_types))]
+
+    lines = ['NAME sparse_lp', 'ROWS', ' N obj']
+    lines += [f' {t} {name}' for t, name in zip(row_types.tolist(), row_names[1:])]
+
+    lines.append('COLUMNS')
+    columns = np.repeat(np.arange(matrix.shape[1]), np.diff(matrix.indptr))
+    lines += [
+        f' x{j} {row_names[r]} {a!r}'
+        for j, r, a in zip(columns.tolist(), matrix.indices.tolist(), matrix.data.tolist())
+    ]
+
+    lines.append('RHS')
+    lines += [f' rhs r{r} {rhs[r]!r}' for r in np.flatnonzero(rhs).tolist()]
+
+    fixed = lb == ub
+    lines.append('BOUNDS')
+    lines += [f' FX bnd x{j} {lb[j]!r}' for j in np.flatnonzero(fixed).tolist()]
+    lines += [f' MI bnd x{j}' for j in np.flatnonzero(~fixed & (lb == -np.inf)).tolist()]
+    lines += [
+        f' LO bnd x{j} {lb[j]!r}'
+        for j in np.flatnonzero(~fixed & np.isfinite(lb) & (lb != 0)).tolist()
+    ]
+    lines += [f' UP bnd x{j} {ub[j]!r}' for j in np.flatnonzero(~fixed & np.isfinite(ub)).tolist()]
+
+    lines.append('ENDATA')
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def solve_cbc(lp, options=None, time_limit=None):
+    r"""
+    Solves the linear program with the cbc executable.
+
+    Parameters
+    ----------
+    lp : LinearProgram
+        Linear program to solve.
+
+    options : dict
+        Options passed to cbc as `-key value`. Options with an empty value,
+        e.g. `{'dualSimplex': ''}`, are actions that are run instead of the
+        default `-solve`.
+
+    time_limit : float
+        Seconds after which cbc is stopped and `subprocess.TimeoutExpired`
+        is raised.
+
+    Returns
+    -------
+    x : np.ndarray
+        Values of the variables.
+
+    statistics : dict
+        Termination condition, objective, iterations and solver time.
+
+    highs : None
+        cbc is called as executable and does not keep its basis.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        mps_file = os.path.join(tmp, 'model.mps')
+        solution_file = os.path.join(tmp, 'solution.txt')
+
+        write_mps(lp, mps_file)
+
+        options = options or {}
+        parameters = [f'-{key} {value}'.split() for key, value in options.items() if value != '']
+        actions = [f'-{key}' for key, value in options.items() if value == ''] or ['-solve']
+
+        start = time.perf_counter()
+        output = subprocess.run(
+            ['cbc', mps_file, *sum(parameters, []), *actions, '-solu', solution_file],
+            capture_output=True, text=True, check=True, timeout=time_limit,
+        ).stdout
+        solver_time = time.perf_counter() - start
+
+        with open(solution_file) as f:
+            status = f.readline()
+
+            # Only variables with non-zero values are written.
+            x = np.zeros(lp.n_variables)
+            for line in f:
+                fields = line.replace('**', '').split()
+                x[int(fields[1][1:])] = float(fields[2])
+
+    iterations = re.search(r'(\d+) iterations', output)
+
+    statistics = {
+        'termination_condition': status.split()[0].lower(),
+        'objective': float(status.split()[-1]) if 'objective value' in status else None,
+        'iterations': float(iterations.group(1)) if iterations else None,
+        'solver_time': solver_time,
+    }
+
+    return x, statistics, None
+
+
+def solve_highs(lp, options=None, time_limit=None, basis=None):
+    r"""
+    Solves the linear program in memory with highspy. Given a basis, e.g.
+    the optimal basis of a similar linear program, the simplex starts from
+    it instead of from scratch.
+
+    Parameters
+    ----------
+    lp : LinearProgram
+        Linear program to solve.
+
+    options : dict
+        HiGHS options, e.g. `{'solver': 'ipm', 'threads': 4}`.
+
+    time_limit : float
+        Seconds after which HiGHS stops with the status 'time limit reached'.
+
+    basis : highspy.HighsBasis
+        Basis of a linear program of the same shape to start from.
+
+    Returns
+    -------
+    x : np.ndarray
+        Values of the variables.
+
+    statistics : dict
+        Termination condition, objective, iterations and solver time.
+
+    highs : highspy.Highs
+        Solver instance with the optimal basis.
+    """
+    import highspy
+
+    matrix = lp.matrix
+    lb, ub = lp.bounds
+    row_lower, row_upper = lp.row_bounds
+
+    model = highspy.HighsLp()
+    model.num_col_ = lp.n_variables
+    model.num_row_ = lp.n_constraints
+    model.col_cost_ = lp.c
+    model.col_lower_ = lb
+    model.col_upper_ = ub
+    model.row_lower_ = row_lower
+    model.row_upper_ = row_upper
+    model.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    model.a_matrix_.start_ = matrix.indptr
+    model.a_matrix_.index_ = matrix.indices
+    model.a_matrix_.value_ = matrix.data
+
+    # The thread pool of HiGHS is shared by all instances and keeps the
+    # number of threads it was started with. Restart it so that the option
+    # 'threads' takes effect.
+    highspy.Highs.resetGlobalScheduler(True)
+
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', False)
+    for key, value in (options or {}).items():
+        h.setOptionValue(key, value)
+    if time_limit is not None:
+        h.setOptionValue('time_limit', float(time_limit))
+    h.passModel(model)
+    if basis is not None:
+        h.setBasis(basis)
+    h.run()
+
+    info = h.getInfo()
+
+    statistics = {
+        'termination_condition': h.modelStatusToString(h.getModelStatus()).lower(),
+        'objective': info.objective_function_value,
+        'iterations': float(info.simplex_iteration_count),
+        'solver_time': h.getRunTime(),
+    }
+
+    return np.array(h.getSolution().col_value), statistics, h
+
+
+def solve_lp(lp, solver='cbc', options=None, time_limit=None, basis=None):
+    r"""
+    Solves the linear program with `solve_cbc` or `solve_highs`. Only
+    HiGHS starts from a given basis.
+    """
+    if solver == 'cbc':
+        return solve_cbc(lp, options, time_limit)
+
+    return solve_highs(lp, options, time_limit, basis)
+
+
+def has_same_constraints(lp, other):
+    r"""
+    Checks whether two linear programs differ at most in their costs.
+    """
+    if lp.matrix.shape != other.matrix.shape:
+        return False
+
+    return (
+        (lp.matrix != other.matrix).nnz == 0
+        and all(np.array_equal(a, b) for a, b in zip(lp.bounds, other.bounds))
+        and all(np.array_equal(a, b) for a, b in zip(lp.row_bounds, other.row_bounds))
+    )
+
+
+def is_optimal_basis(highs, lp, c, tolerance=1e-9):
+    r"""
+    Checks whether the optimal basis of a solved linear program stays
+    optimal if its costs are replaced by `c`.
+
+    The basic solution does not depend on the costs. It stays optimal as
+    long as the reduced costs computed with the new costs have the sign
+    that the bound of every nonbasic variable requires. The duals are
+    computed with the factorization of the basis that HiGHS keeps after
+    the solve, so nothing is solved again.
+
+    Parameters
+    ----------
+    highs : highspy.Highs
+        Solver instance that has solved the linear program.
+
+    lp : LinearProgram
+        Linear program it has solved.
+
+    c : np.ndarray
+        New costs.
+
+    tolerance : float
+        Tolerance of the sign of the reduced costs relative to the largest
+        cost.
+
+    Returns
+    -------
+    optimal : bool
+    """
+    _, basic_variables = highs.getBasicVariables()
+    basic_variables = np.array(basic_variables)
+
+    # Row logicals have negative indices and no costs.
+    c_basic = np.where(basic_variables >= 0, c[np.maximum(basic_variables, 0)], 0)
+
+    y = np.array(highs.getBasisTransposeSolve(c_basic)[1])
+
+    reduced_costs = c - lp.matrix.T @ y
+
+    basis = highs.getBasis()
+    col_status = np.array([int(s) for s in basis.col_status])
+    row_status = np.array([int(s) for s in basis.row_status])
+
+    lb, ub = lp.bounds
+    row_lower, row_upper = lp.row_bounds
+
+    tolerance *= max(1, np.abs(c).max())
+
+    def has_sign(status, values, fixed):
+        return not (
+            np.any(values[(status == AT_LOWER) & ~fixed] < -tolerance)
+            or np.any(values[(status == AT_UPPER) & ~fixed] > tolerance)
+            or np.any(np.abs(values[status == AT_ZERO]) > tolerance)
+        )
+
+    return has_sign(col_status, reduced_costs, lb == ub) \
+        and has_sign(row_status, y, row_lower == row_upper)
+
+
+def get_results(es, lp, x):
+    r"""
+    Maps the solution of the linear program to the nodes and flows of the
+    EnergySystem.
+
+    Returns
+    -------
+    results : dict
+        Results in the format of `oemof.outputlib.processing.results`.
+    """
+    values = {}
+    for (name, *nodes), index in lp.variables.items():
+        key = tuple(nodes) if len(nodes) == 2 else (nodes[0], None)
+
+        values.setdefault(key, {})[name] = x[index]
+
+    results = {}
+    for key, variables in values.items():
+        sequences = pd.DataFrame(
+            {name: v for name, v in sorted(variables.items()) if len(v) == len(es.timeindex)},
+            index=es.timeindex,
+        )
+        sequences.columns.name = 'variable_name'
+
+        scalars = pd.Series(
+            {name: v[0] for name, v in sorted(variables.items()) if name not in sequences},
+            name=es.timeindex[0], dtype=float,
+        )
+        scalars.index.name = 'variable_name'
+
+        results[key] = {'scalars': scalars, 'sequences': sequences}
+
+    return results
+
+
+def optimize(input_data_dir, results_data_dir=None, solver='cbc', debug=False,
+             solver_options=None):
+    r"""
+    Reads the datapackage, builds its linear program and solves it.
+
+    Aggregated datapackages need the storage linking of `aggregation.py`,
+    which is only available for the oemof model. They are solved with
+    `optimization.optimize`.
+
+    Parameters
+    ----------
+    input_data_dir : str
+        Directory of the preprocessed datapackage.
+
+    results_data_dir : str
+        Directory to save the results to. If None, nothing is written.
+
+    solver : str
+        'cbc' or 'highs'.
+
+    debug : bool
+        Save the MPS file of the linear program to the results directory.
+
+    solver_options : dict
+        Options passed to the solver, see `solve_cbc` and `solve_highs`.
+
+    Returns
+    -------
+    es : oemof.solph.EnergySystem
+        EnergySystem with results and parameters. Its attribute
+        `solver_statistics` holds iterations, solver time, wall time and
+        the time to build the linear program.
+    """
+    es, _ = solve_datapackage(
+        input_data_dir, results_data_dir, solver=solver, debug=debug,
+        solver_options=solver_options,
+    )
+
+    return es
+
+
+def optimize_parametric(reference, input_data_dir, results_data_dir, solver='highs', debug=False,
+                        warm_start=False, solver_options=None):
+    r"""
+    Solves the datapackage unless the optimal basis of a previous scenario
+    is still optimal for it.
+
+    This is the case if the linear program of the datapackage differs
+    from the previous one only in the costs and the reduced costs of the
+    basis keep their signs with the new costs. The solution of the
+    previous scenario is then the solution of this one and only the
+    objective is recomputed. Otherwise, the datapackage is solved normally
+    or, with `warm_start`, starting from the basis of the previous
+    scenario.
+
+    Parameters
+    ----------
+    reference : Solution or None
+        Solution of the previous scenario.
+
+    input_data_dir : str
+        Directory of the preprocessed datapackage.
+
+    results_data_dir : str
+        Directory to write the results to.
+
+    solver : str
+        Only 'highs' returns the basis that is needed to reuse solutions and
+        to warm-start.
+
+    warm_start : bool
+        Start the solver from the basis of the previous scenario if its
+        linear program has the same shape.
+
+    Returns
+    -------
+    reference : Solution or None
+        Solution to be passed on to the next scenario.
+    """
+    if solver != 'highs':
+        logging.warning(
+            f"The solver {solver} does not keep the basis. Solutions are not reused and"
+            " solves are not warm-started."
+        )
+
+    _, reference = solve_datapackage(
+        input_data_dir, results_data_dir, solver=solver, debug=debug, reference=reference,
+        warm_start=warm_start, solver_options=solver_options,
+    )
+
+    return reference
+
+
+def solve_datapackage(input_data_dir, results_data_dir=None, solver='cbc', debug=False,
+                      reference=None, warm_start=False, solver_options=None):
+    r"""
+    Builds and solves the linear program of a datapackage or takes the
+    solution of the reference if its basis is still optimal. With
+    `warm_start`, HiGHS otherwise starts from the basis of the reference
+    if its linear program has the same shape.
+
+    Returns
+    -------
+    es : oemof.solph.EnergySystem
+        EnergySystem with results and parameters.
+
+    solution : Solution or None
+        Solution with its basis. None if the solver does not keep the
+        basis or the datapackage is solved with the oemof backend.
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"The sparse LP backend supports the solvers {SOLVERS}, not '{solver}'.")
+
+    if aggregation.read_mapping(input_data_dir) is not None:
+        logging.warning("The datapackage is aggregated. Solving it with the oemof backend.")
+        es = optimization.optimize(
+            input_data_dir, results_data_dir, solver=solver, debug=debug,
+            solver_options=solver_options,
+        )
+        return es, None
+
+    logging.info("Creating EnergySystem from datapackage")
+    with span('from_datapackage'):
+        es = from_datapackage(
+            os.path.join(input_data_dir, "datapackage.json"),
+            attributemap={}, typemap=TYPEMAP,
+        )
+    es.aggregation = None
+
+    logging.info("Building the sparse linear program")
+    start = time.perf_counter()
+    with span('build_lp'):
+        lp = build_lp(es)
+    build_time = time.perf_counter() - start
+
+    if debug and results_data_dir is not None:
+        mps_file = os.path.join(results_data_dir, 'model.mps')
+        logging.info(f"Saving the mps-file to {mps_file}")
+        write_mps(lp, mps_file)
+
+    start = time.perf_counter()
+    basis = None
+    reused = (
+        reference is not None
+        and has_same_constraints(reference.lp, lp)
+        and is_optimal_basis(reference.highs, lp, lp.c)
+    )
+
+    if reused:
+        logging.info("The basis of the previous scenario is optimal. Taking its solution.")
+        x, highs = reference.x, reference.highs
+        statistics = {
+            'termination_condition': 'optimal',
+            'objective': lp.c @ x,
+            'iterations': 0.,
+            'solver_time': 0.,
+        }
+
+    else:
+        if (
+            warm_start and reference is not None and reference.highs is not None
+            and reference.lp.matrix.shape == lp.matrix.shape
+        ):
+            logging.info("Starting from the basis of the previous scenario")
+            basis = reference.highs.getBasis()
+
+        logging.info(f'Solving the problem using {solver}')
+        with span('solve'):
+            x, statistics, highs = solve_lp(lp, solver, solver_options, basis=basis)
+
+    wall_time = time.perf_counter() - start
+
+    if statistics['termination_condition'] != 'optimal':
+        logging.warning(
+            f"Optimization ended with termination condition {statistics['termination_condition']}"
+        )
+
+    es.solver_statistics = statistics
+    es.solver_statistics.update({
+        'solver': solver,
+        'solver_options': solver_options or {},
+        'warm_start': basis is not None,
+        'wall_time': wall_time,
+        'build_time': build_time,
+        'backend': 'sparse',
+        'reused_basis': reused,
+    })
+    logging.info(f'Solver statistics: {es.solver_statistics}')
+
+    with span('results'):
+        es.results = get_results(es, lp, x)
+        es.params = outputlib.processing.parameter_as_dict(es)
+
+    if results_data_dir is not None:
+        optimization.save_results(es, results_data_dir)
+
+    if highs is None or statistics['termination_condition'] != 'optimal':
+        return es, None
+
+    return es, Solution(lp, x, highs)
+
+
+def compare_objectives(input_data_dir, solver='cbc'):
+    r"""
+    Solves a datapackage with the oemof model and the sparse linear program
+    and compares objective values and build times.
+
+    Returns
+    -------
+    comparison : pd.Series
+    """
+    start = time.perf_counter()
+    m = optimization.build_model(input_data_dir)
+    oemof_build_time = time.perf_counter() - start
+
+    optimization.solve(m, solver=solver)
+
+    es = optimize(input_data_dir, solver=solver)
+
+    objective_oemof = m.objective()
+    objective_sparse = es.solver_statistics['objective']
+
+    comparison = pd.Series({
+        'objective_oemof': objective_oemof,
+        'objective_sparse': objective_sparse,
+        'relative_difference': abs(objective_sparse - objective_oemof)
+        / max(abs(objective_oemof), 1),
+        'build_time_oemof': oemof_build_time,
+        'build_time_sparse': es.solver_statistics['build_time'],
+    })
+
+    return comparison
+
+
+if __name__ == '__main__':
+    scenario_assumptions = get_scenario_assumptions()
+
+    comparison = {}
+    for scenario in scenario_assumptions['scenario']:
+        preprocessed = get_experiment_dirs(scenario)['preprocessed']
+
+        if not os.path.exists(os.path.join(preprocessed, 'datapackage.json')):
+            continue
+
+        if aggregation.read_mapping(preprocessed) is not None:
+            continue
+
+        print(f"Comparing scenario '{scenario}'")
+        comparison[scenario] = compare_objectives(preprocessed)
+
+    comparison = pd.DataFrame(comparison).T
+    comparison.index.name = 'scenario'
+
+    comparison.to_csv(
+        os.path.join(get_experiment_dirs('all_scenarios')['tables'], 'sparse_lp_comparison.csv')
+    )
+
+    print(comparison)
+    print(
+        f"Largest relative difference of the objectives:"
+        f" {comparison['relative_difference'].max():.2e}"
+    )
+    print(
+        f"Mean build time speedup:"
+        f" {(comparison['build_time_oemof'] / comparison['build_time_sparse']).mean():.1f}"
+    )
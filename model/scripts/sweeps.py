@@ -0,0 +1,210 @@
+r"""
+Parameter sweeps declared in config/sweeps.yml.
+
+A sweep varies the assumptions of a base scenario of the scenario table
+along a number of axes. Each axis maps columns of the scenario table to
+their values, either a list of 'values' or a range from 'start' to 'stop'.
+Columns of the same axis are linked and move together, e.g. the gas and
+electricity charges of a fuel switch.
+
+The axes are sampled with one of the designs
+* 'grid': every combination of the values of the axes. Ranges have 'num'
+  evenly spaced values. The first axis changes slowest.
+* 'latin_hypercube': 'samples' points, each axis divided into 'samples'
+  strata of which every one is hit once.
+* 'sobol': 'samples' points of a scrambled Sobol sequence. Needs scipy.
+
+The scenarios of a sweep are expanded lazily, so that large sweeps are
+run in chunks without ever holding the whole scenario table.
+"""
+import itertools
+
+import numpy as np
+
+
+DESIGNS = ['grid', 'latin_hypercube', 'sobol']
+
+# Values of ranges are rounded to this number of decimals, so that e.g. a
+# charge of 114.6 is not written as 114.60000000000001.
+DECIMALS = 10
+
+# Number of Sobol points that are drawn at once.
+SOBOL_CHUNK_SIZE = 1024
+
+
+def get_grid_values(spec):
+    r"""
+    Returns the values of a column on a grid axis.
+    """
+    if 'values' in spec:
+        return list(spec['values'])
+
+    return np.linspace(spec['start'], spec['stop'], int(spec['num'])).round(DECIMALS).tolist()
+
+
+def scale(spec, u):
+    r"""
+    Returns the value of a column at the relative position `u` in [0, 1)
+    of its axis. Lists of values are divided into equal strata.
+    """
+    if 'values' in spec:
+        values = spec['values']
+
+        return values[min(int(u * len(values)), len(values) - 1)]
+
+    return round(spec['start'] + u * (spec['stop'] - spec['start']), DECIMALS)
+
+
+def iter_grid(axes):
+    r"""
+    Yields the assumptions of all points of a full grid over the axes.
+    """
+    values = []
+    for axis in axes:
+        axis_values = {column: get_grid_values(spec) for column, spec in axis.items()}
+
+        if len({len(column_values) for column_values in axis_values.values()}) > 1:
+            raise ValueError(
+                f"The linked columns {list(axis)} of a grid axis need the same number of values."
+            )
+
+        values.append(axis_values)
+
+    lengths = [len(next(iter(axis_values.values()))) for axis_values in values]
+
+    for position in itertools.product(*[range(length) for length in lengths]):
+        yield {
+            column: column_values[i]
+            for axis_values, i in zip(values, position)
+            for column, column_values in axis_values.items()
+        }
+
+
+def get_point(axes, u):
+    r"""
+    Returns the assumptions at the relative position `u` with one entry per
+    axis.
+    """
+    return {
+        column: scale(spec, u_axis)
+        for axis, u_axis in zip(axes, u)
+        for column, spec in axis.items()
+    }
+
+
+def iter_latin_hypercube(axes, samples, seed=None):
+    r"""
+    Yields the assumptions of a Latin hypercube sample. Only the permutation
+    of the strata of each axis is drawn up front.
+    """
+    rng = np.random.default_rng(seed)
+
+    strata = [rng.permutation(samples) for _ in axes]
+
+    for i in range(samples):
+        yield get_point(axes, [(axis_strata[i] + rng.random()) / samples for axis_strata in strata])
+
+
+def iter_sobol(axes, samples, seed=None):
+    r"""
+    Yields the assumptions of a scrambled Sobol sequence.
+    """
+    try:
+        from scipy.stats import qmc
+
+    except ImportError:
+        raise ImportError("The design 'sobol' needs scipy>=1.7.")
+
+    sampler = qmc.Sobol(d=len(axes), scramble=True, seed=seed)
+
+    for start in range(0, samples, SOBOL_CHUNK_SIZE):
+        for u in sampler.random(min(SOBOL_CHUNK_SIZE, samples - start)):
+            yield get_point(axes, u)
+
+
+def iter_points(sweep):
+    r"""
+    Yields the assumptions that a sweep varies for each of its points.
+    """
+    design = sweep.get('design', 'grid')
+
+    axes = sweep['axes']
+
+    if design == 'grid':
+        return iter_grid(axes)
+
+    if design not in DESIGNS:
+        raise ValueError(f"Unknown design '{design}'. Choose one of {DESIGNS}.")
+
+    if not sweep.get('samples'):
+        raise ValueError(f"The design '{design}' needs the number of 'samples'.")
+
+    if design == 'latin_hypercube':
+        return iter_latin_hypercube(axes, int(sweep['samples']), sweep.get('seed'))
+
+    return iter_sobol(axes, int(sweep['samples']), sweep.get('seed'))
+
+
+def expand_sweep(name, sweep, scenario_assumptions):
+    r"""
+    Expands a sweep lazily into rows of the scenario table.
+
+    Parameters
+    ----------
+    name : str
+        Name of the sweep. Its scenarios are named '<name>_<number>'.
+
+    sweep : dict
+        Declaration of the sweep with its 'base' scenario, its 'design',
+        its 'axes' and, for the sampling designs, the number of 'samples'
+        and an optional 'seed'.
+
+    scenario_assumptions : pd.DataFrame
+        Scenario table with the base scenario.
+
+    Yields
+    ------
+    row : pd.Series
+        Assumptions of a scenario of the sweep.
+
+    Raises
+    ------
+    ValueError
+        If the base scenario or a column of an axis is not in the scenario
+        table.
+    """
+    base = scenario_assumptions.loc[scenario_assumptions['scenario'] == sweep['base']]
+
+    if base.empty:
+        raise ValueError(f"The base scenario '{sweep['base']}' of sweep '{name}' does not exist.")
+
+    base = base.iloc[0]
+
+    columns = [column for axis in sweep['axes'] for column in axis]
+
+    unknown = [column for column in columns if column not in base]
+    if unknown:
+        raise ValueError(f"The columns {unknown} of sweep '{name}' are not in the scenario table.")
+
+    for number, point in enumerate(iter_points(sweep)):
+        row = base.copy()
+        row[list(point)] = list(point.values())
+        row['scenario'] = f'{name}_{number}'
+        row.name = number
+
+        yield row
+
+
+def iter_chunks(rows, chunk_size):
+    r"""
+    Yields lists of up to `chunk_size` rows.
+    """
+    rows = iter(rows)
+
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+
+        if not chunk:
+            return
+
+        yield chunk
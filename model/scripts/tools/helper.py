@@ -1,6 +1,10 @@
+import calendar
+import contextlib
+import logging
 import os
 import yaml
 
+import numpy as np
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
@@ -16,6 +20,37 @@ def get_config_file(name):
     return config
 
 
+def get_solver_profile():
+    r"""
+    Returns the solver and solver options of the optimisation.
+
+    They are taken from the solver profile that `solver_benchmark.py`
+    writes to the config directory if it was tuned for the backend
+    configured in run.yml. Otherwise, the solver of run.yml is used
+    with its default options.
+
+    Returns
+    -------
+    profile : dict
+        'solver' and 'options' to pass to the solver.
+    """
+    config = get_config_file('run.yml')
+
+    profile = {'solver': config['solver'], 'options': {}}
+
+    abspath = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+    profile_path = os.path.join(abspath, 'config', 'solver_profile.yml')
+
+    if os.path.exists(profile_path):
+        tuned = get_config_file('solver_profile.yml')
+
+        if tuned.get('backend') == config['backend']:
+            profile.update({'solver': tuned['solver'], 'options': tuned.get('options') or {}})
+
+    return profile
+
+
 def get_experiment_dirs(name=None):
     config = get_config_file('directories.yml')
 
@@ -47,6 +82,70 @@ def get_scenario_assumptions():
     return scenario_assumptions
 
 
+def get_timestep_hours(timeindex):
+    r"""
+    Returns the length of the timesteps of a timeindex in hours.
+    """
+    if timeindex.freq is not None:
+        return pd.Timedelta(timeindex.freq).total_seconds() / 3600
+
+    if len(timeindex) > 1:
+        return (timeindex[1] - timeindex[0]).total_seconds() / 3600
+
+    return 1.
+
+
+def get_horizon_years(timeindex):
+    r"""
+    Returns the length of a timeindex in calendar years. Every timestep
+    counts as its share of the year it starts in, so that a full leap year
+    of 8784 hours is one year as well.
+    """
+    years, timesteps = np.unique(timeindex.year, return_counts=True)
+
+    year_hours = np.array([8784 if calendar.isleap(year) else 8760 for year in years])
+
+    return float(get_timestep_hours(timeindex) * (timesteps / year_hours).sum())
+
+
+@contextlib.contextmanager
+def scenario_logging(logfile, mode='w'):
+    r"""
+    Redirects logging and printed output to a log file while the
+    context is active.
+
+    Parameters
+    ----------
+    logfile : str
+        Path of the log file.
+
+    mode : str
+        'w' to overwrite an existing log file, 'a' to append to it.
+    """
+    root_logger = logging.getLogger()
+
+    previous_handlers = root_logger.handlers
+    previous_level = root_logger.level
+
+    with open(logfile, mode) as log:
+        handler = logging.StreamHandler(log)
+        handler.setFormatter(
+            logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+        )
+
+        root_logger.handlers = [handler]
+        root_logger.setLevel(logging.INFO)
+        logging.captureWarnings(True)
+
+        try:
+            with contextlib.redirect_stdout(log):
+                yield
+        finally:
+            root_logger.handlers = previous_handlers
+            root_logger.setLevel(previous_level)
+            logging.captureWarnings(False)
+
+
 def get_all_file_paths(dir):
     r"""
     Finds all paths of files in a directory.
@@ -0,0 +1,127 @@
+import hashlib
+import inspect
+import json
+import os
+
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def hash_object(obj):
+    r"""
+    Hashes a json-serializable object. Keys of dictionaries are sorted so
+    that the hash does not depend on their order.
+
+    Parameters
+    ----------
+    obj : dict, list, str, numeric
+
+    Returns
+    -------
+    hash : str
+        Hex digest of the object.
+    """
+    serialized = json.dumps(obj, sort_keys=True, default=str)
+
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def hash_files(paths):
+    r"""
+    Hashes the contents of files. Directories are walked and all files
+    found in them are hashed together with their relative path.
+
+    Parameters
+    ----------
+    paths : list
+        List of paths to files or directories.
+
+    Returns
+    -------
+    hash : str
+        Hex digest of all files.
+    """
+    h = hashlib.sha256()
+
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(
+                os.path.join(dir_path, file_name)
+                for dir_path, _, file_names in os.walk(path)
+                for file_name in file_names
+            )
+        else:
+            files = [path]
+
+        for file in files:
+            h.update(os.path.relpath(file, os.path.dirname(path)).encode())
+
+            with open(file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    h.update(chunk)
+
+    return h.hexdigest()
+
+
+def hash_sources(modules):
+    r"""
+    Hashes the source code of python modules.
+
+    Parameters
+    ----------
+    modules : list
+        List of module objects.
+
+    Returns
+    -------
+    hash : str
+        Hex digest of the source files.
+    """
+    return hash_files([inspect.getsourcefile(module) for module in modules])
+
+
+def read_manifest(dir):
+    path = os.path.join(dir, MANIFEST_NAME)
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(dir, input_hash):
+    with open(os.path.join(dir, MANIFEST_NAME), 'w') as f:
+        json.dump({'input_hash': input_hash}, f, indent=4)
+
+
+def remove_manifest(dir):
+    path = os.path.join(dir, MANIFEST_NAME)
+
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def is_up_to_date(dir, input_hash):
+    r"""
+    Checks whether the manifest in a stage directory was written for the
+    same inputs.
+
+    Parameters
+    ----------
+    dir : str
+        Output directory of the stage.
+
+    input_hash : str
+        Hash of the current inputs of the stage.
+
+    Returns
+    -------
+    up_to_date : bool
+    """
+    manifest = read_manifest(dir)
+
+    if manifest is None:
+        return False
+
+    return manifest['input_hash'] == input_hash
@@ -0,0 +1,150 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from tools.manifest import hash_files
+
+
+CACHE_DIR_NAME = '.cache'
+
+# Name of the precomputed sum over all columns in the cache.
+SUM = '__sum__'
+
+
+def get_cache_paths(path):
+    r"""
+    Returns the paths of the cached arrays and of the cache metadata of a
+    raw file. The cache lies in the directory '.cache' next to the file.
+    """
+    cache_dir = os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+
+    name = os.path.basename(path)
+
+    return os.path.join(cache_dir, name + '.npz'), os.path.join(cache_dir, name + '.json')
+
+
+def write_atomically(path, write):
+    r"""
+    Writes a file under a temporary name first, so that parallel scenarios
+    never read a file that is only partly written.
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+
+    with open(tmp_path, 'wb') as f:
+        write(f)
+
+    os.replace(tmp_path, path)
+
+
+def build_cache(path):
+    r"""
+    Parses a raw CSV file whose first column holds the timestamps and saves
+    its columns and their sum as arrays.
+    """
+    arrays_path, metadata_path = get_cache_paths(path)
+
+    os.makedirs(os.path.dirname(arrays_path), exist_ok=True)
+
+    raw = pd.read_csv(path, index_col=0)
+
+    arrays = {column: raw[column].to_numpy(dtype=float) for column in raw.columns}
+    arrays[SUM] = raw.sum(axis=1).to_numpy(dtype=float)
+    arrays['index'] = raw.index.astype(str).to_numpy(dtype=str)
+
+    write_atomically(arrays_path, lambda f: np.savez(f, **arrays))
+
+    metadata = {
+        'mtime': os.path.getmtime(path),
+        'hash': hash_files([path]),
+        'index_name': raw.index.name,
+        'columns': list(raw.columns),
+    }
+
+    write_atomically(metadata_path, lambda f: f.write(json.dumps(metadata, indent=4).encode()))
+
+    return metadata
+
+
+def get_metadata(path):
+    r"""
+    Returns the metadata of the cache of a raw file and builds or renews
+    the cache if the file has changed.
+
+    The modification time is checked first. Only if it has changed, the
+    content is hashed, so that touching a file does not rebuild its cache.
+    """
+    _, metadata_path = get_cache_paths(path)
+
+    if not os.path.exists(metadata_path):
+        return build_cache(path)
+
+    with open(metadata_path) as f:
+        metadata = json.load(f)
+
+    mtime = os.path.getmtime(path)
+
+    if metadata['mtime'] == mtime:
+        return metadata
+
+    if metadata['hash'] != hash_files([path]):
+        return build_cache(path)
+
+    metadata['mtime'] = mtime
+
+    write_atomically(metadata_path, lambda f: f.write(json.dumps(metadata, indent=4).encode()))
+
+    return metadata
+
+
+def read_raw(path):
+    r"""
+    Reads a raw CSV file through the cache. The result is the same as of
+    `pd.read_csv(path, index_col=0)` for files with numeric columns.
+
+    Parameters
+    ----------
+    path : str
+        Path of the raw file.
+
+    Returns
+    -------
+    raw : pd.DataFrame
+    """
+    metadata = get_metadata(path)
+
+    arrays_path, _ = get_cache_paths(path)
+
+    with np.load(arrays_path, allow_pickle=False) as arrays:
+        index = pd.Index(arrays['index'], name=metadata['index_name'])
+
+        return pd.DataFrame({column: arrays[column] for column in metadata['columns']}, index=index)
+
+
+def read_raw_column(path, column=None):
+    r"""
+    Reads a column of a raw CSV file through the cache.
+
+    Parameters
+    ----------
+    path : str
+        Path of the raw file.
+
+    column : str
+        Name of the column. If None, the precomputed sum over all columns
+        is returned.
+
+    Returns
+    -------
+    column : pd.Series
+        Values with the timestamps of the file as strings as index.
+    """
+    metadata = get_metadata(path)
+
+    arrays_path, _ = get_cache_paths(path)
+
+    with np.load(arrays_path, allow_pickle=False) as arrays:
+        index = pd.Index(arrays['index'], name=metadata['index_name'])
+
+        return pd.Series(arrays[SUM if column is None else column], index=index, name=column)
@@ -0,0 +1,269 @@
+r"""
+Compact results of a solved EnergySystem.
+
+Instead of pickling the whole EnergySystem with `es.dump`, the results
+are saved as plain numbers that are read without oemof:
+* 'results.npz' holds one array per sequence of the results and of the
+  parameters in `PARAMETERS`. Identical sequences, e.g. the flows into and
+  out of a lossless conversion, share one array and constant sequences,
+  e.g. unused flows, have none.
+* 'results.csv' lists all variables and parameters with their source,
+  their flow or component and either their scalar value or their array.
+* 'components.csv' holds the label, type, carrier, tech, buses and
+  capacity of every node.
+
+The arrays are compressed and only read when a variable that uses them is
+selected.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+RESULTS_FILE = 'results.npz'
+
+VARIABLES_FILE = 'results.csv'
+
+COMPONENTS_FILE = 'components.csv'
+
+# Parameters of flows and components that are kept. All variables of the
+# results are kept.
+PARAMETERS = ['variable_costs', 'investment_ep_costs', 'nominal_value']
+
+VARIABLE_COLUMNS = ['source', 'from', 'to', 'var_name', 'value', 'array', 'length']
+
+COMPONENT_COLUMNS = ['label', 'type', 'carrier', 'tech', 'bus', 'capacity']
+
+
+class Results:
+    r"""
+    Results and parameters of a solved EnergySystem.
+
+    Parameters
+    ----------
+    variables : pd.DataFrame
+        Variables and parameters with the columns in `VARIABLE_COLUMNS`.
+
+    components : pd.DataFrame
+        Nodes indexed by label with the columns in `COMPONENT_COLUMNS`.
+
+    timeindex : pd.DatetimeIndex
+        Timeindex of the sequences.
+
+    arrays : dict-like
+        Arrays of the sequences keyed by the names in the column 'array' of
+        the variables.
+    """
+    def __init__(self, variables, components, timeindex, arrays):
+        self.variables = variables
+        self.components = components
+        self.timeindex = timeindex
+        self.arrays = arrays
+
+    def get_sequence(self, var_name, value, array, length):
+        r"""
+        Returns a sequence from its array or its constant value.
+        """
+        values = np.full(int(length), value) if pd.isna(array) else self.arrays[array]
+
+        index = self.timeindex if len(values) == len(self.timeindex) \
+            else pd.RangeIndex(len(values))
+
+        return pd.Series(values, index=index, name=var_name)
+
+    def select(self, var_name, source='results'):
+        r"""
+        Selects a variable or parameter of all flows and components that
+        have it.
+
+        Parameters
+        ----------
+        var_name : str
+            Name of the variable or parameter, e.g. 'flow' or 'invest'.
+
+        source : str
+            'results' or 'params'.
+
+        Returns
+        -------
+        selected : dict
+            Scalar values or sequences keyed by the labels of the nodes the
+            flow goes from and to. The second label of components is None.
+        """
+        variables = self.variables.loc[
+            (self.variables['source'] == source) & (self.variables['var_name'] == var_name)
+        ]
+
+        selected = {}
+        for key, value, array, length in zip(
+            zip(variables['from'], variables['to'].where(variables['to'].notna(), None)),
+            variables['value'],
+            variables['array'],
+            variables['length'],
+        ):
+            if pd.isna(length):
+                selected[key] = value
+
+            else:
+                selected[key] = self.get_sequence(var_name, value, array, length)
+
+        return selected
+
+    def get_type(self, label):
+        r"""
+        Returns the type of a component or None if the label is no
+        component or has no type.
+        """
+        if label not in self.components.index or pd.isna(self.components.at[label, 'type']):
+            return None
+
+        return self.components.at[label, 'type']
+
+    def get_attribute(self, labels, attribute):
+        r"""
+        Returns an attribute of the components of a list of labels. Labels
+        that are no components get NaN.
+        """
+        return [
+            self.components.at[label, attribute] if label in self.components.index else np.nan
+            for label in labels
+        ]
+
+    def has_type(self, labels, types):
+        r"""
+        Checks for a list of labels whether their components have one of
+        the types.
+        """
+        return np.isin(self.get_attribute(labels, 'type'), types)
+
+
+def is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def get_label(node):
+    return None if node is None else str(node)
+
+
+def get_components(es):
+    r"""
+    Returns the label, type, carrier, tech, buses and capacity of all nodes
+    of an EnergySystem.
+    """
+    components = pd.DataFrame([
+        {
+            'label': get_label(node),
+            'type': getattr(node, 'type', np.nan),
+            'carrier': getattr(node, 'carrier', np.nan),
+            'tech': getattr(node, 'tech', np.nan),
+            'bus': ','.join(
+                str(n) for n in list(node.inputs) + list(node.outputs) if n is not None
+            ) or np.nan,
+            'capacity': getattr(node, 'capacity', None)
+            if is_number(getattr(node, 'capacity', None)) else np.nan,
+        }
+        for node in es.nodes
+    ], columns=COMPONENT_COLUMNS)
+
+    return components.set_index('label')
+
+
+def collect_results(es):
+    r"""
+    Collects the results and parameters of a solved EnergySystem.
+
+    Parameters
+    ----------
+    es : oemof.solph.EnergySystem
+        EnergySystem with the attributes `results` and `params`.
+
+    Returns
+    -------
+    results : Results
+    """
+    variables = []
+    arrays = {}
+    array_names = {}
+
+    timeindex = next(
+        (v['sequences'].index for v in es.results.values() if not v['sequences'].empty),
+        es.timeindex,
+    )
+
+    for source, data, names in [('results', es.results, None), ('params', es.params, PARAMETERS)]:
+        for (node, other), values in data.items():
+            key = {'source': source, 'from': get_label(node), 'to': get_label(other)}
+
+            for var_name, value in values['scalars'].items():
+                if (names is None or var_name in names) and is_number(value):
+                    variables.append({**key, 'var_name': var_name, 'value': value})
+
+            for var_name, sequence in values['sequences'].items():
+                if names is not None and var_name not in names:
+                    continue
+
+                sequence = sequence.to_numpy(dtype=float)
+
+                variable = {**key, 'var_name': var_name, 'length': len(sequence)}
+
+                if len(sequence) and (sequence == sequence[0]).all():
+                    variable['value'] = sequence[0]
+
+                else:
+                    # Identical sequences share one array.
+                    array = array_names.setdefault(sequence.tobytes(), f'sequence_{len(arrays)}')
+                    arrays[array] = sequence
+
+                    variable['array'] = array
+
+                variables.append(variable)
+
+    return Results(
+        pd.DataFrame(variables, columns=VARIABLE_COLUMNS),
+        get_components(es),
+        pd.DatetimeIndex(timeindex, name='timeindex'),
+        arrays,
+    )
+
+
+def dump_results(results, dir):
+    r"""
+    Saves results to a directory.
+    """
+    results.variables.to_csv(os.path.join(dir, VARIABLES_FILE), index=False)
+
+    results.components.to_csv(os.path.join(dir, COMPONENTS_FILE))
+
+    np.savez_compressed(
+        os.path.join(dir, RESULTS_FILE), timeindex=results.timeindex.asi8, **results.arrays
+    )
+
+
+def load_results(dir):
+    r"""
+    Reads results that were saved with `dump_results`. The arrays of the
+    sequences are only read when they are selected.
+
+    Returns
+    -------
+    results : Results
+    """
+    labels = {column: str for column in ['from', 'to', 'label', 'type', 'carrier', 'tech', 'bus']}
+
+    # The values are parsed exactly as they were written.
+    variables = pd.read_csv(
+        os.path.join(dir, VARIABLES_FILE), dtype=labels, keep_default_na=False, na_values=[''],
+        float_precision='round_trip',
+    )
+
+    components = pd.read_csv(
+        os.path.join(dir, COMPONENTS_FILE), dtype=labels, keep_default_na=False, na_values=[''],
+        float_precision='round_trip',
+    ).set_index('label')
+
+    arrays = np.load(os.path.join(dir, RESULTS_FILE), allow_pickle=False)
+
+    timeindex = pd.DatetimeIndex(arrays['timeindex'], name='timeindex')
+
+    return Results(variables, components, timeindex, arrays)
@@ -0,0 +1,190 @@
+import contextlib
+import os
+import types
+
+import datapackage as dp
+import numpy as np
+import pandas as pd
+
+from oemof.solph import EnergySystem
+# Importing oemof.tabular.datapackage adds `from_datapackage` to the
+# EnergySystem.
+from oemof.tabular.datapackage import reading
+
+from tools.helper import get_config_file
+
+
+# Directory next to 'data/sequences' that holds the binary sequences.
+BINARY_DIR_NAME = 'sequences_binary'
+
+
+def get_sequence_format():
+    r"""
+    Returns the format of the sequence resources set in run.yml, 'csv' or
+    'npz'.
+    """
+    return get_config_file('run.yml').get('sequence_format') or 'csv'
+
+
+def get_binary_path(path):
+    r"""
+    Returns the path of the binary file of a sequences resource, e.g.
+    'data/sequences_binary/heat-demand_profile.npz' for
+    'data/sequences/heat-demand_profile.csv'.
+    """
+    data_dir = os.path.dirname(os.path.dirname(path))
+
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    return os.path.join(data_dir, BINARY_DIR_NAME, name + '.npz')
+
+
+def has_binary(path):
+    r"""
+    Checks whether a sequences resource has a binary file that is at least
+    as new as its CSV file.
+    """
+    binary_path = get_binary_path(path)
+
+    return os.path.exists(binary_path) and os.path.getmtime(binary_path) >= os.path.getmtime(path)
+
+
+def write_sequences(sequences, path, sequence_format=None):
+    r"""
+    Writes a sequences resource as CSV file. With the format 'npz', the
+    sequences are additionally saved as binary file with one array per
+    column, which `from_datapackage` reads instead of the CSV file.
+
+    Existing files are removed first, because they may be hardlinks shared
+    with other datapackages.
+
+    Parameters
+    ----------
+    sequences : pd.Series or pd.DataFrame
+        Sequences with a DatetimeIndex.
+
+    path : str
+        Path of the CSV file in 'data/sequences'.
+
+    sequence_format : str
+        'csv' or 'npz'. If None, the format set in run.yml is used.
+    """
+    sequences = sequences.to_frame() if isinstance(sequences, pd.Series) else sequences
+
+    binary_path = get_binary_path(path)
+
+    for file in (path, binary_path):
+        if os.path.exists(file):
+            os.remove(file)
+
+    sequences.to_csv(path, header=True)
+
+    if (sequence_format or get_sequence_format()) != 'npz':
+        return
+
+    os.makedirs(os.path.dirname(binary_path), exist_ok=True)
+
+    # The binary file holds the values of the CSV file as oemof.tabular
+    # parses them, e.g. 0.1 for a float32 0.1, so that both give the same
+    # model.
+    parsed = pd.read_csv(path, index_col=0, float_precision='round_trip')
+
+    arrays = {column: parsed[column].to_numpy(dtype=float) for column in sequences.columns}
+    arrays['timeindex'] = pd.DatetimeIndex(sequences.index).asi8
+
+    np.savez(binary_path, **arrays)
+
+
+def read_binary_sequences(path):
+    r"""
+    Reads the binary file of a sequences resource.
+
+    Returns
+    -------
+    sequences : pd.DataFrame
+    """
+    with np.load(get_binary_path(path), allow_pickle=False) as arrays:
+        columns = [name for name in arrays.files if name != 'timeindex']
+
+        return pd.DataFrame(
+            {column: arrays[column] for column in columns},
+            index=pd.DatetimeIndex(arrays['timeindex'], name='timeindex'),
+        )
+
+
+class _Package(dp.Package):
+    r"""
+    Datapackage whose sequence resources with a binary file are not parsed
+    from CSV.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        for resource in self.resources:
+            if is_sequence_resource(resource) and has_binary(resource.source):
+                resource.read = lambda *args, **kwargs: []
+
+
+def is_sequence_resource(resource):
+    r"""
+    Checks whether a datapackage resource lies in 'data/sequences'.
+    """
+    path = resource.descriptor['path']
+
+    return isinstance(path, str) and path.startswith('data/sequences/')
+
+
+def _read_sequences(resource, timeindices=None, parse=reading.sequences):
+    r"""
+    Replaces `oemof.tabular.datapackage.reading.sequences`. Reads a
+    sequences resource from its binary file if it has one.
+    """
+    if not (is_sequence_resource(resource) and has_binary(resource.source)):
+        return parse(resource, timeindices)
+
+    sequences = read_binary_sequences(resource.source)
+
+    if timeindices is not None:
+        timeindices[resource.name] = list(sequences.index.to_pydatetime())
+
+    return {column: sequences[column].tolist() for column in sequences.columns}
+
+
+@contextlib.contextmanager
+def binary_sequence_reading():
+    r"""
+    Makes oemof.tabular read sequence resources from their binary files
+    while the context is active.
+    """
+    original_dp, original_sequences = reading.dp, reading.sequences
+
+    reading.dp = types.SimpleNamespace(Package=_Package, exceptions=dp.exceptions)
+    reading.sequences = _read_sequences
+
+    try:
+        yield
+
+    finally:
+        reading.dp, reading.sequences = original_dp, original_sequences
+
+
+def from_datapackage(path, **kwargs):
+    r"""
+    Creates an EnergySystem from a datapackage like
+    `EnergySystem.from_datapackage`, but reads the sequences from their
+    binary files where these exist.
+
+    Parameters
+    ----------
+    path : str
+        Path of the datapackage.json.
+
+    kwargs :
+        Passed to `EnergySystem.from_datapackage`.
+
+    Returns
+    -------
+    es : oemof.solph.EnergySystem
+    """
+    with binary_sequence_reading():
+        return EnergySystem.from_datapackage(path, **kwargs)
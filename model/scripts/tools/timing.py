@@ -0,0 +1,136 @@
+import contextlib
+import json
+import os
+import time
+
+import pandas as pd
+
+
+SPANS_NAME = 'timing.jsonl'
+
+# File that spans are written to and names of the spans that are open.
+_spans_file = None
+_open_spans = []
+
+
+@contextlib.contextmanager
+def recording(path, mode='w'):
+    r"""
+    Writes all spans that end inside the context to a JSON lines file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file.
+
+    mode : str
+        'w' to start a new file, 'a' to append to it.
+    """
+    global _spans_file
+
+    previous = _spans_file
+
+    with open(path, mode) as f:
+        _spans_file = f
+        try:
+            yield
+
+        finally:
+            _spans_file = previous
+
+
+@contextlib.contextmanager
+def span(name):
+    r"""
+    Measures the wall time of the code inside the context. If spans are
+    recorded, a line with name, parent span, start, duration and whether
+    the code ran through is written. Otherwise, only the clock is read.
+
+    Parameters
+    ----------
+    name : str
+        Name of the span.
+    """
+    parent = _open_spans[-1] if _open_spans else None
+    _open_spans.append(name)
+
+    start = time.time()
+    counter = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+
+    finally:
+        duration = time.perf_counter() - counter
+        _open_spans.pop()
+
+        if _spans_file is not None:
+            _spans_file.write(json.dumps({
+                'span': name, 'parent': parent, 'start': start, 'duration': duration, 'ok': ok,
+            }) + '\n')
+            _spans_file.flush()
+
+
+def read_spans(paths):
+    r"""
+    Reads the spans of several scenarios.
+
+    Parameters
+    ----------
+    paths : dict
+        Paths of the span files keyed by scenario.
+
+    Returns
+    -------
+    spans : pd.DataFrame
+        One row per span with the columns of the span file and 'scenario'.
+    """
+    spans = []
+    for scenario, path in paths.items():
+        if not os.path.exists(path):
+            continue
+
+        with open(path) as f:
+            spans.extend(dict(json.loads(line), scenario=scenario) for line in f if line.strip())
+
+    return pd.DataFrame(spans, columns=['scenario', 'span', 'parent', 'start', 'duration', 'ok'])
+
+
+def summarize_spans(spans, n_slowest=3):
+    r"""
+    Aggregates the spans across scenarios. Spans that occur several times
+    in a scenario, e.g. one solve per rolling horizon window, are summed
+    per scenario first.
+
+    Parameters
+    ----------
+    spans : pd.DataFrame
+        Spans as returned by `read_spans`.
+
+    n_slowest : int
+        Number of slowest scenarios that are listed per span.
+
+    Returns
+    -------
+    summary : pd.DataFrame
+        Number of scenarios, median, 95th percentile, maximum and total
+        duration in seconds and the slowest scenarios of each span,
+        sorted by total duration.
+    """
+    durations = spans.groupby(['span', 'scenario'])['duration'].sum()
+
+    by_span = durations.groupby(level='span')
+
+    summary = pd.DataFrame({
+        'scenarios': by_span.size(),
+        'median': by_span.median(),
+        'p95': by_span.quantile(0.95),
+        'max': by_span.max(),
+        'total': by_span.sum(),
+        'slowest_scenarios': by_span.apply(
+            lambda d: ', '.join(d.droplevel('span').nlargest(n_slowest).index)
+        ),
+    })
+
+    return summary.sort_values('total', ascending=False)
@@ -0,0 +1,332 @@
+r"""
+Pre-flight validation of preprocessed datapackages.
+
+Broken inputs, e.g. NaNs in a sequence, a missing cost or an empty
+efficiency, otherwise only surface after the model is built or as an
+infeasible solve. The checks here only read the element and sequence files
+and run in milliseconds, so that a broken scenario fails before it takes a
+solver slot.
+
+The datapackage is checked for
+* foreign keys of the elements to the buses and sequences as defined in
+  `preprocessing.FOREIGN_KEYS`,
+* missing, NaN or infinite parameters of the elements,
+* the sign conventions of capacities, costs, efficiencies and loss rates,
+* NaN or infinite values and negative load profiles in the sequences,
+* sequences that do not share one regular timeindex or do not match the
+  timeindex of the scenario.
+"""
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+import aggregation
+import preprocessing
+from tools.sequences import has_binary, read_binary_sequences
+
+
+# Fields of the foreign keys to the buses.
+BUS_FOREIGN_KEYS = {
+    'bus': ['bus'],
+    'from_to_bus': ['from_bus', 'to_bus'],
+    'chp': ['fuel_bus', 'electricity_bus', 'heat_bus'],
+}
+
+# Parameters that elements of a type need.
+REQUIRED_FIELDS = {
+    'conversion': ['capacity', 'efficiency'],
+    'extraction': [
+        'capacity', 'electric_efficiency', 'thermal_efficiency', 'condensing_efficiency'
+    ],
+    'storage': ['capacity', 'storage_capacity', 'efficiency', 'loss_rate'],
+    'load': ['amount'],
+    'shortage': ['marginal_cost'],
+}
+
+# Parameters that expandable elements of a type need additionally.
+EXPANSION_FIELDS = {
+    'conversion': ['capacity_cost'],
+    'storage': ['capacity_cost', 'storage_capacity_cost'],
+}
+
+NON_NEGATIVE_FIELDS = [
+    'capacity', 'storage_capacity', 'capacity_cost', 'storage_capacity_cost', 'amount'
+]
+
+POSITIVE_FIELDS = [
+    'efficiency', 'electric_efficiency', 'thermal_efficiency', 'condensing_efficiency'
+]
+
+# Parameters that are shares between 0 and 1.
+SHARE_FIELDS = [
+    'loss_rate', 'electric_efficiency', 'thermal_efficiency', 'condensing_efficiency'
+]
+
+
+class ValidationError(ValueError):
+    r"""Raised if a datapackage does not pass the validation."""
+
+
+def get_element_table(dir):
+    r"""
+    Reads the elements of a datapackage into one table indexed by resource
+    and element name. The values are kept as strings, empty values are NaN.
+    Parsing the few rows with the csv module is much faster than one
+    `pd.read_csv` per resource.
+    """
+    rows = []
+    for file in sorted(os.listdir(dir)):
+        with open(os.path.join(dir, file), newline='') as f:
+            for row in csv.DictReader(f, delimiter=';'):
+                row['resource'] = os.path.splitext(file)[0]
+                rows.append(row)
+
+    return pd.DataFrame(rows).replace('', np.nan).set_index(['resource', 'name'])
+
+
+def get_sequences(dir):
+    r"""
+    Reads the sequences of a datapackage keyed by resource name, from their
+    binary files where these are up to date.
+    """
+    sequences = {}
+
+    for file in sorted(os.listdir(dir)):
+        path = os.path.join(dir, file)
+
+        if has_binary(path):
+            value = read_binary_sequences(path)
+
+        else:
+            value = pd.read_csv(path, index_col=0, parse_dates=True)
+
+        sequences.update({os.path.splitext(file)[0]: value})
+
+    return sequences
+
+
+def get_sequence_resource(key, element):
+    r"""
+    Returns the name of the sequences resource that a foreign key of an
+    element refers to, as set up by `oemof.tabular` in `infer_metadata`.
+    """
+    if key == 'profile':
+        return element + '_profile'
+
+    return key + '_profile'
+
+
+def check_foreign_keys(elements, sequences):
+    r"""
+    Checks that the buses and sequence columns the elements refer to exist.
+    """
+    errors = []
+
+    resources = elements.index.unique('resource')
+
+    buses = set(elements.loc['bus'].index) if 'bus' in resources else set()
+
+    for key, names in preprocessing.FOREIGN_KEYS.items():
+        for name in names:
+            if name not in resources:
+                errors.append(f"Element resource '{name}' is missing.")
+                continue
+
+            if key in BUS_FOREIGN_KEYS:
+                references = {field: buses for field in BUS_FOREIGN_KEYS[key]}
+
+            else:
+                resource = get_sequence_resource(key, name)
+
+                if resource not in sequences:
+                    errors.append(f"Sequence resource '{resource}' of '{name}.{key}' is missing.")
+                    continue
+
+                references = {key: set(sequences[resource].columns)}
+
+            for field, valid in references.items():
+                if field not in elements:
+                    errors.append(f"Field '{name}.{field}' is missing.")
+                    continue
+
+                values = elements.loc[name, field]
+
+                for element, value in values[~values.isin(valid)].items():
+                    errors.append(
+                        f"'{name}.{field}' of '{element}' refers to '{value}',"
+                        f" which does not exist."
+                    )
+
+    return errors
+
+
+def check_elements(elements):
+    r"""
+    Checks that the elements have all parameters they need and that these
+    are finite and keep to the sign conventions.
+    """
+    fields = sorted(
+        {field for kind_fields in REQUIRED_FIELDS.values() for field in kind_fields}
+        | {field for kind_fields in EXPANSION_FIELDS.values() for field in kind_fields}
+        | set(NON_NEGATIVE_FIELDS + POSITIVE_FIELDS + SHARE_FIELDS)
+    )
+
+    values = elements.reindex(columns=fields).apply(pd.to_numeric, errors='coerce')
+
+    element_type = elements['type'] if 'type' in elements \
+        else pd.Series(np.nan, index=elements.index)
+
+    expandable = elements['expandable'].astype(str).str.lower() == 'true' \
+        if 'expandable' in elements else pd.Series(False, index=elements.index)
+
+    needed = pd.DataFrame({
+        field: element_type.isin(
+            [kind for kind, kind_fields in REQUIRED_FIELDS.items() if field in kind_fields]
+        ) | expandable & element_type.isin(
+            [kind for kind, kind_fields in EXPANSION_FIELDS.items() if field in kind_fields]
+        )
+        for field in fields
+    })
+
+    violations = {
+        'missing or not finite': needed & ~np.isfinite(values),
+        'negative': values[NON_NEGATIVE_FIELDS] < 0,
+        'not positive': values[POSITIVE_FIELDS] <= 0,
+        'not between 0 and 1': (values[SHARE_FIELDS] < 0) | (values[SHARE_FIELDS] > 1),
+    }
+
+    errors = []
+    for condition, violated in violations.items():
+        violated = violated.stack()
+
+        for (resource, element, field) in violated.index[violated]:
+            errors.append(f"'{resource}.{field}' of '{element}' is {condition}.")
+
+    return errors
+
+
+def check_sequences(sequences, elements):
+    r"""
+    Checks that the sequences are finite, that the load profiles are not
+    negative and that all sequences share one regular timeindex.
+    """
+    errors = []
+
+    resources = elements.index.unique('resource')
+
+    profiles = set()
+    for name in preprocessing.FOREIGN_KEYS.get('profile', []):
+        if name in resources and 'profile' in elements:
+            profiles.update(
+                (get_sequence_resource('profile', name), column)
+                for column in elements.loc[name, 'profile']
+            )
+
+    timeindex = None
+    for resource, df in sequences.items():
+        values = df.to_numpy(dtype=float)
+
+        for column in df.columns[~np.isfinite(values).all(axis=0)]:
+            errors.append(f"Sequence '{resource}.{column}' has NaN or infinite values.")
+
+        for column in df.columns[(values < 0).any(axis=0)]:
+            if (resource, column) in profiles:
+                errors.append(f"Load profile '{resource}.{column}' has negative values.")
+
+        index = pd.DatetimeIndex(df.index)
+
+        if timeindex is None:
+            timeindex = index
+
+            steps = np.diff(index.asi8)
+
+            if len(steps) and (steps != steps[0]).any():
+                errors.append(f"The timeindex of sequence '{resource}' is not regular.")
+
+        elif not index.equals(timeindex):
+            errors.append(f"Sequence '{resource}' does not share the timeindex of the others.")
+
+    return errors
+
+
+def check_timeindex(timeindex, scenario_assumptions, mapping=None):
+    r"""
+    Checks the timeindex of the sequences against the resolution, start and
+    number of timesteps of the scenario. Of an aggregated datapackage, the
+    full timeindex of the aggregation mapping is checked instead.
+    """
+    errors = []
+
+    full_timeindex = timeindex if mapping is None else pd.DatetimeIndex(mapping.index)
+
+    if mapping is not None and mapping['timestep'].max() >= len(timeindex):
+        errors.append(
+            f"The aggregation mapping refers to timestep {mapping['timestep'].max()},"
+            f" but the sequences have {len(timeindex)} timesteps."
+        )
+
+    resolution = preprocessing.get_resolution(scenario_assumptions)
+    if resolution is not None and len(timeindex) > 1 \
+            and timeindex[1] - timeindex[0] != pd.Timedelta(to_offset(resolution)):
+        errors.append(
+            f"The timesteps of the sequences are {timeindex[1] - timeindex[0]},"
+            f" but the resolution of the scenario is {resolution}."
+        )
+
+    start = preprocessing.get_setting(scenario_assumptions, 'start')
+    if start is not None and full_timeindex[0] != pd.Timestamp(start):
+        errors.append(
+            f"The sequences start at {full_timeindex[0]}, but the scenario starts at {start}."
+        )
+
+    periods = preprocessing.get_setting(scenario_assumptions, 'periods')
+    if scenario_assumptions.get('debug'):
+        periods = 3
+
+    if periods is not None and len(full_timeindex) != int(periods):
+        errors.append(
+            f"The sequences have {len(full_timeindex)} timesteps, but the scenario has"
+            f" {int(periods)}."
+        )
+
+    return errors
+
+
+def validate_datapackage(path, scenario_assumptions=None):
+    r"""
+    Validates a preprocessed datapackage before it is solved.
+
+    Parameters
+    ----------
+    path : str
+        Root directory of the datapackage.
+
+    scenario_assumptions : dict-like
+        Assumptions of the scenario to check the timeindex against. If
+        None, the timeindex is only checked for consistency.
+
+    Raises
+    ------
+    ValidationError
+        Listing all problems found in the datapackage.
+    """
+    elements = get_element_table(os.path.join(path, 'data', 'elements'))
+
+    sequences = get_sequences(os.path.join(path, 'data', 'sequences'))
+
+    errors = check_foreign_keys(elements, sequences) \
+        + check_elements(elements) \
+        + check_sequences(sequences, elements)
+
+    if scenario_assumptions is not None and sequences:
+        timeindex = pd.DatetimeIndex(next(iter(sequences.values())).index)
+
+        errors += check_timeindex(timeindex, scenario_assumptions, aggregation.read_mapping(path))
+
+    if errors:
+        raise ValidationError(
+            f"The datapackage {path} is invalid:\n" + '\n'.join(f"  - {error}" for error in errors)
+        )
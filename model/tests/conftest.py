@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from tools.helper import get_experiment_dirs, get_scenario_assumptions  # noqa: E402
+
+
+@pytest.fixture
+def raw_dir():
+    r"""
+    Directory of the raw data. The tests that need it are skipped if the
+    raw sequences of 2017 listed in the README have not been added.
+    """
+    raw_dir = get_experiment_dirs()['raw']
+
+    if not os.path.exists(os.path.join(raw_dir, 'demand_heat_2017.csv')):
+        pytest.skip("The raw sequences of 2017 are missing.")
+
+    return raw_dir
+
+
+@pytest.fixture
+def scenario_assumptions():
+    r"""
+    The first two scenarios of the scenario table on the hourly timeindex
+    of 2017.
+    """
+    import preprocessing
+
+    return preprocessing.set_timeindex(get_scenario_assumptions().iloc[:2], years=[2017])
@@ -0,0 +1,17 @@
+import pandas as pd
+import pytest
+
+from tools.helper import get_horizon_years
+
+
+@pytest.mark.parametrize('start, periods, freq, years', [
+    ('2017', 8760, 'H', 1),
+    ('2016', 8784, 'H', 1),
+    ('2016', 35136, '15min', 1),
+    ('2016', 8784 + 8760, 'H', 2),
+    ('2017', 3, 'H', 3 / 8760),
+])
+def test_horizon_years(start, periods, freq, years):
+    timeindex = pd.date_range(start, periods=periods, freq=freq)
+
+    assert get_horizon_years(timeindex) == years
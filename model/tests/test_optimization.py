@@ -0,0 +1,36 @@
+import pytest
+from pyomo.opt import SolverFactory
+
+import optimization
+import preprocessing
+
+
+@pytest.fixture
+def datapackages(scenario_assumptions, raw_dir, tmp_path):
+    r"""
+    Datapackages of the first two scenarios, which differ only in costs.
+    """
+    destinations = {
+        scenario: str(tmp_path / scenario) for scenario in scenario_assumptions['scenario']
+    }
+
+    assert preprocessing.preprocess_batch(scenario_assumptions, raw_dir, destinations) == {}
+
+    return list(destinations.values())
+
+
+@pytest.mark.skipif(not SolverFactory('cbc').available(False), reason="cbc is not available")
+def test_persistent_model_for_cost_scenarios(datapackages):
+    first, second = datapackages
+
+    m = optimization.build_model(first)
+    optimization.solve(m)
+
+    # Raises if the model had to be rebuilt.
+    optimization.update_model(m, second)
+    optimization.solve(m)
+
+    reference = optimization.build_model(second)
+    optimization.solve(reference)
+
+    assert m.objective() == pytest.approx(reference.objective(), rel=1e-6)
@@ -0,0 +1,99 @@
+import filecmp
+import os
+
+import pandas as pd
+import pytest
+
+import aggregation
+import preprocessing
+import price_ensemble
+
+
+def preprocess_batch(scenario_assumptions, raw_dir, tmp_path):
+    destinations = {
+        scenario: str(tmp_path / scenario) for scenario in scenario_assumptions['scenario']
+    }
+
+    failed = preprocessing.preprocess_batch(scenario_assumptions, raw_dir, destinations)
+
+    return failed, destinations
+
+
+def read_heat_demand(destination):
+    return pd.read_csv(
+        os.path.join(destination, 'data', 'sequences', 'heat-demand_profile.csv'), index_col=0
+    )
+
+
+def test_batch_without_price_ensemble(scenario_assumptions, raw_dir, tmp_path):
+    failed, destinations = preprocess_batch(scenario_assumptions, raw_dir, tmp_path)
+
+    assert failed == {}
+
+    for destination in destinations.values():
+        assert len(read_heat_demand(destination)) == 8760
+
+
+def test_batch_with_aggregation(scenario_assumptions, raw_dir, tmp_path):
+    scenario_assumptions = aggregation.set_aggregation(scenario_assumptions, 10, 24, [])
+
+    failed, destinations = preprocess_batch(scenario_assumptions, raw_dir, tmp_path)
+
+    assert failed == {}
+
+    for destination in destinations.values():
+        assert len(read_heat_demand(destination)) == 240
+
+    # Only the datapackages are left in the directory.
+    assert sorted(os.listdir(tmp_path)) == sorted(destinations)
+
+
+def test_batch_with_failing_group(scenario_assumptions, raw_dir, tmp_path):
+    scenario_assumptions = scenario_assumptions.copy()
+    scenario_assumptions['start'] = None
+    scenario_assumptions.loc[scenario_assumptions.index[0], 'start'] = '2020-01-01'
+
+    failed, destinations = preprocess_batch(scenario_assumptions, raw_dir, tmp_path)
+
+    first, second = scenario_assumptions['scenario']
+
+    assert list(failed) == [first]
+    assert 'ValueError' in failed[first]
+
+    assert len(read_heat_demand(destinations[second])) == 8760
+
+    # The master file of the failed group is removed as well.
+    assert os.listdir(tmp_path) == [second]
+
+
+@pytest.mark.parametrize('resolution', [None, '4H'])
+def test_batch_equals_preprocess(scenario_assumptions, raw_dir, tmp_path, resolution):
+    scenario_assumptions = price_ensemble.set_price_ensemble(scenario_assumptions.iloc[:1], 1)
+
+    if resolution is not None:
+        scenario_assumptions = preprocessing.set_resolution(scenario_assumptions, resolution)
+
+    failed, destinations = preprocess_batch(scenario_assumptions, raw_dir, tmp_path / 'batch')
+
+    assert failed == {}
+
+    # The scenario itself and a member of its price ensemble.
+    assert scenario_assumptions['price_member'].notna().any()
+
+    for _, row in scenario_assumptions.iterrows():
+        destination = str(tmp_path / 'single' / row['scenario'])
+
+        preprocessing.preprocess(row, raw_dir, destination)
+
+        sequences_dir = os.path.join(destination, 'data', 'sequences')
+        batch_sequences_dir = os.path.join(destinations[row['scenario']], 'data', 'sequences')
+
+        files = sorted(os.listdir(sequences_dir))
+
+        assert files == sorted(os.listdir(batch_sequences_dir))
+
+        _, mismatch, errors = filecmp.cmpfiles(
+            sequences_dir, batch_sequences_dir, files, shallow=False
+        )
+
+        assert mismatch == errors == []
@@ -0,0 +1,36 @@
+import os
+
+from oemof import outputlib
+from oemof.solph import EnergySystem
+from oemof.tabular.facades import TYPEMAP
+
+import preprocessing
+from tools.sequences import from_datapackage
+
+
+def get_sequences(es):
+    params = outputlib.processing.convert_keys_to_strings(
+        outputlib.processing.parameter_as_dict(es)
+    )
+
+    return {k: v['sequences'] for k, v in params.items() if not v['sequences'].empty}
+
+
+def test_binary_sequences_give_same_model(scenario_assumptions, raw_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(preprocessing, 'get_sequence_format', lambda: 'npz')
+
+    destination = str(tmp_path / 'SQ')
+
+    assert preprocessing.preprocess_batch(
+        scenario_assumptions.iloc[:1], raw_dir, {'SQ': destination}
+    ) == {}
+
+    path = os.path.join(destination, 'datapackage.json')
+
+    binary = get_sequences(from_datapackage(path, attributemap={}, typemap=TYPEMAP))
+    csv = get_sequences(EnergySystem.from_datapackage(path, attributemap={}, typemap=TYPEMAP))
+
+    assert binary.keys() == csv.keys()
+
+    for k in csv:
+        assert binary[k].equals(csv[k]), k